@@ -0,0 +1,139 @@
+"""
+Línea de tiempo del ecualizador y generación de fotogramas para APNG/GIF animados
+"""
+import os
+import logging
+from typing import List, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Duración del bucle animado y fotogramas por segundo
+ANIMATION_SECONDS = float(os.getenv('ANIMATION_SECONDS', 2.4))
+ANIMATION_FPS = int(os.getenv('ANIMATION_FPS', 12))
+
+# Opacidad de las barras en su mínimo y máximo (igual que el SVG)
+OPACITY_LOW = 0.35
+OPACITY_HIGH = 0.95
+
+
+def equalizer_bar_params(index: int) -> Tuple[int, int, float, float]:
+    """
+    Parámetros de animación de una barra del ecualizador (compartidos por SVG y PNG)
+
+    Returns:
+        Tupla (altura mínima, altura máxima, duración en s, retardo en s)
+    """
+    if index % 7 == 0:  # Barras principales
+        low, high = 3, 15
+    elif index % 5 == 0:  # Barras secundarias
+        low, high = 2, 12
+    elif index % 3 == 0:  # Barras medias
+        low, high = 4, 22
+    else:  # Barras normales
+        low, high = 2, 10
+    # Timing más lento (mitad de velocidad): entre 1.6s y 2.8s
+    duration = 1.6 + (index % 4) * 0.4
+    delay = (index * 0.05) % 1.0  # Desfase progresivo
+    return low, high, duration, delay
+
+
+class EqualizerTimeline:
+    """
+    Alturas y opacidades de cada barra a lo largo de un bucle corto.
+
+    En el SVG cada barra recorre tres ciclos mín-máx-mín por `duration`; el bucle
+    completo de todas las barras juntas duraría minutos. Aquí cada barra ajusta
+    su periodo al número entero de ciclos más cercano dentro de `loop_seconds`,
+    de forma que el bucle cierra sin saltos, y el retardo pasa a ser una fase.
+    """
+
+    def __init__(self, bar_count: int, loop_seconds: float = ANIMATION_SECONDS, fps: int = ANIMATION_FPS):
+        self.bar_count = bar_count
+        self.loop_seconds = loop_seconds
+        self.fps = fps
+        self.frame_count = max(1, round(loop_seconds * fps))
+        self.bars = []
+        for i in range(bar_count):
+            low, high, duration, delay = equalizer_bar_params(i)
+            cycles = max(1, round(loop_seconds / (duration / 3)))
+            self.bars.append((low, high, cycles, delay / (duration / 3)))
+
+    @property
+    def frame_duration_ms(self) -> int:
+        """Duración de cada fotograma en milisegundos"""
+        return round(1000 * self.loop_seconds / self.frame_count)
+
+    @property
+    def max_height(self) -> int:
+        """Altura máxima que alcanza cualquier barra"""
+        return max((high for _, high, _, _ in self.bars), default=0)
+
+    def frame(self, frame_index: int) -> List[Tuple[int, float]]:
+        """
+        Estado de las barras en un fotograma
+
+        Returns:
+            Lista de (altura en píxeles, opacidad 0-1) por barra
+        """
+        t = frame_index / self.frame_count
+        state = []
+        for low, high, cycles, phase in self.bars:
+            p = (t * cycles - phase) % 1.0
+            level = 1.0 - abs(2.0 * p - 1.0)  # Onda triangular: 0 -> 1 -> 0
+            state.append((round(low + (high - low) * level),
+                          OPACITY_LOW + (OPACITY_HIGH - OPACITY_LOW) * level))
+        return state
+
+
+def render_equalizer_frames(base, fill, origin: Tuple[int, int], bar_width: int, bar_spacing: int,
+                            timeline: EqualizerTimeline, scale: int = 1) -> list:
+    """
+    Compone los fotogramas del ecualizador sobre una capa base ya renderizada
+
+    La capa base (carátula y texto) se compone una sola vez; por fotograma solo se
+    genera la máscara de las barras, con operaciones de imagen completas en C
+    (sin recorrer píxeles desde Python).
+
+    Args:
+        base: Imagen RGBA sin barras
+        fill: Imagen RGBA del área de barras (fondo blur de la carátula o color del tema)
+        origin: Esquina superior izquierda del área de barras en la base
+        bar_width: Ancho de cada barra
+        bar_spacing: Separación entre barras
+        timeline: Línea de tiempo del ecualizador
+        scale: Factor HiDPI de la base (alturas de la línea de tiempo en unidades lógicas)
+
+    Returns:
+        Lista de fotogramas RGBA
+    """
+    from PIL import Image, ImageChops
+
+    width, height = fill.size
+    step = bar_width + bar_spacing
+
+    # Rampa fija: cada fila vale su distancia a la base (0 en la fila inferior)
+    ramp = Image.frombytes('L', (1, height), bytes(range(height - 1, -1, -1))).resize((width, height), Image.Resampling.NEAREST)
+    binarize = [0] + [255] * 255
+
+    frames = []
+    for index in range(timeline.frame_count):
+        heights = bytearray(width)
+        alphas = bytearray(width)
+        for i, (bar_height, opacity) in enumerate(timeline.frame(index)):
+            x = i * step
+            if x >= width:
+                break
+            end = min(x + bar_width, width)
+            heights[x:end] = bytes([min(bar_height * scale, 255)]) * (end - x)
+            alphas[x:end] = bytes([round(255 * opacity)]) * (end - x)
+
+        # Una fila por canal, estirada a la altura del área: máscara = (altura > rampa) * opacidad
+        column_heights = Image.frombytes('L', (width, 1), bytes(heights)).resize((width, height), Image.Resampling.NEAREST)
+        column_alphas = Image.frombytes('L', (width, 1), bytes(alphas)).resize((width, height), Image.Resampling.NEAREST)
+        inside = ImageChops.subtract(column_heights, ramp).point(binarize)
+        mask = ImageChops.multiply(inside, column_alphas)
+
+        frame = base.copy()
+        frame.paste(fill, origin, mask)
+        frames.append(frame)
+    return frames
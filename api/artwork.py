@@ -0,0 +1,411 @@
+"""
+Descarga de carátulas y preparación de sus versiones embebidas en SVG
+"""
+import io
+import os
+import time
+import base64
+import logging
+import threading
+from typing import Optional, Dict, Any
+from urllib.parse import urlsplit, urlunsplit, parse_qs, urlencode
+from api.cache import LRUCache
+from api.metrics import stage, record_cache
+from api.diagnostics import register_cache
+from api import disk_cache
+from api import cache_backends
+
+logger = logging.getLogger(__name__)
+
+# Pedir a PMS la carátula ya reducida (/photo/:/transcode) en vez del original
+PLEX_PHOTO_TRANSCODE = os.getenv('PLEX_PHOTO_TRANSCODE', 'true').lower() == 'true'
+# Segundos que se descarga el original tras un fallo del transcodificador antes de reintentarlo
+TRANSCODE_RETRY_SECONDS = int(os.getenv('TRANSCODE_RETRY_SECONDS', 300))
+
+# Carátulas decodificadas una sola vez a la mayor resolución que se dibuja
+# (120px a 3x); cada escala y el fondo de las barras se derivan de esta copia.
+# Es también el tamaño que se pide al transcodificador de Plex
+ARTWORK_DECODE_SIZE = int(os.getenv('ARTWORK_FETCH_SIZE', 360))
+
+# Tamaño máximo de una carátula descargada (el original de un póster ronda unos cientos de KB)
+ARTWORK_MAX_BYTES = int(os.getenv('ARTWORK_MAX_BYTES', 8 * 1024 * 1024))
+
+# Carátulas (bytes) por URL: evita descargar la misma imagen
+# una vez para el thumbnail y otra para extraer colores
+ARTWORK_CACHE_TTL = int(os.getenv('ARTWORK_CACHE_TTL', 3600))
+_artwork_cache = LRUCache(
+    max_entries=int(os.getenv('ARTWORK_CACHE_SIZE', 64)),
+    ttl=ARTWORK_CACHE_TTL,
+)
+
+# Data URIs ya codificados por (url, píxeles, formato, calidad)
+_embed_cache = LRUCache(max_entries=int(os.getenv('ARTWORK_CACHE_SIZE', 64)) * 2)
+
+_decoded_cache = LRUCache(max_entries=int(os.getenv('ARTWORK_CACHE_SIZE', 64)))
+
+register_cache('artwork', _artwork_cache)
+register_cache('artwork_embed', _embed_cache)
+register_cache('artwork_decoded', _decoded_cache)
+
+
+# Bytes transferidos y tiempo de decodificación (por proceso)
+_stats = {'downloads': 0, 'transcoded': 0, 'fallbacks': 0, 'bytes': 0, 'decodes': 0, 'decode_seconds': 0.0}
+_stats_lock = threading.Lock()
+
+# Servidores cuyo transcodificador falló -> instante (time.monotonic()) a partir del cual se reintenta
+_transcode_unavailable: Dict[str, float] = {}
+
+
+def _count(**increments) -> None:
+    """Acumula contadores de carátulas"""
+    with _stats_lock:
+        for name, value in increments.items():
+            _stats[name] += value
+
+
+def transcode_url(url: str, size: int = ARTWORK_DECODE_SIZE) -> Optional[str]:
+    """
+    Construye la URL del transcodificador de fotos de PMS para una carátula
+
+    Args:
+        url: URL original de la carátula (ruta /library/... del servidor con su token)
+        size: Lado máximo en píxeles que debe devolver el servidor
+
+    Returns:
+        URL de /photo/:/transcode o None si la URL no es de una carátula de PMS
+    """
+    parts = urlsplit(url)
+    if not parts.scheme or not parts.path.startswith('/library/'):
+        return None
+    params = {'width': size, 'height': size, 'minSize': 1, 'upscale': 1, 'url': parts.path}
+    token = parse_qs(parts.query).get('X-Plex-Token')
+    if token:
+        params['X-Plex-Token'] = token[0]
+    return urlunsplit((parts.scheme, parts.netloc, '/photo/:/transcode', urlencode(params), ''))
+
+
+def _check_image(data: bytes) -> bytes:
+    """Acepta solo imágenes (por su firma): otro contenido no se cachea ni se sirve"""
+    if sniff_mimetype(data) not in IMAGE_MIMETYPES:
+        raise ValueError(f"La respuesta no es una imagen ({len(data)} bytes)")
+    return data
+
+
+def _too_large(size: int) -> ValueError:
+    return ValueError(f"Carátula de más de {ARTWORK_MAX_BYTES} bytes ({size})")
+
+
+def _download(url: str, timeout: int) -> bytes:
+    """Descarga una URL de hasta ARTWORK_MAX_BYTES y devuelve su cuerpo (lanza excepción si falla)"""
+    import requests
+    with stage('artwork_download'):
+        with requests.get(url, timeout=timeout, stream=True) as response:
+            response.raise_for_status()
+            length = int(response.headers.get('Content-Length') or 0)
+            if length > ARTWORK_MAX_BYTES:
+                raise _too_large(length)
+            data = bytearray()
+            for chunk in response.iter_content(64 * 1024):
+                data += chunk
+                if len(data) > ARTWORK_MAX_BYTES:
+                    raise _too_large(len(data))
+    return _check_image(bytes(data))
+
+
+def _transcode_candidate(url: str) -> Optional[str]:
+    """URL transcodificada a intentar primero, o None si no procede"""
+    transcoded = transcode_url(url) if PLEX_PHOTO_TRANSCODE else None
+    if transcoded and _transcode_unavailable.get(urlsplit(url).netloc, 0) <= time.monotonic():
+        return transcoded
+    return None
+
+
+def _transcode_failed(url: str, error: Exception) -> None:
+    """Recuerda durante TRANSCODE_RETRY_SECONDS que el transcodificador del servidor no responde"""
+    logger.warning("Transcodificador de Plex no disponible, se usa el original durante %d s: %s",
+                   TRANSCODE_RETRY_SECONDS, error)
+    _transcode_unavailable[urlsplit(url).netloc] = time.monotonic() + TRANSCODE_RETRY_SECONDS
+    _count(fallbacks=1)
+
+
+def _store_download(url: str, data: bytes, transcoded: bool, shared: bool = True) -> bytes:
+    """
+    Contabiliza una descarga correcta y la guarda en cache
+
+    Args:
+        shared: Guardarla también en el backend de cache y en disco (False: se hace aparte con _share_artwork)
+    """
+    if transcoded:
+        _count(downloads=1, transcoded=1, bytes=len(data))
+        logger.debug("Carátula transcodificada por Plex: %d bytes", len(data))
+    else:
+        _count(downloads=1, bytes=len(data))
+        logger.debug("Carátula original descargada: %d bytes", len(data))
+    _artwork_cache.set(url, data)
+    if shared:
+        _share_artwork(url, data)
+    return data
+
+
+def _share_artwork(url: str, data: bytes) -> None:
+    """Guarda la carátula en el backend de cache y en el almacén persistente (hace E/S)"""
+    cache_backends.save('artwork', url, data, ttl=ARTWORK_CACHE_TTL)
+    disk_cache.save('artwork', url, data)
+
+
+def _load_shared_artwork(url: str) -> Optional[bytes]:
+    """Carátula del backend de cache o del almacén persistente (hace E/S)"""
+    entry = cache_backends.load('artwork', url)
+    data = entry[1] if entry else disk_cache.load('artwork', url)
+    if data is not None:
+        _artwork_cache.set(url, data)
+    return data
+
+
+def _cached_artwork(url: str, shared: bool = True) -> Optional[bytes]:
+    """Carátula de la cache en memoria o, en su defecto (si shared), del backend de cache o del almacén persistente"""
+    data = _artwork_cache.get(url)
+    record_cache('artwork', 'miss' if data is None else 'hit')
+    if data is None and shared:
+        data = _load_shared_artwork(url)
+    return data
+
+
+def fetch_artwork(url: str, timeout: int = 5) -> Optional[bytes]:
+    """
+    Descarga una carátula (o la devuelve de cache)
+
+    Primero se pide a PMS la imagen ya reducida a ARTWORK_DECODE_SIZE; si el
+    transcodificador no está disponible se descarga el original.
+
+    Args:
+        url: URL de la imagen en Plex
+        timeout: Timeout de la descarga en segundos
+
+    Returns:
+        Bytes de la imagen o None si no se pudo descargar
+    """
+    data = _cached_artwork(url)
+    if data is not None:
+        return data
+
+    transcoded = _transcode_candidate(url)
+    if transcoded:
+        try:
+            return _store_download(url, _download(transcoded, timeout), transcoded=True)
+        except Exception as e:
+            _transcode_failed(url, e)
+    try:
+        return _store_download(url, _download(url, timeout), transcoded=False)
+    except Exception as e:
+        logger.warning("Error descargando carátula: %s", e)
+        return None
+
+
+async def fetch_artwork_async(url: str, client, timeout: int = 5) -> Optional[bytes]:
+    """
+    Igual que fetch_artwork pero con un cliente httpx.AsyncClient (punto de entrada ASGI)
+
+    Comparte cache, contadores y servidores sin transcodificador con la versión síncrona.
+    El backend de cache y el disco se consultan en un hilo para no bloquear el bucle.
+    """
+    import asyncio
+    data = _cached_artwork(url, shared=False)
+    if data is None:
+        data = await asyncio.to_thread(_load_shared_artwork, url)
+    if data is not None:
+        return data
+
+    async def download(target: str) -> bytes:
+        with stage('artwork_download'):
+            async with client.stream('GET', target, timeout=timeout) as response:
+                response.raise_for_status()
+                length = int(response.headers.get('Content-Length') or 0)
+                if length > ARTWORK_MAX_BYTES:
+                    raise _too_large(length)
+                data = bytearray()
+                async for chunk in response.aiter_bytes():
+                    data += chunk
+                    if len(data) > ARTWORK_MAX_BYTES:
+                        raise _too_large(len(data))
+        return _check_image(bytes(data))
+
+    transcoded = _transcode_candidate(url)
+    if transcoded:
+        try:
+            data = _store_download(url, await download(transcoded), transcoded=True, shared=False)
+        except Exception as e:
+            _transcode_failed(url, e)
+    if data is None:
+        try:
+            data = _store_download(url, await download(url), transcoded=False, shared=False)
+        except Exception as e:
+            logger.warning("Error descargando carátula: %s", e)
+            return None
+    await asyncio.to_thread(_share_artwork, url, data)
+    return data
+
+
+# Tipos que devuelve sniff_mimetype para una imagen reconocida
+IMAGE_MIMETYPES = ('image/jpeg', 'image/png', 'image/webp', 'image/gif')
+
+
+def sniff_mimetype(data: bytes) -> str:
+    """Tipo MIME de una imagen por su firma (JPEG, PNG, WebP o GIF)"""
+    if data.startswith(b'\xff\xd8'):
+        return 'image/jpeg'
+    if data.startswith(b'\x89PNG'):
+        return 'image/png'
+    if data[:4] == b'RIFF' and data[8:12] == b'WEBP':
+        return 'image/webp'
+    if data.startswith(b'GIF8'):
+        return 'image/gif'
+    return 'application/octet-stream'
+
+
+def decode_artwork(data: bytes, size: int):
+    """
+    Decodifica una carátula reduciéndola a un lado máximo de `size` píxeles
+
+    Con JPEG se usa el modo draft: el decodificador escala por 1/2, 1/4 o 1/8
+    mientras decodifica, sin llegar a construir la imagen a tamaño completo.
+
+    Returns:
+        Imagen PIL ya cargada
+    """
+    from PIL import Image
+
+    start = time.perf_counter()
+    image = Image.open(io.BytesIO(data))
+    original_size = image.size
+    if image.format == 'JPEG':
+        image.draft('RGB', (size, size))
+    image.thumbnail((size, size), Image.Resampling.LANCZOS)
+    image.load()
+    elapsed = time.perf_counter() - start
+    _count(decodes=1, decode_seconds=elapsed)
+    logger.debug("Carátula decodificada %s -> %s en %.1f ms", original_size, image.size, elapsed * 1000)
+    return image
+
+
+def artwork_stats() -> Dict[str, Any]:
+    """Bytes transferidos y tiempos de decodificación de carátulas en este proceso"""
+    with _stats_lock:
+        stats = dict(_stats)
+    decodes = stats.pop('decodes')
+    decode_seconds = stats.pop('decode_seconds')
+    stats['decodes'] = decodes
+    stats['decode_ms_avg'] = round(1000 * decode_seconds / decodes, 2) if decodes else 0.0
+    stats['cached'] = len(_artwork_cache)
+    return stats
+
+
+def put_artwork(url: str, data: bytes) -> None:
+    """Registra en cache los bytes de una carátula obtenida por otra vía"""
+    if _artwork_cache.get(url) != data:
+        # La versión decodificada corresponde a otros bytes
+        _decoded_cache.discard(url)
+    _artwork_cache.set(url, data)
+
+
+def get_decoded_artwork(url: str):
+    """
+    Devuelve la carátula decodificada y reducida a ARTWORK_DECODE_SIZE (compartida)
+
+    La imagen devuelta se comparte entre renders: no debe modificarse en sitio.
+
+    Returns:
+        Imagen PIL o None si no se pudo obtener
+    """
+    image = _decoded_cache.get(url)
+    if image is not None:
+        return image
+
+    data = fetch_artwork(url)
+    if data is None:
+        return None
+    try:
+        image = decode_artwork(data, ARTWORK_DECODE_SIZE)
+    except Exception as e:
+        logger.warning("Error decodificando carátula: %s", e)
+        return None
+    _decoded_cache.set(url, image)
+    return image
+
+
+def has_transparency(image) -> bool:
+    """Indica si la imagen tiene algún píxel (semi)transparente"""
+    if image.mode == 'P':
+        if 'transparency' not in image.info:
+            return False
+        image = image.convert('RGBA')
+    if image.mode in ('RGBA', 'LA', 'PA'):
+        alpha_min, _ = image.getchannel('A').getextrema()
+        return alpha_min < 255
+    return False
+
+
+def encode_artwork_data_uri(data: bytes, size: int, fmt: str = 'jpeg', quality: int = 80) -> str:
+    """
+    Redimensiona una carátula al tamaño de visualización y la codifica como data URI
+
+    Args:
+        data: Bytes de la imagen original
+        size: Lado máximo en píxeles (la imagen conserva su proporción)
+        fmt: Formato con pérdida a usar ('jpeg' o 'webp'); 'png' fuerza PNG
+        quality: Calidad del formato con pérdida (1-95)
+
+    Returns:
+        Data URI listo para el atributo href de <image>
+    """
+    # Sin relleno: <image> centra la imagen con preserveAspectRatio por defecto
+    image = decode_artwork(data, size)
+
+    # PNG solo cuando hay transparencia real (o si se pide explícitamente)
+    if fmt == 'png' or has_transparency(image):
+        if image.mode not in ('RGBA', 'LA'):
+            image = image.convert('RGBA')
+        fmt, mimetype, options = 'PNG', 'image/png', {'optimize': True}
+    elif fmt == 'webp':
+        image = image.convert('RGB')
+        fmt, mimetype, options = 'WEBP', 'image/webp', {'quality': quality, 'method': 4}
+    else:
+        image = image.convert('RGB')
+        fmt, mimetype, options = 'JPEG', 'image/jpeg', {'quality': quality, 'optimize': True}
+
+    buffer = io.BytesIO()
+    image.save(buffer, format=fmt, **options)
+    return f"data:{mimetype};base64,{base64.b64encode(buffer.getvalue()).decode('ascii')}"
+
+
+def get_embedded_artwork(url: str, size: int, fmt: str = 'jpeg', quality: int = 80) -> str:
+    """
+    Devuelve la carátula de la URL como data URI, reutilizando la variante cacheada
+
+    Returns:
+        Data URI o cadena vacía si no se pudo obtener la carátula
+    """
+    key = (url, size, fmt, quality)
+    data_uri = _embed_cache.get(key)
+    if data_uri is not None:
+        return data_uri
+
+    data = fetch_artwork(url)
+    if data is None:
+        return ""
+    try:
+        data_uri = encode_artwork_data_uri(data, size, fmt, quality)
+    except Exception as e:
+        logger.warning("Error procesando carátula para SVG: %s", e)
+        return ""
+    _embed_cache.set(key, data_uri)
+    logger.debug("Carátula embebida: %d bytes (%dpx, %s)", len(data_uri), size, fmt)
+    return data_uri
+
+
+def clear_artwork_caches() -> None:
+    """Vacía las caches de carátulas"""
+    _artwork_cache.clear()
+    _embed_cache.clear()
+    _decoded_cache.clear()
+    _transcode_unavailable.clear()
@@ -0,0 +1,319 @@
+"""
+Cliente asíncrono de Plex Media Server (httpx) para el punto de entrada ASGI
+
+Devuelve los mismos diccionarios de sesión que PlexClient, pero leyendo el XML de
+PMS directamente en lugar de usar PlexAPI (que es síncrono).
+"""
+import os
+import asyncio
+import logging
+import xml.etree.ElementTree as ET
+from typing import Optional, Dict, Any
+import httpx
+from api.cache import LRUCache
+from api.plex_client import select_server_uri, PLEX_TV_URL
+from api.metrics import stage, PLEX_REQUESTS
+from api.diagnostics import register_cache
+from api import disk_cache
+
+logger = logging.getLogger(__name__)
+
+# Cabeceras comunes de las peticiones a PMS y plex.tv
+PLEX_HEADERS = {'Accept': 'application/xml', 'X-Plex-Product': 'Plex2Sign'}
+
+# Clientes ya conectados por token: evita resolver el servidor en cada petición
+_clients = LRUCache(max_entries=32, ttl=int(os.getenv('PLEX_CLIENT_TTL', 600)))
+register_cache('plex_clients', _clients)
+
+
+class AsyncPlexClient:
+    """Cliente asíncrono para obtener información de reproducción actual de Plex"""
+
+    def __init__(self, token: str, http: httpx.AsyncClient, plex_url: str = None):
+        """
+        Inicializa el cliente (la conexión se establece con connect())
+
+        Args:
+            token: Token de autenticación de Plex
+            http: Cliente httpx compartido (pool de conexiones)
+            plex_url: URL opcional del servidor Plex (si no, se obtiene de plex.tv)
+        """
+        self.token = token
+        self.http = http
+        self.base_url = plex_url
+        self.server_info: Optional[Dict[str, Any]] = None
+        self._token_user: Optional[str] = None
+
+    async def _get_xml(self, url: str, endpoint: str, timeout: float = 10, **params) -> ET.Element:
+        """GET autenticado que devuelve el XML de la respuesta (lanza excepción si falla)"""
+        PLEX_REQUESTS.inc(endpoint=endpoint)
+        response = await self.http.get(url, params=params or None, timeout=timeout,
+                                       headers=dict(PLEX_HEADERS, **{'X-Plex-Token': self.token}))
+        response.raise_for_status()
+        return ET.fromstring(response.content)
+
+    async def _get_server_url(self) -> Optional[str]:
+        """Obtiene la URL del servidor Plex usando la API de Plex Account"""
+        try:
+            PLEX_REQUESTS.inc(endpoint='resources')
+            with stage('discovery'):
+                response = await self.http.get(f"{PLEX_TV_URL}/api/resources", headers=PLEX_HEADERS,
+                                               params={'X-Plex-Token': self.token}, timeout=10)
+            response.raise_for_status()
+            server_url = select_server_uri(response.content)
+            if server_url:
+                await asyncio.to_thread(disk_cache.save_json, 'servers', self.token, server_url)
+            else:
+                logger.warning("No se encontró ningún servidor Plex en la cuenta")
+            return server_url
+        except (httpx.HTTPError, ET.ParseError) as e:
+            logger.error("Error obteniendo recursos de Plex: %s", e)
+            return None
+
+    async def connect(self) -> bool:
+        """
+        Resuelve la URL del servidor (si hace falta) y comprueba la conexión
+
+        Returns:
+            True si la conexión es exitosa, False en caso contrario
+        """
+        if self.base_url:
+            return await self._check_server()
+        # URL descubierta en un arranque anterior (con almacén persistente); el disco, fuera del bucle
+        self.base_url = await asyncio.to_thread(disk_cache.load_json, 'servers', self.token)
+        if self.base_url:
+            if await self._check_server():
+                return True
+            # La URL guardada ya no responde: se vuelve a descubrir
+            await asyncio.to_thread(disk_cache.discard, 'servers', self.token)
+        self.base_url = await self._get_server_url()
+        return bool(self.base_url) and await self._check_server()
+
+    async def _check_server(self) -> bool:
+        """Comprueba la conexión con base_url y guarda la información del servidor"""
+        try:
+            root = await self._get_xml(f"{self.base_url}/", 'server')
+        except httpx.HTTPStatusError as e:
+            if e.response.status_code == 401:
+                logger.error("Token de Plex inválido o expirado")
+            else:
+                logger.error("Error conectando a Plex: %s", e)
+            return False
+        except (httpx.HTTPError, ET.ParseError) as e:
+            logger.error("Error conectando a Plex: %s", e)
+            return False
+        self.server_info = {
+            'name': root.get('friendlyName'),
+            'version': root.get('version'),
+            'platform': root.get('platform'),
+        }
+        logger.info("Conectado exitosamente a Plex Server: %s", self.server_info['name'])
+        return True
+
+    def is_connected(self) -> bool:
+        """Indica si connect() tuvo éxito"""
+        return self.server_info is not None
+
+    async def _get_token_user(self) -> Optional[str]:
+        """Obtiene (una vez) el usuario asociado al token actual"""
+        if self._token_user is None:
+            self._token_user = await asyncio.to_thread(disk_cache.load_json, 'users', self.token)
+        if self._token_user is None:
+            try:
+                root = await self._get_xml(f"{PLEX_TV_URL}/api/v2/user", 'user')
+                self._token_user = root.get('username') or ''
+                logger.info("Usuario del token: %s", self._token_user)
+                if self._token_user:
+                    await asyncio.to_thread(disk_cache.save_json, 'users', self.token, self._token_user)
+            except Exception as e:
+                logger.warning("Error obteniendo usuario del token: %s", e)
+                return None
+        return self._token_user or None
+
+    async def _target_user(self, allowed_user: Optional[str]) -> Optional[str]:
+        """Usuario pedido, el del token o PLEX_ALLOWED_USER, en ese orden"""
+        return allowed_user or await self._get_token_user() or os.getenv('PLEX_ALLOWED_USER')
+
+    def _image_url(self, path: Optional[str]) -> Optional[str]:
+        """URL absoluta y autenticada de una imagen de la biblioteca"""
+        if not path:
+            return None
+        if not path.startswith('http'):
+            path = f"{self.base_url}{path}"
+        if 'X-Plex-Token=' not in path:
+            path += f"?X-Plex-Token={self.token}"
+        return path
+
+    async def get_current_session(self, allowed_user: Optional[str] = None) -> Optional[Dict[str, Any]]:
+        """
+        Obtiene la sesión de reproducción actual
+
+        Args:
+            allowed_user: Usuario específico a buscar (opcional)
+
+        Returns:
+            Diccionario con información de la sesión actual o None si no hay reproducción
+        """
+        try:
+            with stage('sessions'):
+                root = await self._get_xml(f"{self.base_url}/status/sessions", 'sessions')
+        except Exception as e:
+            logger.error("Error obteniendo sesiones: %s", e)
+            return None
+
+        sessions = list(root)
+        if not sessions:
+            logger.debug("No hay sesiones activas")
+            return None
+
+        target_user = await self._target_user(allowed_user)
+        if target_user:
+            for session in sessions:
+                user = session.find('User')
+                if user is not None and user.get('title') == target_user:
+                    logger.debug("Sesión encontrada para usuario: %s", target_user)
+                    break
+            else:
+                logger.debug("No hay sesión activa para el usuario: %s", target_user)
+                return None
+        else:
+            # Tomar la primera sesión activa si no se puede determinar usuario
+            session = sessions[0]
+
+        return self._format_session_data(session)
+
+    def _format_session_data(self, session: ET.Element) -> Dict[str, Any]:
+        """Convierte un elemento de /status/sessions al diccionario de PlexClient"""
+        user = session.find('User')
+        player = session.find('Player')
+        session_type = session.get('type')
+        data = {
+            'title': session.get('title'),
+            'type': session_type,
+            'state': player.get('state') if player is not None else 'playing',
+            'user': user.get('title') if user is not None else 'Unknown',
+            'progress': int(session.get('viewOffset') or 0) // 1000,
+            'duration': int(session.get('duration') or 0) // 1000,
+            'thumb': self._image_url(session.get('thumb')),
+            'art': self._image_url(session.get('art')),
+            'year': int(session.get('year')) if session.get('year') else None,
+            'summary': session.get('summary'),
+        }
+
+        if session_type == 'episode':
+            data.update({
+                'show_title': session.get('grandparentTitle'),
+                'season': int(session.get('parentIndex') or 0),
+                'episode': int(session.get('index') or 0),
+                'episode_title': session.get('title'),
+            })
+            # Póster de la serie si existe, si no el del episodio
+            if session.get('grandparentThumb'):
+                data['thumb'] = self._image_url(session.get('grandparentThumb'))
+        elif session_type == 'track':
+            data.update({
+                'artist': session.get('grandparentTitle'),
+                'album': session.get('parentTitle'),
+                'track_title': session.get('title'),
+            })
+        elif session_type == 'movie':
+            data.update({
+                'movie_title': session.get('title'),
+                'director': ', '.join(d.get('tag', '') for d in session.findall('Director')),
+            })
+        return data
+
+    async def get_recent_playback_history(self, allowed_user: Optional[str] = None, limit: int = 5,
+                                          offset: int = 0) -> Optional[Dict[str, Any]]:
+        """
+        Obtiene el historial de reproducciones recientes
+
+        Args:
+            allowed_user: Usuario específico a buscar (opcional)
+            limit: Número máximo de elementos a obtener
+            offset: Desplazamiento para alternar entre canciones
+
+        Returns:
+            Diccionario con información de la reproducción elegida o None si no hay historial
+        """
+        target_user = await self._target_user(allowed_user)
+        if not target_user:
+            logger.warning("No se pudo determinar usuario para historial")
+            return None
+
+        try:
+            with stage('history'):
+                root = await self._get_xml(f"{self.base_url}/status/sessions/history/all", 'history',
+                                           sort='viewedAt:desc', **{'X-Plex-Container-Start': 0,
+                                                                    'X-Plex-Container-Size': limit * 2})
+        except Exception as e:
+            logger.error("Error obteniendo historial: %s", e)
+            return None
+
+        items = list(root)
+        if not items:
+            logger.info("No hay historial de reproducciones para %s", target_user)
+            return None
+
+        # Solo elementos de música con título válido; alternar entre ellos con offset
+        valid = [item for item in items
+                 if item.get('type') == 'track' and (item.get('title') or '').strip()
+                 and item.get('title') not in ('TBA', 'Unknown')]
+        item = valid[offset % len(valid)] if valid else items[0]
+
+        title = item.get('title') or 'Canción desconocida'
+        # Para música: portada del álbum primero, después art y thumb del elemento
+        image = self._image_url(item.get('parentThumb') or item.get('art') or item.get('thumb'))
+        return {
+            'title': title,
+            'track_title': title,
+            'type': 'track',  # Asumir música para historial
+            'state': 'stopped',  # Historial siempre está parado
+            'user': target_user,
+            'progress': 0,
+            'duration': int(item.get('duration') or 0) // 1000,
+            'thumb': image,
+            'art': image,
+            'year': int(item.get('year')) if item.get('year') else None,
+            'summary': item.get('summary'),
+            'artist': item.get('grandparentTitle') or 'Artista desconocido',
+            'album': item.get('parentTitle') or 'Álbum desconocido',
+        }
+
+    async def get_server_info(self) -> Dict[str, Any]:
+        """Obtiene información básica del servidor"""
+        if not self.is_connected():
+            return {'error': 'No conectado'}
+        try:
+            root = await self._get_xml(f"{self.base_url}/status/sessions", 'sessions')
+            return dict(self.server_info, sessions_count=int(root.get('size') or len(root)))
+        except Exception as e:
+            logger.error("Error obteniendo info del servidor: %s", e)
+            return {'error': str(e)}
+
+
+async def get_async_plex_client(http: httpx.AsyncClient, token: Optional[str] = None) -> Optional[AsyncPlexClient]:
+    """
+    Devuelve un cliente conectado para el token (reutilizado entre peticiones)
+
+    Args:
+        http: Cliente httpx compartido
+        token: Token de Plex (opcional, si no se proporciona usa PLEX_TOKEN del entorno)
+
+    Returns:
+        Cliente conectado o None si falta configuración o no se pudo conectar
+    """
+    plex_token = token or os.getenv('PLEX_TOKEN')
+    if not plex_token:
+        logger.error("Falta token de Plex (parámetro o variable de entorno PLEX_TOKEN)")
+        return None
+
+    client = _clients.get(plex_token)
+    if client is None:
+        client = AsyncPlexClient(plex_token, http, os.getenv('PLEX_URL'))
+        with stage('client'):
+            connected = await client.connect()
+        if not connected:
+            return None
+        _clients.set(plex_token, client)
+    return client
@@ -0,0 +1,168 @@
+"""
+Caches en memoria: renders con sus variantes codificadas y LRU genérica
+"""
+import time
+import json
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+from typing import Optional, Dict, Any, Hashable
+
+logger = logging.getLogger(__name__)
+
+# Campos de la sesión que afectan a lo que se dibuja
+FINGERPRINT_FIELDS = (
+    'type', 'state', 'title', 'track_title', 'artist', 'album',
+    'show_title', 'season', 'episode', 'episode_title', 'year', 'thumb',
+)
+
+
+def session_fingerprint(session_data: Optional[Dict[str, Any]]) -> str:
+    """
+    Calcula una huella estable de los datos visibles de una sesión
+
+    Args:
+        session_data: Datos de la sesión o None si no hay reproducción
+
+    Returns:
+        Hash hexadecimal corto ('idle' si no hay sesión)
+    """
+    if not session_data:
+        return 'idle'
+    visible = {field: session_data.get(field) for field in FINGERPRINT_FIELDS}
+    payload = json.dumps(visible, sort_keys=True, default=str).encode('utf-8')
+    return hashlib.sha1(payload).hexdigest()[:16]
+
+
+class RenderCache:
+    """Cache LRU con TTL que guarda cada render junto a sus variantes codificadas"""
+
+    def __init__(self, ttl: int = 60, max_entries: int = 128):
+        """
+        Inicializa la cache
+
+        Args:
+            ttl: Segundos que una entrada se considera válida
+            max_entries: Número máximo de renders en memoria
+        """
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[Hashable, Dict[str, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _get_entry(self, key: Hashable) -> Optional[Dict[str, Any]]:
+        """Devuelve la entrada si existe y no ha caducado (requiere el lock)"""
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        if time.time() - entry['created'] > self.ttl:
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return entry
+
+    def _evict(self) -> None:
+        """Descarta las entradas menos usadas si se supera el máximo (requiere el lock)"""
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def get_render(self, key: Hashable) -> Any:
+        """Devuelve el render (sin codificar) asociado a la clave"""
+        with self._lock:
+            entry = self._get_entry(key)
+            return entry['render'] if entry else None
+
+    def put_render(self, key: Hashable, render: Any) -> None:
+        """Guarda un render nuevo, descartando variantes anteriores de la clave"""
+        with self._lock:
+            self._entries[key] = {'created': time.time(), 'render': render, 'variants': {}}
+            self._entries.move_to_end(key)
+            self._evict()
+
+    def get_variant(self, key: Hashable, variant: Hashable) -> Optional[bytes]:
+        """Devuelve una variante codificada del render, si ya se generó"""
+        with self._lock:
+            entry = self._get_entry(key)
+            return entry['variants'].get(variant) if entry else None
+
+    def put_variant(self, key: Hashable, variant: Hashable, data: bytes) -> None:
+        """Guarda una variante codificada junto a su render"""
+        with self._lock:
+            entry = self._get_entry(key)
+            if entry is None:
+                entry = {'created': time.time(), 'render': None, 'variants': {}}
+                self._entries[key] = entry
+                self._evict()
+            entry['variants'][variant] = data
+
+    def clear(self) -> None:
+        """Vacía la cache"""
+        with self._lock:
+            self._entries.clear()
+
+    def values(self) -> list:
+        """Renders y variantes guardados, como pares (render, variantes)"""
+        with self._lock:
+            return [(entry['render'], dict(entry['variants'])) for entry in self._entries.values()]
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._entries)
+
+
+class LRUCache:
+    """Cache LRU genérica con TTL opcional (carátulas, paletas, etc.)"""
+
+    def __init__(self, max_entries: int = 128, ttl: Optional[int] = None):
+        """
+        Inicializa la cache
+
+        Args:
+            max_entries: Número máximo de entradas en memoria
+            ttl: Segundos que una entrada se considera válida (None = sin caducidad)
+        """
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries: "OrderedDict[Hashable, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        """Devuelve el valor de la clave si existe y no ha caducado"""
+        with self._lock:
+            item = self._entries.get(key)
+            if item is None:
+                return default
+            created, value = item
+            if self.ttl is not None and time.time() - created > self.ttl:
+                del self._entries[key]
+                return default
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key: Hashable, value: Any) -> None:
+        """Guarda un valor, descartando las entradas menos usadas si hace falta"""
+        with self._lock:
+            self._entries[key] = (time.time(), value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def discard(self, key: Hashable) -> None:
+        """Elimina la clave si existe"""
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self) -> None:
+        """Vacía la cache"""
+        with self._lock:
+            self._entries.clear()
+
+    def values(self) -> list:
+        """Valores guardados (incluidos los caducados aún no descartados)"""
+        with self._lock:
+            return [value for _, value in self._entries.values()]
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._entries)
@@ -0,0 +1,637 @@
+"""
+Backends de cache intercambiables para compartir estado entre workers y nodos
+
+Las instantáneas de sesión, las carátulas y los renders se guardan, además de en
+la memoria de cada proceso, en el backend configurado con CACHE_BACKEND:
+
+- 'memory': diccionario del proceso (un solo worker; útil en pruebas)
+- 'sqlite': base SQLite local común a los workers de la máquina (SHARED_CACHE_PATH)
+- 'redis': servidor Redis (o compatible con su protocolo) común a varios nodos
+  detrás de un balanceador (REDIS_URL)
+
+Por defecto se usa 'redis' si hay REDIS_URL, 'sqlite' si hay SHARED_CACHE_PATH
+y ninguno en otro caso. Todos los backends guardan los valores codificados con
+marshal junto al instante en que se calcularon, y ofrecen cerrojos con
+caducidad: get_or_compute() los usa para que un solo worker o nodo consulte
+Plex para un usuario mientras el resto espera su resultado.
+
+Un backend que falla nunca rompe la petición: las lecturas fallidas cuentan como
+fallo de cache y, si no se puede tomar el cerrojo, se calcula igualmente.
+"""
+import os
+import time
+import socket
+import struct
+import marshal
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+from urllib.parse import urlsplit, unquote
+from typing import Any, Awaitable, Callable, Dict, Hashable, Optional, Tuple
+from api.metrics import record_cache
+from api.diagnostics import register_cache
+
+logger = logging.getLogger(__name__)
+
+# Backend: 'memory', 'sqlite', 'redis' o 'none' (por defecto según REDIS_URL / SHARED_CACHE_PATH)
+CACHE_BACKEND = os.getenv('CACHE_BACKEND', '').lower()
+# Servidor Redis: redis://[:contraseña@]host[:puerto][/base]
+REDIS_URL = os.getenv('REDIS_URL', '')
+# Prefijo de las claves en Redis (varias instalaciones pueden compartir servidor)
+REDIS_PREFIX = os.getenv('REDIS_PREFIX', 'plex2sign')
+# Plazo de cada operación con Redis en segundos
+REDIS_TIMEOUT = float(os.getenv('REDIS_TIMEOUT', 0.5))
+# Segundos sin reintentar la conexión tras un fallo (las operaciones fallan al instante)
+REDIS_RETRY_SECONDS = float(os.getenv('REDIS_RETRY_SECONDS', 5))
+# Caducidad del cerrojo de refresco (si el nodo que lo tiene muere, otro lo toma después)
+CACHE_LOCK_TTL = float(os.getenv('CACHE_LOCK_TTL', 15))
+# Espera máxima al resultado de otro nodo antes de calcular por cuenta propia
+CACHE_LOCK_WAIT = float(os.getenv('CACHE_LOCK_WAIT', 5))
+# Intervalo entre comprobaciones mientras se espera
+CACHE_LOCK_POLL = 0.05
+
+# Liberación atómica del cerrojo: solo lo borra quien lo tomó
+RELEASE_SCRIPT = ("if redis.call('get', KEYS[1]) == ARGV[1] then "
+                  "return redis.call('del', KEYS[1]) else return 0 end")
+
+# Cabecera de los valores en memoria y en Redis: instante de cálculo
+_CREATED = struct.Struct('<d')
+
+
+def encode_entry(created: float, value: Any) -> bytes:
+    """Instante de cálculo + valor codificado con marshal (ValueError si no es serializable)"""
+    return _CREATED.pack(created) + marshal.dumps(value)
+
+
+def decode_entry(data: bytes) -> Tuple[float, Any]:
+    """Inversa de encode_entry()"""
+    (created,) = _CREATED.unpack_from(data)
+    return created, marshal.loads(data[_CREATED.size:])
+
+
+class CacheBackend:
+    """
+    Interfaz común de los backends
+
+    Las subclases implementan _get, _set, _delete, _acquire, _release, _clear y
+    _report; esta clase añade la codificación, los contadores, las métricas y el
+    tratamiento de errores (un backend caído se comporta como una cache vacía).
+    """
+
+    name = 'backend'
+    # Las operaciones hacen E/S (socket, fichero): desde asyncio se ejecutan en un hilo
+    blocking = True
+
+    def __init__(self):
+        self._stats_lock = threading.Lock()
+        self._stats = {'hits': 0, 'misses': 0, 'writes': 0, 'errors': 0,
+                       'locks_acquired': 0, 'locks_busy': 0, 'lock_waits': 0, 'lock_timeouts': 0}
+
+    def _count(self, name: str, value: int = 1) -> None:
+        with self._stats_lock:
+            self._stats[name] += value
+
+    def _error(self, action: str, error: Exception) -> None:
+        self._count('errors')
+        logger.warning("Cache %s: error al %s: %s", self.name, action, error)
+
+    @staticmethod
+    def digest(key: Hashable) -> str:
+        """Hash de la clave (se usa su repr): los tokens no se guardan en claro"""
+        return hashlib.sha256(repr(key).encode('utf-8')).hexdigest()
+
+    def get(self, namespace: str, key: Hashable) -> Optional[Tuple[float, Any]]:
+        """
+        Devuelve la entrada de la clave si no ha caducado
+
+        Args:
+            namespace: Espacio ('sessions', 'artwork', 'renders'...)
+            key: Clave
+
+        Returns:
+            Tupla (instante en que se calculó, valor) o None
+        """
+        try:
+            data = self._get(namespace, self.digest(key))
+            entry = decode_entry(data) if data is not None else None
+        except Exception as e:
+            self._error('leer', e)
+            entry = None
+        self._count('misses' if entry is None else 'hits')
+        record_cache(f'{self.name}_{namespace}', 'miss' if entry is None else 'hit')
+        return entry
+
+    def set(self, namespace: str, key: Hashable, value: Any, ttl: float, created: Optional[float] = None) -> None:
+        """
+        Guarda el valor de la clave
+
+        Args:
+            namespace: Espacio ('sessions', 'artwork', 'renders'...)
+            key: Clave
+            value: Valor serializable con marshal (dicts, listas, str, bytes, números, None)
+            ttl: Segundos de vigencia desde created
+            created: Instante en que se calculó el valor (por defecto, ahora)
+        """
+        created = time.time() if created is None else created
+        try:
+            data = encode_entry(created, value)
+        except ValueError as e:
+            logger.debug("Cache %s: valor no serializable en %s: %s", self.name, namespace, e)
+            return
+        try:
+            self._set(namespace, self.digest(key), data, created + ttl)
+        except Exception as e:
+            self._error('escribir', e)
+            return
+        self._count('writes')
+
+    def delete(self, namespace: str, key: Hashable) -> None:
+        """Elimina la entrada de la clave si existe"""
+        try:
+            self._delete(namespace, self.digest(key))
+        except Exception as e:
+            self._error('borrar', e)
+
+    def acquire(self, name: str, ttl: float = CACHE_LOCK_TTL) -> Optional[str]:
+        """
+        Intenta tomar el cerrojo sin esperar
+
+        Returns:
+            Identificador para release() o None si otro lo tiene. Si el backend
+            falla se devuelve un identificador igualmente: mejor calcular dos
+            veces que dejar la petición esperando a nadie
+        """
+        token = os.urandom(16).hex()
+        try:
+            acquired = self._acquire(name, token, time.time() + ttl)
+        except Exception as e:
+            self._error('tomar cerrojo', e)
+            return token
+        self._count('locks_acquired' if acquired else 'locks_busy')
+        return token if acquired else None
+
+    def release(self, name: str, token: str) -> None:
+        """Libera el cerrojo si sigue siendo de quien lo tomó"""
+        try:
+            self._release(name, token)
+        except Exception as e:
+            self._error('liberar cerrojo', e)
+
+    def clear(self) -> None:
+        """Vacía todas las entradas del backend"""
+        try:
+            self._clear()
+        except Exception as e:
+            self._error('vaciar', e)
+
+    def stats(self) -> Dict[str, Any]:
+        """Informe para /api/debug/caches: contadores de este proceso y estado del backend"""
+        with self._stats_lock:
+            report = dict(self._stats, backend=self.name)
+        try:
+            report.update(self._report())
+        except Exception as e:
+            report['error'] = str(e)
+        return report
+
+    def _get(self, namespace: str, digest: str) -> Optional[bytes]:
+        raise NotImplementedError
+
+    def _set(self, namespace: str, digest: str, data: bytes, expires: float) -> None:
+        raise NotImplementedError
+
+    def _delete(self, namespace: str, digest: str) -> None:
+        raise NotImplementedError
+
+    def _acquire(self, name: str, token: str, expires: float) -> bool:
+        raise NotImplementedError
+
+    def _release(self, name: str, token: str) -> None:
+        raise NotImplementedError
+
+    def _clear(self) -> None:
+        raise NotImplementedError
+
+    def _report(self) -> Dict[str, Any]:
+        return {}
+
+
+class MemoryBackend(CacheBackend):
+    """Backend en la memoria del proceso (LRU por número de entradas)"""
+
+    name = 'memory'
+    blocking = False
+
+    def __init__(self, max_entries: int = 1024):
+        """
+        Args:
+            max_entries: Número máximo de entradas (se descartan las menos usadas)
+        """
+        super().__init__()
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[Tuple[str, str], Tuple[bytes, float]]" = OrderedDict()
+        self._locks: Dict[str, Tuple[str, float]] = {}
+        self._lock = threading.Lock()
+
+    def _get(self, namespace: str, digest: str) -> Optional[bytes]:
+        with self._lock:
+            entry = self._entries.get((namespace, digest))
+            if entry is None:
+                return None
+            if entry[1] <= time.time():
+                del self._entries[(namespace, digest)]
+                return None
+            self._entries.move_to_end((namespace, digest))
+            return entry[0]
+
+    def _set(self, namespace: str, digest: str, data: bytes, expires: float) -> None:
+        with self._lock:
+            self._entries[(namespace, digest)] = (data, expires)
+            self._entries.move_to_end((namespace, digest))
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def _delete(self, namespace: str, digest: str) -> None:
+        with self._lock:
+            self._entries.pop((namespace, digest), None)
+
+    def _acquire(self, name: str, token: str, expires: float) -> bool:
+        with self._lock:
+            holder = self._locks.get(name)
+            if holder is not None and holder[1] > time.time():
+                return False
+            self._locks[name] = (token, expires)
+            return True
+
+    def _release(self, name: str, token: str) -> None:
+        with self._lock:
+            holder = self._locks.get(name)
+            if holder is not None and holder[0] == token:
+                del self._locks[name]
+
+    def _clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def _report(self) -> Dict[str, Any]:
+        with self._lock:
+            return {'entries': len(self._entries), 'max_entries': self.max_entries,
+                    'bytes': sum(len(data) for data, _ in self._entries.values()), 'locks': len(self._locks)}
+
+
+class RespError(Exception):
+    """Error devuelto por el servidor Redis o conexión no disponible"""
+
+
+class RespClient:
+    """
+    Cliente mínimo del protocolo de Redis (RESP2) sobre sockets bloqueantes
+
+    Una conexión por hilo (y por proceso, tras un fork). Tras un fallo de
+    conexión no se reintenta durante REDIS_RETRY_SECONDS: las operaciones fallan
+    al instante en lugar de esperar el plazo en cada petición.
+    """
+
+    def __init__(self, url: str, timeout: float = REDIS_TIMEOUT, retry_seconds: float = REDIS_RETRY_SECONDS):
+        """
+        Args:
+            url: redis://[:contraseña@]host[:puerto][/base]
+            timeout: Plazo de conexión y de cada respuesta en segundos
+            retry_seconds: Pausa tras un fallo de conexión
+        """
+        parts = urlsplit(url)
+        if parts.scheme != 'redis':
+            raise ValueError(f"URL de Redis no soportada: {url}")
+        self.host = parts.hostname or '127.0.0.1'
+        self.port = parts.port or 6379
+        self.password = unquote(parts.password) if parts.password else None
+        self.db = int(parts.path.lstrip('/') or 0)
+        self.timeout = timeout
+        self.retry_seconds = retry_seconds
+        self._local = threading.local()
+        self._down_until = 0.0
+
+    @property
+    def address(self) -> str:
+        """host:puerto/base (sin contraseña, para informes)"""
+        return f"{self.host}:{self.port}/{self.db}"
+
+    def _connect(self):
+        sock = socket.create_connection((self.host, self.port), timeout=self.timeout)
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        conn = (sock, sock.makefile('rb'))
+        try:
+            if self.password:
+                self._call(conn, 'AUTH', self.password)
+            if self.db:
+                self._call(conn, 'SELECT', self.db)
+        except RespError:
+            sock.close()
+            raise
+        self._local.conn, self._local.pid = conn, os.getpid()
+        return conn
+
+    def _close(self) -> None:
+        conn = getattr(self._local, 'conn', None)
+        self._local.conn = None
+        if conn is not None:
+            for resource in reversed(conn):
+                try:
+                    resource.close()
+                except OSError:
+                    pass
+
+    @staticmethod
+    def _encode(args) -> bytes:
+        out = [b'*%d\r\n' % len(args)]
+        for arg in args:
+            if isinstance(arg, str):
+                arg = arg.encode('utf-8')
+            elif not isinstance(arg, bytes):
+                arg = str(arg).encode('ascii')
+            out.append(b'$%d\r\n%s\r\n' % (len(arg), arg))
+        return b''.join(out)
+
+    def _read(self, reader) -> Any:
+        line = reader.readline()
+        if not line.endswith(b'\r\n'):
+            raise ConnectionError("Conexión cerrada por el servidor Redis")
+        kind, payload = line[:1], line[1:-2]
+        if kind == b'+':
+            return payload.decode('utf-8')
+        if kind == b'-':
+            raise RespError(payload.decode('utf-8', 'replace'))
+        if kind == b':':
+            return int(payload)
+        if kind == b'$':
+            length = int(payload)
+            if length < 0:
+                return None
+            data = reader.read(length + 2)
+            if len(data) != length + 2:
+                raise ConnectionError("Respuesta de Redis incompleta")
+            return data[:-2]
+        if kind == b'*':
+            length = int(payload)
+            return None if length < 0 else [self._read(reader) for _ in range(length)]
+        raise ConnectionError(f"Respuesta de Redis no válida: {line[:32]!r}")
+
+    def _call(self, conn, *args) -> Any:
+        sock, reader = conn
+        sock.sendall(self._encode(args))
+        return self._read(reader)
+
+    def execute(self, *args) -> Any:
+        """
+        Envía un comando y devuelve la respuesta (str, int, bytes, lista o None)
+
+        Raises:
+            RespError: Error del servidor o servidor no disponible
+        """
+        if time.monotonic() < self._down_until:
+            raise RespError(f"Redis no disponible ({self.address})")
+        try:
+            conn = getattr(self._local, 'conn', None)
+            if conn is None or self._local.pid != os.getpid():
+                conn = self._connect()
+            return self._call(conn, *args)
+        except RespError:
+            raise
+        except (OSError, ValueError) as e:
+            # Conexión rota o protocolo desincronizado: se descarta y se pausa
+            self._close()
+            self._down_until = time.monotonic() + self.retry_seconds
+            raise RespError(f"Redis no disponible ({self.address}): {e}") from e
+
+
+class RedisBackend(CacheBackend):
+    """Backend en un servidor Redis compartido por varios nodos"""
+
+    name = 'redis'
+
+    def __init__(self, url: str = REDIS_URL, prefix: str = REDIS_PREFIX, client: Optional[RespClient] = None):
+        """
+        Args:
+            url: URL del servidor (redis://...)
+            prefix: Prefijo de todas las claves
+            client: Cliente ya creado (por defecto, uno nuevo para la URL)
+        """
+        super().__init__()
+        self.prefix = prefix
+        self.client = client or RespClient(url)
+
+    def _key(self, namespace: str, digest: str) -> str:
+        return f"{self.prefix}:{namespace}:{digest}"
+
+    def _lock_key(self, name: str) -> str:
+        return f"{self.prefix}:lock:{name}"
+
+    @staticmethod
+    def _milliseconds(expires: float) -> int:
+        return max(1, int((expires - time.time()) * 1000))
+
+    def _get(self, namespace: str, digest: str) -> Optional[bytes]:
+        return self.client.execute('GET', self._key(namespace, digest))
+
+    def _set(self, namespace: str, digest: str, data: bytes, expires: float) -> None:
+        self.client.execute('SET', self._key(namespace, digest), data, 'PX', self._milliseconds(expires))
+
+    def _delete(self, namespace: str, digest: str) -> None:
+        self.client.execute('DEL', self._key(namespace, digest))
+
+    def _acquire(self, name: str, token: str, expires: float) -> bool:
+        return self.client.execute('SET', self._lock_key(name), token, 'NX', 'PX', self._milliseconds(expires)) == 'OK'
+
+    def _release(self, name: str, token: str) -> None:
+        self.client.execute('EVAL', RELEASE_SCRIPT, 1, self._lock_key(name), token)
+
+    def _keys(self):
+        """Claves de esta instalación (SCAN, sin bloquear el servidor)"""
+        cursor = '0'
+        while True:
+            cursor, keys = self.client.execute('SCAN', cursor, 'MATCH', f"{self.prefix}:*", 'COUNT', 500)
+            cursor = cursor.decode('ascii') if isinstance(cursor, bytes) else str(cursor)
+            yield from keys
+            if cursor == '0':
+                return
+
+    def _clear(self) -> None:
+        keys = list(self._keys())
+        for start in range(0, len(keys), 500):
+            self.client.execute('DEL', *keys[start:start + 500])
+
+    def _report(self) -> Dict[str, Any]:
+        return {'address': self.client.address, 'prefix': self.prefix, 'entries': sum(1 for _ in self._keys())}
+
+
+def create_cache_backend(kind: str) -> Optional[CacheBackend]:
+    """
+    Crea el backend indicado con la configuración del entorno
+
+    Args:
+        kind: 'memory', 'sqlite', 'redis' o 'none'
+
+    Returns:
+        Backend o None para 'none'
+    """
+    if kind == 'memory':
+        return MemoryBackend()
+    if kind == 'sqlite':
+        from api.shared_cache import SharedCache, SHARED_CACHE_PATH
+        if not SHARED_CACHE_PATH:
+            raise ValueError("CACHE_BACKEND=sqlite requiere SHARED_CACHE_PATH")
+        return SharedCache(SHARED_CACHE_PATH)
+    if kind == 'redis':
+        if not REDIS_URL:
+            raise ValueError("CACHE_BACKEND=redis requiere REDIS_URL")
+        return RedisBackend(REDIS_URL)
+    if kind in ('', 'none'):
+        return None
+    raise ValueError(f"CACHE_BACKEND no soportado: {kind}")
+
+
+def _default_kind() -> str:
+    if CACHE_BACKEND:
+        return CACHE_BACKEND
+    if REDIS_URL:
+        return 'redis'
+    from api.shared_cache import SHARED_CACHE_PATH
+    return 'sqlite' if SHARED_CACHE_PATH else 'none'
+
+
+_backend: Optional[CacheBackend] = None
+_backend_ready = False
+_backend_lock = threading.Lock()
+
+
+def get_cache_backend() -> Optional[CacheBackend]:
+    """Backend del proceso según CACHE_BACKEND (None si no hay ninguno configurado)"""
+    global _backend, _backend_ready
+    if not _backend_ready:
+        with _backend_lock:
+            if not _backend_ready:
+                _backend = create_cache_backend(_default_kind())
+                if _backend is not None:
+                    register_cache(f'backend_{_backend.name}', _backend.stats)
+                    logger.info("Backend de cache: %s", _backend.name)
+                _backend_ready = True
+    return _backend
+
+
+def load(namespace: str, key: Hashable) -> Optional[Tuple[float, Any]]:
+    """get() del backend del proceso (None si no hay backend)"""
+    backend = get_cache_backend()
+    return backend.get(namespace, key) if backend else None
+
+
+def save(namespace: str, key: Hashable, value: Any, ttl: float) -> None:
+    """set() en el backend del proceso (no hace nada si no hay backend)"""
+    backend = get_cache_backend()
+    if backend:
+        backend.set(namespace, key, value, ttl)
+
+
+def _usable(entry: Optional[Tuple[float, Any]], max_age: Optional[float], newer_than: float = 0.0) -> bool:
+    if entry is None or entry[0] < newer_than:
+        return False
+    return max_age is None or time.time() - entry[0] <= max_age
+
+
+def get_or_compute(namespace: str, key: Hashable, compute: Callable[[], Any], ttl: float,
+                   refresh: bool = False, max_age: Optional[float] = None,
+                   backend: Optional[CacheBackend] = None) -> Any:
+    """
+    Valor compartido de la clave: el guardado por cualquier worker o nodo o, si no
+    hay, el calculado por uno solo de ellos mientras el resto espera
+
+    Args:
+        namespace: Espacio de la entrada ('sessions'...)
+        key: Clave
+        compute: Función sin argumentos que calcula el valor
+        ttl: Segundos de vigencia del valor calculado (0 o menos: no se comparte)
+        refresh: Ignorar el valor guardado (se acepta el de otro nodo si es posterior a la llamada)
+        max_age: Edad máxima aceptada del valor guardado (por defecto, su TTL)
+        backend: Backend a usar (por defecto, el del proceso; sin backend solo se llama a compute)
+
+    Returns:
+        Valor (las excepciones de compute se propagan)
+    """
+    backend = backend or get_cache_backend()
+    if backend is None or ttl <= 0:
+        return compute()
+    started = time.time()
+    if not refresh:
+        entry = backend.get(namespace, key)
+        if _usable(entry, max_age):
+            return entry[1]
+
+    lock = f"{namespace}:{backend.digest(key)}"
+    token = backend.acquire(lock)
+    if token is None:
+        # Otro worker o nodo está consultando: se espera su resultado
+        backend._count('lock_waits')
+        deadline = time.monotonic() + CACHE_LOCK_WAIT
+        while token is None and time.monotonic() < deadline:
+            time.sleep(CACHE_LOCK_POLL)
+            entry = backend.get(namespace, key)
+            if _usable(entry, max_age, newer_than=started if refresh else 0.0):
+                return entry[1]
+            # Si el dueño terminó sin guardar nada (error, valor no serializable), se calcula aquí
+            token = backend.acquire(lock)
+        if token is None:
+            backend._count('lock_timeouts')
+    try:
+        value = compute()
+        backend.set(namespace, key, value, ttl)
+        return value
+    finally:
+        if token is not None:
+            backend.release(lock, token)
+
+
+async def aget_or_compute(namespace: str, key: Hashable, compute: Callable[[], Awaitable[Any]], ttl: float,
+                          refresh: bool = False, max_age: Optional[float] = None,
+                          backend: Optional[CacheBackend] = None) -> Any:
+    """
+    Versión asyncio de get_or_compute(): compute devuelve una corrutina. Las
+    operaciones de un backend con E/S (Redis, SQLite) se ejecutan en el pool de
+    hilos del bucle, de modo que ni ellas ni la espera al cerrojo lo bloquean
+    """
+    import asyncio
+    backend = backend or get_cache_backend()
+    if backend is None or ttl <= 0:
+        return await compute()
+
+    async def call(method, *args):
+        if not backend.blocking:
+            return method(*args)
+        return await asyncio.to_thread(method, *args)
+
+    started = time.time()
+    if not refresh:
+        entry = await call(backend.get, namespace, key)
+        if _usable(entry, max_age):
+            return entry[1]
+
+    lock = f"{namespace}:{backend.digest(key)}"
+    token = await call(backend.acquire, lock)
+    if token is None:
+        backend._count('lock_waits')
+        deadline = time.monotonic() + CACHE_LOCK_WAIT
+        while token is None and time.monotonic() < deadline:
+            await asyncio.sleep(CACHE_LOCK_POLL)
+            entry = await call(backend.get, namespace, key)
+            if _usable(entry, max_age, newer_than=started if refresh else 0.0):
+                return entry[1]
+            # Si el dueño terminó sin guardar nada (error, valor no serializable), se calcula aquí
+            token = await call(backend.acquire, lock)
+        if token is None:
+            backend._count('lock_timeouts')
+    try:
+        value = await compute()
+        await call(backend.set, namespace, key, value, ttl)
+        return value
+    finally:
+        if token is not None:
+            await call(backend.release, lock, token)
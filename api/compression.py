@@ -0,0 +1,85 @@
+"""
+Compresión de respuestas (gzip / Brotli) y negociación de Content-Encoding
+"""
+import os
+import gzip
+import logging
+from typing import Optional
+
+try:
+    import brotli
+except ImportError:  # Brotli es opcional: sin él solo se ofrece gzip
+    brotli = None
+
+logger = logging.getLogger(__name__)
+
+# Niveles altos: la compresión se paga una vez por render cacheado, no por petición
+GZIP_LEVEL = int(os.getenv('GZIP_LEVEL', 9))
+BROTLI_QUALITY = int(os.getenv('BROTLI_QUALITY', 11))
+# Niveles para cuerpos que se comprimen en cada petición (JSON, estado, lotes)
+GZIP_FAST_LEVEL = int(os.getenv('GZIP_FAST_LEVEL', 6))
+BROTLI_FAST_QUALITY = int(os.getenv('BROTLI_FAST_QUALITY', 5))
+
+# Por debajo de este tamaño la compresión no compensa sus cabeceras
+MIN_COMPRESS_SIZE = int(os.getenv('MIN_COMPRESS_SIZE', 512))
+
+
+def supported_encodings() -> tuple:
+    """Codificaciones disponibles, de mayor a menor preferencia"""
+    return ('br', 'gzip') if brotli is not None else ('gzip',)
+
+
+def negotiate_encoding(accept_encoding: Optional[str], body_size: Optional[int] = None) -> Optional[str]:
+    """
+    Elige la codificación a usar según la cabecera Accept-Encoding
+
+    Args:
+        accept_encoding: Valor de la cabecera Accept-Encoding de la petición
+        body_size: Tamaño del cuerpo sin comprimir (None si se desconoce)
+
+    Returns:
+        'br', 'gzip' o None si la respuesta debe ir sin comprimir
+    """
+    if not accept_encoding:
+        return None
+    if body_size is not None and body_size < MIN_COMPRESS_SIZE:
+        return None
+
+    accepted = {}
+    for part in accept_encoding.split(','):
+        coding, _, params = part.strip().partition(';')
+        quality = 1.0
+        for param in params.split(';'):
+            name, _, value = param.strip().partition('=')
+            if name == 'q':
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        accepted[coding.strip().lower()] = quality
+
+    wildcard = accepted.get('*', 0.0)
+    for coding in supported_encodings():
+        if accepted.get(coding, wildcard) > 0:
+            return coding
+    return None
+
+
+def compress(body: bytes, encoding: str, fast: bool = False) -> bytes:
+    """
+    Comprime un cuerpo con la codificación indicada
+
+    Args:
+        body: Cuerpo sin comprimir
+        encoding: 'br' o 'gzip'
+        fast: Usar los niveles rápidos (cuerpos que no se cachean comprimidos)
+
+    Returns:
+        Cuerpo comprimido
+    """
+    if encoding == 'br':
+        return brotli.compress(body, quality=BROTLI_FAST_QUALITY if fast else BROTLI_QUALITY)
+    if encoding == 'gzip':
+        # mtime=0 para que el resultado sea estable (mismo cuerpo -> mismos bytes)
+        return gzip.compress(body, compresslevel=GZIP_FAST_LEVEL if fast else GZIP_LEVEL, mtime=0)
+    raise ValueError(f"Codificación no soportada: {encoding}")
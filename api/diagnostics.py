@@ -0,0 +1,395 @@
+"""
+Diagnóstico bajo demanda: perfil de CPU por muestreo, diferencias de memoria y tamaño de las caches
+
+Desactivado salvo que se defina DIAGNOSTICS_TOKEN; las peticiones deben llevar el
+mismo valor en la cabecera X-Diagnostics-Token (o Authorization: Bearer). Todo
+se refiere al proceso que atiende la petición: con varios workers o con el pool
+de render, cada proceso tiene sus propios datos.
+"""
+import os
+import sys
+import hmac
+import json
+import time
+import logging
+import threading
+import tracemalloc
+from collections import Counter
+from typing import Any, Dict, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Token de acceso a /api/debug/* (sin definir = endpoints desactivados)
+DIAGNOSTICS_TOKEN = os.getenv('DIAGNOSTICS_TOKEN', '')
+# Intervalo por defecto entre muestras del perfilador
+PROFILE_INTERVAL_MS = float(os.getenv('PROFILE_INTERVAL_MS', 5))
+# Duración máxima de una captura (también limita la espera en modo por peticiones)
+PROFILE_MAX_SECONDS = 120
+
+COLLAPSED_CONTENT_TYPE = 'text/plain'
+
+# Funciones en las que un hilo está esperando (E/S, locks, colas): se omiten salvo idle=1
+IDLE_FUNCTIONS = frozenset((
+    'wait', 'select', 'poll', 'accept', 'sleep', '_worker', 'serve_forever', 'readinto', 'recv_into',
+    '_recv', '_recv_bytes', '_wait_for_tstate_lock', '_run_once',
+))
+
+
+class DiagnosticsBusy(Exception):
+    """Ya hay una captura de perfil en curso"""
+
+
+def authorized(headers) -> bool:
+    """Comprueba el token de diagnóstico de la petición (siempre False si no hay token configurado)"""
+    if not DIAGNOSTICS_TOKEN:
+        return False
+    provided = headers.get('X-Diagnostics-Token') or ''
+    authorization = headers.get('Authorization') or ''
+    if not provided and authorization.startswith('Bearer '):
+        provided = authorization[len('Bearer '):]
+    return hmac.compare_digest(provided.encode('utf-8'), DIAGNOSTICS_TOKEN.encode('utf-8'))
+
+
+def _frame_label(frame) -> str:
+    code = frame.f_code
+    return f"{frame.f_globals.get('__name__', '?')}.{getattr(code, 'co_qualname', code.co_name)}"
+
+
+class SamplingProfiler:
+    """
+    Perfilador por muestreo de pila de todos los hilos del proceso
+
+    Cada `interval` segundos se leen las pilas con sys._current_frames(); el
+    resultado son pilas colapsadas ("hilo;módulo.función;... muestras"), el formato
+    que cargan speedscope, flamegraph.pl o inferno. Sin instrumentar nada: el coste
+    solo existe mientras hay una captura en curso.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._done = threading.Event()
+        self._done.set()
+        self._stacks: Counter = Counter()
+        self._requests_left: Optional[int] = None
+        self.samples = 0
+
+    @property
+    def running(self) -> bool:
+        return not self._done.is_set()
+
+    def start(self, seconds: float, requests: Optional[int] = None, interval: float = PROFILE_INTERVAL_MS / 1000,
+              idle: bool = False) -> None:
+        """
+        Empieza una captura durante `seconds` segundos o hasta que terminen `requests` peticiones
+
+        Raises:
+            DiagnosticsBusy: si ya hay una captura en curso
+        """
+        with self._lock:
+            if self.running:
+                raise DiagnosticsBusy("Ya hay un perfil en curso")
+            self._stacks = Counter()
+            self.samples = 0
+            self._requests_left = requests
+            self._done.clear()
+        thread = threading.Thread(target=self._run, args=(min(seconds, PROFILE_MAX_SECONDS), max(0.001, interval), idle),
+                                  name='diagnostics-profiler', daemon=True)
+        thread.start()
+
+    def note_request(self) -> None:
+        """Cuenta una petición terminada (modo por número de peticiones)"""
+        if self._requests_left is None:
+            return
+        with self._lock:
+            if self._requests_left is not None:
+                self._requests_left -= 1
+                if self._requests_left <= 0:
+                    self._requests_left = None
+                    self._done.set()
+
+    def wait(self, timeout: Optional[float] = None) -> bool:
+        """Espera a que termine la captura; False si vence el plazo"""
+        return self._done.wait(timeout)
+
+    def stop(self) -> None:
+        with self._lock:
+            self._requests_left = None
+            self._done.set()
+
+    def _run(self, seconds: float, interval: float, idle: bool) -> None:
+        own = threading.get_ident()
+        deadline = time.monotonic() + seconds
+        names: Dict[int, str] = {}
+        while not self._done.is_set() and time.monotonic() < deadline:
+            if self.samples % 100 == 0:
+                names = {thread.ident: thread.name for thread in threading.enumerate()}
+            for ident, frame in sys._current_frames().items():
+                if ident == own:
+                    continue
+                stack = []
+                while frame is not None:
+                    stack.append(_frame_label(frame))
+                    frame = frame.f_back
+                if not idle and stack[0].rsplit('.', 1)[-1] in IDLE_FUNCTIONS:
+                    continue
+                if ident not in names:
+                    names = {thread.ident: thread.name for thread in threading.enumerate()}
+                stack.append(names.get(ident, f"thread-{ident}").replace(' ', '_').replace(';', '_'))
+                self._stacks[';'.join(reversed(stack))] += 1
+            self.samples += 1
+            self._done.wait(interval)
+        self.stop()
+
+    def collapsed(self) -> str:
+        """Pilas colapsadas de la última captura, de más a menos muestras"""
+        with self._lock:
+            stacks = self._stacks.most_common()
+        return ''.join(f"{stack} {count}\n" for stack, count in stacks)
+
+
+class MemoryTracker:
+    """Instantáneas de tracemalloc y diferencias respecto a la de referencia"""
+
+    # Asignaciones propias de la medición, excluidas de las diferencias
+    FILTERS = (
+        tracemalloc.Filter(False, tracemalloc.__file__),
+        tracemalloc.Filter(False, '<frozen importlib._bootstrap>'),
+        tracemalloc.Filter(False, '<frozen importlib._bootstrap_external>'),
+        tracemalloc.Filter(False, '<unknown>'),
+    )
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._baseline: Optional[tracemalloc.Snapshot] = None
+        self._baseline_at: Optional[float] = None
+
+    def _take(self) -> tracemalloc.Snapshot:
+        return tracemalloc.take_snapshot().filter_traces(self.FILTERS)
+
+    def snapshot(self, frames: int = 1) -> Dict[str, Any]:
+        """Activa tracemalloc si hace falta y guarda la instantánea de referencia"""
+        with self._lock:
+            if not tracemalloc.is_tracing():
+                tracemalloc.start(max(1, frames))
+                logger.warning("tracemalloc activado (%d marcos): ralentiza las asignaciones hasta action=stop", max(1, frames))
+            self._baseline = self._take()
+            self._baseline_at = time.time()
+            return self.status()
+
+    def diff(self, limit: int = 25, group: str = 'lineno', reset: bool = False) -> Tuple[Any, Dict[str, Any]]:
+        """
+        Compara una instantánea nueva con la de referencia
+
+        Args:
+            limit: Entradas a devolver (las de mayor crecimiento)
+            group: 'lineno', 'filename' o 'traceback'
+            reset: Usar la nueva instantánea como referencia para la próxima comparación
+
+        Returns:
+            Tupla (lista de tracemalloc.StatisticDiff completa, resumen en diccionario)
+
+        Raises:
+            ValueError: si no hay instantánea de referencia
+        """
+        with self._lock:
+            if self._baseline is None or not tracemalloc.is_tracing():
+                raise ValueError("No hay instantánea de referencia: llama antes a action=snapshot")
+            current = self._take()
+            stats = current.compare_to(self._baseline, group)
+            summary = {
+                'since_seconds': round(time.time() - self._baseline_at, 1),
+                'size_diff_total': sum(stat.size_diff for stat in stats),
+                'top': [{
+                    'location': str(stat.traceback[-1]) if group != 'traceback'
+                    else ' <- '.join(str(frame) for frame in reversed(stat.traceback)),
+                    'size_diff': stat.size_diff,
+                    'size': stat.size,
+                    'count_diff': stat.count_diff,
+                    'count': stat.count,
+                } for stat in stats[:limit]],
+            }
+            if reset:
+                self._baseline, self._baseline_at = current, time.time()
+            return stats, dict(summary, **self.status())
+
+    def stop(self) -> Dict[str, Any]:
+        """Desactiva tracemalloc y descarta la referencia"""
+        with self._lock:
+            self._baseline = self._baseline_at = None
+            if tracemalloc.is_tracing():
+                tracemalloc.stop()
+            return self.status()
+
+    def status(self) -> Dict[str, Any]:
+        current, peak = tracemalloc.get_traced_memory() if tracemalloc.is_tracing() else (0, 0)
+        return {
+            'tracing': tracemalloc.is_tracing(),
+            'frames': tracemalloc.get_traceback_limit() if tracemalloc.is_tracing() else 0,
+            'traced_bytes': current,
+            'traced_peak_bytes': peak,
+            'has_baseline': self._baseline is not None,
+            'process': process_memory(),
+        }
+
+
+def collapsed_growth(stats) -> str:
+    """Crecimiento de memoria por traceback en formato de pilas colapsadas (bytes como peso)"""
+    lines = []
+    for stat in stats:
+        if stat.size_diff <= 0:
+            continue
+        # tracemalloc ordena los marcos del más antiguo al más reciente
+        stack = ';'.join(f"{os.path.basename(frame.filename)}:{frame.lineno}" for frame in stat.traceback)
+        lines.append(f"{stack.replace(' ', '_')} {stat.size_diff}\n")
+    return ''.join(lines)
+
+
+def process_memory() -> Dict[str, Optional[int]]:
+    """RSS actual y máximo del proceso en bytes (si el sistema lo expone)"""
+    memory = {'rss_bytes': None, 'peak_rss_bytes': None}
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmRSS:'):
+                    memory['rss_bytes'] = int(line.split()[1]) * 1024
+                elif line.startswith('VmHWM:'):
+                    memory['peak_rss_bytes'] = int(line.split()[1]) * 1024
+    except OSError:
+        try:
+            import resource
+            peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+            # Linux lo da en KiB, macOS en bytes
+            memory['peak_rss_bytes'] = peak if sys.platform == 'darwin' else peak * 1024
+        except (ImportError, OSError):
+            pass
+    return memory
+
+
+def approx_size(value: Any, depth: int = 0) -> int:
+    """Tamaño aproximado en bytes de un valor cacheado (bytes, texto, imágenes y contenedores)"""
+    if value is None:
+        return 0
+    if isinstance(value, (bytes, bytearray, memoryview)):
+        return len(value)
+    if isinstance(value, str):
+        return sys.getsizeof(value)
+    if hasattr(value, 'getbands') and hasattr(value, 'size'):
+        # Imagen de Pillow: píxeles x bandas (sin importar PIL)
+        width, height = value.size
+        return width * height * len(value.getbands())
+    if depth < 4:
+        if isinstance(value, dict):
+            return sum(approx_size(item, depth + 1) for item in value.values())
+        if isinstance(value, (list, tuple, set, frozenset)):
+            return sum(approx_size(item, depth + 1) for item in value)
+    return sys.getsizeof(value)
+
+
+# Caches del proceso por nombre (ver register_cache)
+_caches: Dict[str, Any] = {}
+
+
+def register_cache(name: str, source: Any) -> None:
+    """
+    Registra una cache para /api/debug/caches
+
+    Args:
+        name: Nombre en el informe
+        source: Cache con __len__ (y opcionalmente values() y max_entries), función
+            decorada con functools.lru_cache o función que devuelve el informe
+    """
+    _caches[name] = source
+
+
+def _describe(source: Any) -> Dict[str, Any]:
+    if hasattr(source, 'cache_info'):
+        info = source.cache_info()
+        return {'entries': info.currsize, 'max_entries': info.maxsize, 'hits': info.hits, 'misses': info.misses}
+    if callable(source) and not hasattr(source, '__len__'):
+        return source()
+    report = {'entries': len(source)}
+    if getattr(source, 'max_entries', None) is not None:
+        report['max_entries'] = source.max_entries
+    if hasattr(source, 'values'):
+        report['bytes'] = approx_size(source.values())
+    return report
+
+
+def cache_sizes() -> Dict[str, Any]:
+    """Entradas (y bytes aproximados) de cada cache registrada, más la memoria del proceso"""
+    caches = {}
+    for name, source in sorted(_caches.items()):
+        try:
+            caches[name] = _describe(source)
+        except Exception as e:
+            caches[name] = {'error': str(e)}
+    return {'pid': os.getpid(), 'process': process_memory(), 'caches': caches,
+            'total_bytes': sum(cache.get('bytes', 0) for cache in caches.values())}
+
+
+profiler = SamplingProfiler()
+memory_tracker = MemoryTracker()
+
+
+def _number(args, name: str, default, cast=float):
+    value = args.get(name)
+    return cast(value) if value not in (None, '') else default
+
+
+def diagnostics_response(name: str, args, headers) -> Tuple[int, str, str, Dict[str, str]]:
+    """
+    Atiende /api/debug/<name> (bloquea mientras dura una captura de perfil)
+
+    Args:
+        name: 'profile', 'memory' o 'caches'
+        args: Parámetros de la consulta (mapping)
+        headers: Cabeceras de la petición (mapping)
+
+    Returns:
+        Tupla (estado, cuerpo, tipo de contenido, cabeceras)
+    """
+    def reply(status: int, payload: Any, content_type: str = 'application/json', extra: dict = None):
+        body = payload if isinstance(payload, str) else json.dumps(payload, indent=2, default=str)
+        return status, body, content_type, dict(extra or {}, **{'Cache-Control': 'no-store'})
+
+    if not DIAGNOSTICS_TOKEN or name not in ('profile', 'memory', 'caches'):
+        return reply(404, {'error': 'Not Found'})
+    if not authorized(headers):
+        return reply(403, {'error': 'Token de diagnóstico no válido'})
+
+    try:
+        if name == 'caches':
+            return reply(200, cache_sizes())
+
+        if name == 'memory':
+            action = args.get('action', 'diff')
+            if action == 'snapshot':
+                return reply(200, memory_tracker.snapshot(_number(args, 'frames', 1, int)))
+            if action == 'stop':
+                return reply(200, memory_tracker.stop())
+            if action != 'diff':
+                return reply(400, {'error': f"Acción no soportada: {action}"})
+            group = args.get('group', 'traceback' if args.get('format') == 'collapsed' else 'lineno')
+            if group not in ('lineno', 'filename', 'traceback'):
+                return reply(400, {'error': f"Agrupación no soportada: {group}"})
+            stats, summary = memory_tracker.diff(_number(args, 'limit', 25, int), group,
+                                                 reset=args.get('reset', '').lower() in ('1', 'true'))
+            if args.get('format') == 'collapsed':
+                return reply(200, collapsed_growth(stats), COLLAPSED_CONTENT_TYPE)
+            return reply(200, summary)
+
+        # Perfil: durante `seconds` segundos o hasta que terminen `requests` peticiones
+        requests = _number(args, 'requests', None, int)
+        seconds = min(_number(args, 'seconds', 10.0 if requests is None else PROFILE_MAX_SECONDS), PROFILE_MAX_SECONDS)
+        profiler.start(seconds, requests, _number(args, 'interval_ms', PROFILE_INTERVAL_MS) / 1000,
+                       idle=args.get('idle', '').lower() in ('1', 'true'))
+        logger.info("Perfil de CPU iniciado (%s peticiones, máx. %.0fs)", requests or '-', seconds)
+        if not profiler.wait(seconds + 1):
+            profiler.stop()
+        return reply(200, profiler.collapsed(), COLLAPSED_CONTENT_TYPE,
+                     {'X-Profile-Samples': str(profiler.samples),
+                      'Content-Disposition': f'inline; filename="plex2sign-{os.getpid()}.collapsed"'})
+    except DiagnosticsBusy as e:
+        return reply(409, {'error': str(e)})
+    except ValueError as e:
+        return reply(400, {'error': str(e)})
@@ -0,0 +1,295 @@
+"""
+Almacén persistente opcional en disco (sobrevive a reinicios del proceso)
+
+Con PERSIST_DIR configurado se guardan en un directorio (por ejemplo bajo /tmp)
+las URLs de servidor descubiertas, el usuario de cada token, las carátulas, las
+paletas extraídas y los renders. Cada entrada es un fichero
+<PERSIST_DIR>/<espacio>/<hash[:2]>/<hash> con una cabecera de 8 bytes (instante
+de caducidad) seguida del contenido:
+
+- Las claves se guardan como hash SHA-256: ni tokens ni URLs con token aparecen
+  en los nombres de fichero, y el directorio se crea con permisos 0700.
+- Escritura atómica: fichero temporal en el mismo directorio y os.replace, de
+  modo que un lector (u otro proceso) nunca ve un fichero a medias.
+- Carga perezosa: no se lee nada al arrancar; cada entrada se lee la primera vez
+  que falla la cache en memoria.
+- Tamaño máximo (PERSIST_MAX_BYTES): al superarlo se borran primero las entradas
+  caducadas y después las escritas hace más tiempo hasta quedar en el 90%.
+
+Sin PERSIST_DIR todas las funciones son no-ops y el comportamiento no cambia.
+"""
+import os
+import json
+import time
+import struct
+import hashlib
+import logging
+import tempfile
+import threading
+from typing import Optional, Dict, Any, Hashable, List, Tuple
+from api.metrics import record_cache
+from api.diagnostics import register_cache
+
+logger = logging.getLogger(__name__)
+
+# Directorio del almacén (vacío: desactivado)
+PERSIST_DIR = os.getenv('PERSIST_DIR', '')
+# Tamaño máximo en disco
+PERSIST_MAX_BYTES = int(os.getenv('PERSIST_MAX_BYTES', 64 * 1024 * 1024))
+
+# Vigencia por defecto de cada espacio (segundos)
+NAMESPACE_TTL = {
+    'servers': 24 * 3600,
+    'users': 24 * 3600,
+    'artwork': 7 * 24 * 3600,
+    'palettes': 7 * 24 * 3600,
+    'renders': 60,
+}
+
+# Cabecera de cada fichero: instante de caducidad (time.time())
+_HEADER = struct.Struct('<d')
+
+
+class DiskCache:
+    """Cache clave -> bytes en un directorio, con TTL y tamaño máximo"""
+
+    def __init__(self, path: str, max_bytes: int = PERSIST_MAX_BYTES):
+        """
+        Inicializa el almacén (el directorio se crea en la primera escritura)
+
+        Args:
+            path: Directorio raíz
+            max_bytes: Tamaño máximo aproximado de todas las entradas
+        """
+        self.path = path
+        self.max_bytes = max_bytes
+        # Bytes ocupados: se calculan recorriendo el directorio en la primera escritura
+        self._bytes: Optional[int] = None
+        self._lock = threading.Lock()
+        self._stats = {'hits': 0, 'misses': 0, 'expired': 0, 'writes': 0, 'evicted': 0, 'errors': 0}
+
+    def _file(self, namespace: str, key: Hashable) -> str:
+        """Ruta del fichero de una clave"""
+        digest = hashlib.sha256(repr(key).encode('utf-8')).hexdigest()
+        return os.path.join(self.path, namespace, digest[:2], digest)
+
+    def _count(self, name: str, value: int = 1) -> None:
+        with self._lock:
+            self._stats[name] += value
+
+    def get(self, namespace: str, key: Hashable) -> Optional[bytes]:
+        """
+        Devuelve el contenido guardado para la clave
+
+        Returns:
+            Bytes o None si no existe, ha caducado o no se puede leer
+        """
+        path = self._file(namespace, key)
+        try:
+            with open(path, 'rb') as f:
+                data = f.read()
+        except FileNotFoundError:
+            data = None
+        except OSError as e:
+            logger.debug("Almacén en disco: error leyendo %s: %s", path, e)
+            self._count('errors')
+            data = None
+        if data is not None and len(data) >= _HEADER.size:
+            (expires,) = _HEADER.unpack_from(data)
+            if expires >= time.time():
+                self._count('hits')
+                record_cache(f'disk_{namespace}', 'hit')
+                return data[_HEADER.size:]
+            self._count('expired')
+            self._remove(path)
+        self._count('misses')
+        record_cache(f'disk_{namespace}', 'miss')
+        return None
+
+    def set(self, namespace: str, key: Hashable, value: bytes, ttl: Optional[int] = None) -> None:
+        """
+        Guarda el contenido de la clave de forma atómica
+
+        Args:
+            namespace: Espacio ('servers', 'users', 'artwork', 'palettes', 'renders'...)
+            key: Clave (se usa su repr)
+            value: Contenido
+            ttl: Segundos de vigencia (por defecto, el del espacio)
+        """
+        if ttl is None:
+            ttl = NAMESPACE_TTL.get(namespace, 3600)
+        path = self._file(namespace, key)
+        directory = os.path.dirname(path)
+        try:
+            previous = os.path.getsize(path) if os.path.exists(path) else 0
+            if not os.path.isdir(directory):
+                # makedirs solo aplica el modo al último nivel
+                for level in (self.path, os.path.dirname(directory), directory):
+                    os.makedirs(level, mode=0o700, exist_ok=True)
+            # mkstemp crea el temporal con permisos 0600
+            fd, tmp = tempfile.mkstemp(dir=directory, prefix='.tmp-')
+            try:
+                with os.fdopen(fd, 'wb') as f:
+                    f.write(_HEADER.pack(time.time() + ttl))
+                    f.write(value)
+                os.replace(tmp, path)
+            except BaseException:
+                os.unlink(tmp)
+                raise
+        except OSError as e:
+            logger.warning("Almacén en disco: no se pudo escribir en %s: %s", directory, e)
+            self._count('errors')
+            return
+        self._count('writes')
+        self._grow(_HEADER.size + len(value) - previous)
+
+    def discard(self, namespace: str, key: Hashable) -> None:
+        """Elimina la entrada de la clave si existe"""
+        self._remove(self._file(namespace, key))
+
+    def get_json(self, namespace: str, key: Hashable) -> Any:
+        """Igual que get() pero decodificando JSON (None si no existe o no es válido)"""
+        data = self.get(namespace, key)
+        if data is None:
+            return None
+        try:
+            return json.loads(data)
+        except ValueError:
+            return None
+
+    def set_json(self, namespace: str, key: Hashable, value: Any, ttl: Optional[int] = None) -> None:
+        """Igual que set() pero codificando el valor como JSON"""
+        self.set(namespace, key, json.dumps(value, separators=(',', ':')).encode('utf-8'), ttl)
+
+    def _remove(self, path: str) -> None:
+        try:
+            size = os.path.getsize(path)
+            os.unlink(path)
+        except OSError:
+            return
+        self._grow(-size)
+
+    def _grow(self, delta: int) -> None:
+        """Actualiza los bytes ocupados y desaloja si se supera el máximo"""
+        with self._lock:
+            if self._bytes is None:
+                return self._scan_and_trim()
+            self._bytes += delta
+            if self._bytes > self.max_bytes:
+                self._scan_and_trim()
+
+    def _entries(self) -> List[Tuple[float, int, str]]:
+        """(mtime, tamaño, ruta) de todos los ficheros del almacén"""
+        entries = []
+        for root, _, files in os.walk(self.path):
+            for name in files:
+                path = os.path.join(root, name)
+                try:
+                    st = os.stat(path)
+                except OSError:
+                    continue
+                entries.append((st.st_mtime, st.st_size, path))
+        return entries
+
+    def _scan_and_trim(self) -> None:
+        """
+        Recalcula el tamaño real (otros procesos pueden compartir el directorio)
+        y, si se supera el máximo, borra caducadas y después las más antiguas (requiere el lock)
+        """
+        entries = self._entries()
+        total = sum(size for _, size, _ in entries)
+        if total > self.max_bytes:
+            now = time.time()
+            target = int(self.max_bytes * 0.9)
+            expired, alive = [], []
+            for entry in entries:
+                (expired if self._expired(entry[2], now) else alive).append(entry)
+            for _, size, path in expired + sorted(alive):
+                if total <= target:
+                    break
+                try:
+                    os.unlink(path)
+                except OSError:
+                    continue
+                total -= size
+                self._stats['evicted'] += 1
+            logger.info("Almacén en disco: desalojo hasta %d bytes", total)
+        self._bytes = total
+
+    @staticmethod
+    def _expired(path: str, now: float) -> bool:
+        try:
+            with open(path, 'rb') as f:
+                header = f.read(_HEADER.size)
+        except OSError:
+            return True
+        return len(header) < _HEADER.size or _HEADER.unpack(header)[0] < now
+
+    def clear(self) -> None:
+        """Borra todas las entradas"""
+        with self._lock:
+            for _, _, path in self._entries():
+                try:
+                    os.unlink(path)
+                except OSError:
+                    pass
+            self._bytes = 0
+
+    def stats(self) -> Dict[str, Any]:
+        """Informe para /api/debug/caches: ruta, entradas, bytes y contadores de este proceso"""
+        with self._lock:
+            entries = self._entries()
+            self._bytes = sum(size for _, size, _ in entries)
+            return dict(self._stats, path=self.path, entries=len(entries), bytes=self._bytes,
+                        max_bytes=self.max_bytes)
+
+
+_disk_cache: Optional[DiskCache] = None
+_disk_cache_lock = threading.Lock()
+
+
+def get_disk_cache() -> Optional[DiskCache]:
+    """Almacén del proceso o None si PERSIST_DIR no está configurado"""
+    global _disk_cache
+    if not PERSIST_DIR:
+        return None
+    if _disk_cache is None:
+        with _disk_cache_lock:
+            if _disk_cache is None:
+                _disk_cache = DiskCache(PERSIST_DIR)
+                register_cache('disk', _disk_cache.stats)
+                logger.info("Almacén persistente en %s (máximo %d MB)", PERSIST_DIR, PERSIST_MAX_BYTES // (1024 * 1024))
+    return _disk_cache
+
+
+def load(namespace: str, key: Hashable) -> Optional[bytes]:
+    """get() del almacén del proceso (None si está desactivado)"""
+    store = get_disk_cache()
+    return store.get(namespace, key) if store else None
+
+
+def save(namespace: str, key: Hashable, value: bytes, ttl: Optional[int] = None) -> None:
+    """set() en el almacén del proceso (no hace nada si está desactivado)"""
+    store = get_disk_cache()
+    if store:
+        store.set(namespace, key, value, ttl)
+
+
+def load_json(namespace: str, key: Hashable) -> Any:
+    """get_json() del almacén del proceso (None si está desactivado)"""
+    store = get_disk_cache()
+    return store.get_json(namespace, key) if store else None
+
+
+def save_json(namespace: str, key: Hashable, value: Any, ttl: Optional[int] = None) -> None:
+    """set_json() en el almacén del proceso (no hace nada si está desactivado)"""
+    store = get_disk_cache()
+    if store:
+        store.set_json(namespace, key, value, ttl)
+
+
+def discard(namespace: str, key: Hashable) -> None:
+    """discard() en el almacén del proceso (no hace nada si está desactivado)"""
+    store = get_disk_cache()
+    if store:
+        store.discard(namespace, key)
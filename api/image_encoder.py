@@ -0,0 +1,156 @@
+"""
+Codificación de imágenes rasterizadas y negociación de formato de salida
+"""
+import io
+import os
+import logging
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+
+# Formatos soportados: nombre -> tipo MIME
+FORMATS = {
+    'png': 'image/png',
+    'png8': 'image/png',   # PNG cuantizado a paleta (256 colores)
+    'webp': 'image/webp',
+    'apng': 'image/png',   # PNG animado (los clientes sin soporte muestran el primer fotograma)
+    'gif': 'image/gif',
+}
+
+# Formatos animados: se codifican a partir de los fotogramas del ecualizador
+ANIMATED_FORMATS = ('apng', 'gif')
+
+# Alias aceptados en el parámetro `format=`
+FORMAT_ALIASES = {
+    'palette': 'png8',
+    'png-8': 'png8',
+    'animated': 'apng',
+}
+
+DEFAULT_FORMAT = 'png'
+
+# Esfuerzo de compresión en escala 0-9 (0 = más rápido, 9 = más pequeño)
+DEFAULT_EFFORT = int(os.getenv('IMAGE_ENCODE_EFFORT', 3))
+
+
+def normalize_format(fmt: Optional[str]) -> Optional[str]:
+    """Normaliza el nombre de un formato; devuelve None si no está soportado"""
+    if not fmt:
+        return None
+    fmt = fmt.strip().lower()
+    fmt = FORMAT_ALIASES.get(fmt, fmt)
+    return fmt if fmt in FORMATS else None
+
+
+def negotiate_format(accept_header: Optional[str], format_param: Optional[str] = None) -> str:
+    """
+    Decide el formato de salida a partir del parámetro `format=` y la cabecera Accept
+
+    Args:
+        accept_header: Valor de la cabecera Accept de la petición
+        format_param: Valor del parámetro `format=` (tiene prioridad)
+
+    Returns:
+        Nombre del formato a usar (PNG por defecto)
+    """
+    explicit = normalize_format(format_param)
+    if explicit:
+        return explicit
+
+    # Solo se cambia a WebP si el cliente lo pide explícitamente con q > 0
+    for part in (accept_header or '').split(','):
+        media_type, _, params = part.strip().partition(';')
+        if media_type.strip().lower() != 'image/webp':
+            continue
+        quality = 1.0
+        for param in params.split(';'):
+            name, _, value = param.strip().partition('=')
+            if name == 'q':
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        if quality > 0:
+            return 'webp'
+
+    return DEFAULT_FORMAT
+
+
+def get_mimetype(fmt: str) -> str:
+    """Devuelve el tipo MIME de un formato soportado"""
+    return FORMATS.get(fmt, FORMATS[DEFAULT_FORMAT])
+
+
+def clamp_effort(effort: Optional[int]) -> int:
+    """Limita el esfuerzo de compresión al rango 0-9"""
+    if effort is None:
+        effort = DEFAULT_EFFORT
+    return max(0, min(9, int(effort)))
+
+
+def encode_image(img, fmt: str = DEFAULT_FORMAT, effort: Optional[int] = None) -> bytes:
+    """
+    Codifica una imagen PIL en el formato indicado
+
+    Args:
+        img: Imagen PIL (normalmente RGBA)
+        fmt: Formato de salida ('png', 'png8' o 'webp')
+        effort: Esfuerzo de compresión 0-9 (None usa IMAGE_ENCODE_EFFORT)
+
+    Returns:
+        Bytes de la imagen codificada
+    """
+    fmt = normalize_format(fmt) or DEFAULT_FORMAT
+    effort = clamp_effort(effort)
+    buffer = io.BytesIO()
+
+    if fmt in ANIMATED_FORMATS:
+        # Un único fotograma: se codifica como animación de un fotograma
+        return encode_animation([img], fmt, 0, effort)
+    if fmt == 'webp':
+        # WebP sin pérdida: `method` controla la búsqueda; por encima de 4 el coste
+        # se dispara (cientos de ms por badge) sin reducir apenas el tamaño
+        img.save(buffer, format='WEBP', lossless=True,
+                 quality=50 + effort * 5, method=effort * 4 // 9)
+    elif fmt == 'png8':
+        from PIL import Image
+        # FASTOCTREE es el único cuantizador sin dependencias externas que soporta RGBA
+        quantized = img.quantize(colors=256, method=Image.Quantize.FASTOCTREE)
+        quantized.save(buffer, format='PNG', compress_level=effort, optimize=effort >= 9)
+    else:
+        # `optimize=True` solo al máximo esfuerzo: su búsqueda de zlib es la más lenta
+        img.save(buffer, format='PNG', compress_level=effort, optimize=effort >= 9)
+
+    return buffer.getvalue()
+
+
+def encode_animation(frames: list, fmt: str = 'apng', duration_ms: int = 100, effort: Optional[int] = None) -> bytes:
+    """
+    Codifica una secuencia de fotogramas como APNG o GIF en bucle infinito
+
+    Args:
+        frames: Fotogramas PIL RGBA del mismo tamaño
+        fmt: 'apng' o 'gif'
+        duration_ms: Duración de cada fotograma en milisegundos
+        effort: Esfuerzo de compresión 0-9 (solo APNG)
+
+    Returns:
+        Bytes de la animación codificada
+    """
+    effort = clamp_effort(effort)
+    buffer = io.BytesIO()
+    first, rest = frames[0], frames[1:]
+
+    if fmt == 'gif':
+        # GIF solo admite transparencia de 1 bit; disposal=2 limpia cada fotograma
+        first.save(buffer, format='GIF', save_all=True, append_images=rest,
+                   duration=duration_ms, loop=0, disposal=2, optimize=False)
+    else:
+        from PIL import PngImagePlugin
+        # blend=OP_SOURCE: cada fotograma sustituye al anterior en vez de acumularse
+        first.save(buffer, format='PNG', save_all=True, append_images=rest,
+                   duration=duration_ms, loop=0,
+                   disposal=PngImagePlugin.Disposal.OP_NONE,
+                   blend=PngImagePlugin.Blend.OP_SOURCE,
+                   compress_level=effort)
+    return buffer.getvalue()
@@ -3,85 +3,303 @@ Generador de imágenes PNG renderizando desde SVG
 """
 import os
 import io
+import random
 import logging
+from functools import lru_cache
 from typing import Optional, Dict, Any
+from api.image_encoder import encode_image, encode_animation
+from api.animation import EqualizerTimeline, render_equalizer_frames, ANIMATION_SECONDS, ANIMATION_FPS
+from api.themes import get_theme, hex_to_rgb
+from api.artwork import get_decoded_artwork
+from api.diagnostics import register_cache
 
 logger = logging.getLogger(__name__)
 
+# Escalas admitidas para pantallas HiDPI (1x, 2x, 3x)
+SUPPORTED_SCALES = (1, 2, 3)
+
+# Layout lógico en píxeles a escala 1x (posiciones exactas del SVG)
+LOGICAL_LAYOUT = {
+    'thumb_size': 80,
+    'thumb_x': 5,             # SVG: x="5"
+    'thumb_y': 5,             # SVG: y="5"
+    'text_x': 95,             # SVG: x="95" (gap de 10px como en SVG)
+    'text_margin': 10,
+    'title_baseline': 16,     # SVG: y="16"
+    'subtitle_baseline': 36,  # SVG: y="36"
+    'bars_baseline': 82,      # Base de las barras (height=90)
+    'title_font': 14,         # SVG: 15px -> PNG: 14px (BOLD)
+    'subtitle_font': 11,      # SVG: 12px -> PNG: 11px (NORMAL)
+    'emoji_font': 40,
+    'idle_font': 16,
+    'bar_width': 2,           # Barras finas de 2px
+    'bar_spacing': 1,         # Separación de 1px
+}
+
+FONT_BOLD_PATH = os.path.join(os.path.dirname(__file__), "../assets/fonts/ARIALBD.TTF")
+FONT_NORMAL_PATH = os.path.join(os.path.dirname(__file__), "../assets/fonts/ARIAL.TTF")
+
+
+def normalize_scale(value) -> int:
+    """Convierte el parámetro `scale=` (1, 2, 3, '2x'...) en una escala admitida"""
+    try:
+        scale = int(str(value).strip().lower().rstrip('x'))
+    except (TypeError, ValueError):
+        return 1
+    return min(max(scale, SUPPORTED_SCALES[0]), SUPPORTED_SCALES[-1])
+
+
+@lru_cache(maxsize=64)
+def compute_layout(width: int, height: int, scale: int = 1) -> Dict[str, Any]:
+    """
+    Calcula una sola vez el layout de un tamaño lógico y lo escala
+
+    El número de barras se decide en unidades lógicas para que todas las escalas
+    dibujen el mismo ecualizador. El diccionario devuelto se comparte: no modificar.
+    """
+    layout = {key: value * scale for key, value in LOGICAL_LAYOUT.items()}
+    layout['scale'] = scale
+    layout['canvas'] = (width * scale, height * scale)
+
+    text_width = width - LOGICAL_LAYOUT['text_x'] - LOGICAL_LAYOUT['text_margin']
+    layout['text_max_width'] = text_width * scale
+
+    # Barras alineadas con el texto (mismo text_x, +2px, y mismo ancho que el texto)
+    bar_width, bar_spacing = LOGICAL_LAYOUT['bar_width'], LOGICAL_LAYOUT['bar_spacing']
+    # Cada barra ocupa bar_width + bar_spacing, excepto la última; +2 barras para ocupar mejor el espacio
+    bar_count = (text_width + bar_spacing) // (bar_width + bar_spacing) + 2
+    total_bar_width = bar_count * (bar_width + bar_spacing) - bar_spacing
+    # Centrar las barras en el ancho disponible
+    bars_start_x = LOGICAL_LAYOUT['text_x'] + 2 + (text_width - total_bar_width) // 2
+    layout['bar_count'] = bar_count
+    layout['bars_total_width'] = total_bar_width * scale
+    layout['bars_start_x'] = bars_start_x * scale
+    return layout
+
+
+@lru_cache(maxsize=16)
+def load_fonts(title_size: int, subtitle_size: int) -> tuple:
+    """Carga (una vez por tamaño) las fuentes de título (negrita) y subtítulo"""
+    from PIL import ImageFont
+    try:
+        # Arial: Bold para títulos, Normal para subtítulos
+        return ImageFont.truetype(FONT_BOLD_PATH, title_size), ImageFont.truetype(FONT_NORMAL_PATH, subtitle_size)
+    except OSError:
+        pass
+    for path in ("arial.ttf", "C:/Windows/Fonts/arial.ttf"):
+        try:
+            # Fallback a Arial del sistema
+            return ImageFont.truetype(path, title_size), ImageFont.truetype(path, subtitle_size)
+        except OSError:
+            continue
+    # Último fallback
+    return ImageFont.load_default(), ImageFont.load_default()
+
+
+@lru_cache(maxsize=16)
+def load_system_font(size: int):
+    """Fuente del sistema para emojis y textos de estado (o la de Pillow si no existe)"""
+    from PIL import ImageFont
+    try:
+        return ImageFont.truetype("arial.ttf", size)
+    except OSError:
+        return ImageFont.load_default()
+
+
+# Lienzo máximo (píxeles) de las imágenes 'sin actividad' que se guardan en cache: el
+# tamaño por defecto a 3x cabe; uno de 2000x1000 a 3x ocuparía ~72 MB en RGBA
+IDLE_CACHE_MAX_PIXELS = 1200 * 300
+
+
+def render_idle_image(width: int, height: int, scale: int = 1):
+    """
+    Imagen 'sin actividad' de un tamaño (se comparte entre peticiones: no modificar)
+
+    Solo se cachean los lienzos de hasta IDLE_CACHE_MAX_PIXELS; los mayores se dibujan cada vez
+    """
+    canvas_width, canvas_height = compute_layout(width, height, scale)['canvas']
+    if canvas_width * canvas_height <= IDLE_CACHE_MAX_PIXELS:
+        return _cached_idle_image(width, height, scale)
+    return _draw_idle_image(width, height, scale)
+
+
+def _draw_idle_image(width: int, height: int, scale: int = 1):
+    """Dibuja la imagen 'sin actividad' de un tamaño"""
+    from PIL import Image, ImageDraw
+
+    layout = compute_layout(width, height, scale)
+    canvas_width, canvas_height = layout['canvas']
+    img = Image.new('RGBA', (canvas_width, canvas_height), (255, 255, 255, 0))
+    draw = ImageDraw.Draw(img)
+    font = load_system_font(layout['idle_font'])
+
+    text = "⏸️ Sin actividad"
+    bbox = draw.textbbox((0, 0), text, font=font)
+    text_width = bbox[2] - bbox[0]
+    text_height = bbox[3] - bbox[1]
+
+    x = (canvas_width - text_width) // 2
+    y = (canvas_height - text_height) // 2
+
+    draw.text((x, y), text, fill=(255, 255, 255, 255), font=font)
+    return img
+
+
+_cached_idle_image = lru_cache(maxsize=16)(_draw_idle_image)
+
+
+register_cache('layouts', compute_layout)
+register_cache('fonts', load_fonts)
+register_cache('system_fonts', load_system_font)
+register_cache('idle_images', _cached_idle_image)
+
 
 class ImageGenerator:
     """Generador de imágenes PNG renderizando desde SVG"""
     
-    def __init__(self, theme: str = 'normal', width: int = 400, height: int = 90):
+    def __init__(self, theme: str = 'normal', width: int = 400, height: int = 90, scale: int = 1):
         """
         Inicializa el generador de imágenes
         
         Args:
             theme: Tema visual a usar
-            width: Ancho de la imagen
-            height: Alto de la imagen
+            width: Ancho lógico de la imagen
+            height: Alto lógico de la imagen
+            scale: Densidad de píxeles (1x, 2x o 3x); la imagen mide width*scale x height*scale
         """
         self.theme = theme
         self.width = width
         self.height = height
+        self.scale = normalize_scale(scale)
+        self.layout = compute_layout(width, height, self.scale)
+    
+    def generate_now_playing_image(self, session_data: Optional[Dict[str, Any]], fmt: str = 'png', effort: Optional[int] = None) -> io.BytesIO:
+        """
+        Genera la imagen de reproducción actual codificada en el formato pedido
+        
+        Args:
+            session_data: Datos de la sesión actual o None si no hay reproducción
+            fmt: Formato de salida ('png', 'png8' o 'webp')
+            effort: Esfuerzo de compresión 0-9 (None usa IMAGE_ENCODE_EFFORT)
+            
+        Returns:
+            BytesIO con la imagen generada
+        """
+        img = self.render_now_playing_image(session_data)
+        return self.encode(img, fmt, effort)
     
-    def generate_now_playing_image(self, session_data: Optional[Dict[str, Any]]) -> io.BytesIO:
+    def render_now_playing_image(self, session_data: Optional[Dict[str, Any]]):
         """
-        Genera imagen PNG renderizando el SVG correspondiente
+        Renderiza la imagen (sin codificar) copiando el layout del SVG
         
         Args:
             session_data: Datos de la sesión actual o None si no hay reproducción
             
         Returns:
-            BytesIO con la imagen PNG generada
+            Imagen PIL en modo RGBA
         """
         try:
-            # Importar SVGGenerator
-            from api.svg_generator import SVGGenerator
+            # Generar manualmente (cairosvg no funciona en Vercel)
+            return self._render_manual_image(session_data)
+        except Exception as e:
+            logger.warning("Error renderizando imagen: %s", e)
+            return self._render_error_image(session_data)
+    
+    def render_now_playing_frames(self, session_data: Optional[Dict[str, Any]], loop_seconds: Optional[float] = None, fps: Optional[int] = None) -> list:
+        """
+        Renderiza los fotogramas del ecualizador animado (para APNG/GIF)
+        
+        La carátula y el texto se componen una sola vez en una capa base; cada
+        fotograma solo añade la máscara de las barras.
+        
+        Args:
+            session_data: Datos de la sesión actual o None si no hay reproducción
+            loop_seconds: Duración del bucle (None usa ANIMATION_SECONDS)
+            fps: Fotogramas por segundo (None usa ANIMATION_FPS)
             
-            # Generar SVG
-            svg_generator = SVGGenerator(theme=self.theme)
-            svg_content = svg_generator.generate_now_playing_svg(session_data)
+        Returns:
+            Lista de imágenes PIL RGBA (una sola si no hay ecualizador)
+        """
+        if not session_data or session_data.get('type') != 'track':
+            # Solo la música lleva ecualizador
+            return [self.render_now_playing_image(session_data)]
+        
+        try:
+            from PIL import Image, ImageFilter
+            
+            base = self._render_manual_image(session_data, bars=False)
+            theme = get_theme(self.theme)
+            layout = self.layout
+            timeline = EqualizerTimeline(layout['bar_count'], loop_seconds or ANIMATION_SECONDS, fps or ANIMATION_FPS)
+            fill_size = (layout['bars_total_width'], timeline.max_height * self.scale)
+            
+            # Relleno de las barras: fondo blur de la portada o color del tema
+            thumbnail = self._download_thumbnail(session_data['thumb']) if session_data.get('thumb') else None
+            if thumbnail:
+                fill = thumbnail.resize(fill_size, Image.Resampling.LANCZOS).filter(ImageFilter.GaussianBlur(radius=3 * self.scale))
+                fill = fill.convert('RGB').convert('RGBA')
+            else:
+                fill = Image.new('RGBA', fill_size, theme['accent_color_rgb'] + (255,))
             
-            # Generar PNG manualmente (cairosvg no funciona en Vercel)
-            logger.info("🎨 Generando PNG manualmente (igual que SVG)")
-            return self._generate_manual_png_from_svg(session_data)
-                    
+            # Misma base que las barras estáticas
+            origin = (layout['bars_start_x'], layout['bars_baseline'] - fill_size[1])
+            return render_equalizer_frames(base, fill, origin, layout['bar_width'], layout['bar_spacing'],
+                                           timeline, scale=self.scale)
         except Exception as e:
-            logger.warning(f"Error renderizando SVG como PNG: {e}")
-            return self._generate_manual_png_from_svg(session_data)
+            logger.warning("Error renderizando animación: %s", e)
+            return [self.render_now_playing_image(session_data)]
     
-    def _generate_manual_png_from_svg(self, session_data: Optional[Dict[str, Any]]) -> io.BytesIO:
+    def encode_animation(self, frames: list, fmt: str = 'apng', effort: Optional[int] = None, loop_seconds: Optional[float] = None) -> io.BytesIO:
+        """Codifica los fotogramas como APNG o GIF animado"""
+        try:
+            duration_ms = round(1000 * (loop_seconds or ANIMATION_SECONDS) / len(frames))
+            return io.BytesIO(encode_animation(frames, fmt, duration_ms, effort))
+        except Exception as e:
+            logger.error("Error codificando animación como %s: %s", fmt, e)
+            return self.encode(frames[0], 'png', effort)
+    
+    def encode(self, img, fmt: str = 'png', effort: Optional[int] = None) -> io.BytesIO:
+        """Codifica un render en el formato pedido"""
+        try:
+            return io.BytesIO(encode_image(img, fmt, effort))
+        except Exception as e:
+            logger.error("Error codificando imagen como %s: %s", fmt, e)
+            # Último recurso: imagen mínima
+            return io.BytesIO(b'\x89PNG\r\n\x1a\n\x00\x00\x00\rIHDR\x00\x00\x01\x90\x00\x00\x00\x96\x08\x06\x00\x00\x00\x00\x00\x00\x00IEND\xaeB`\x82')
+    
+    def _render_manual_image(self, session_data: Optional[Dict[str, Any]], bars: bool = True):
         """
-        Genera PNG manualmente copiando exactamente el SVG (sin animaciones)
+        Renderiza la imagen copiando exactamente el SVG (sin animaciones)
+        
+        Args:
+            session_data: Datos de la sesión actual o None si no hay reproducción
+            bars: Si False, omite las barras estáticas (capa base de la animación)
         """
         try:
-            from PIL import Image, ImageDraw, ImageFont
-            import requests
-            
-            # Crear imagen con fondo transparente
-            img = Image.new('RGBA', (self.width, self.height), (255, 255, 255, 0))
-            draw = ImageDraw.Draw(img)
+            from PIL import Image, ImageDraw
             
             # Si es historial (state='stopped'), mostrarlo como música
             if session_data and session_data.get('state') == 'stopped' and session_data.get('type') == 'track':
                 # Continuar con la generación normal (es música del historial)
                 pass
             elif not session_data:
-                logger.info("PNG: session_data es None, generando PNG idle")
-                return self._generate_idle_png(draw)
+                logger.debug("PNG: sin sesión, generando PNG idle")
+                return self._render_idle_image()
             
-            # Obtener tema
-            from api.svg_generator import SVGGenerator
-            svg_gen = SVGGenerator(theme=self.theme)
-            themes = svg_gen._load_themes()
-            theme = themes[self.theme]
+            # Crear imagen con fondo transparente (tamaño lógico x escala)
+            layout = self.layout
+            img = Image.new('RGBA', layout['canvas'], (255, 255, 255, 0))
+            draw = ImageDraw.Draw(img)
             
-            # Posiciones exactas del SVG (actualizadas para coincidir)
-            thumb_size = 80
-            thumb_x = 5   # Igual que SVG: x="5"
-            thumb_y = 5   # Igual que SVG: y="5" 
-            text_x = 95   # Igual que SVG: x="95" (gap de 10px como en SVG)
+            # Obtener tema del registro compartido
+            theme = get_theme(self.theme)
+            
+            # Posiciones exactas del SVG, ya escaladas
+            thumb_size = layout['thumb_size']
+            thumb_x = layout['thumb_x']
+            thumb_y = layout['thumb_y']
+            text_x = layout['text_x']
+            max_width = layout['text_max_width']
             
             # Descargar y procesar thumbnail
             thumbnail = None
@@ -96,18 +314,13 @@ class ImageGenerator:
                 # Placeholder - sin fondo para series/películas
                 if session_data['type'] == 'track':
                     # Solo música tiene fondo sutil
-                    placeholder_color = self._hex_to_rgb(theme['progress_bg'])
-                    placeholder_color = tuple(list(placeholder_color) + [180])  # Semi-transparente
+                    placeholder_color = theme['progress_bg_rgb'] + (180,)  # Semi-transparente
                     placeholder_img = Image.new('RGBA', (thumb_size, thumb_size), placeholder_color)
                     img.paste(placeholder_img, (thumb_x, thumb_y), placeholder_img)
                 # Para series/películas no se dibuja fondo
                 
                 # Emoji placeholder
-                try:
-                    font = ImageFont.truetype("arial.ttf", 40)
-                except:
-                    font = ImageFont.load_default()
-                
+                font = load_system_font(layout['emoji_font'])
                 emoji = "⏸️" if session_data['type'] == 'track' else "📺"
                 bbox = draw.textbbox((0, 0), emoji, font=font)
                 emoji_width = bbox[2] - bbox[0]
@@ -116,27 +329,8 @@ class ImageGenerator:
                 emoji_y = thumb_y + (thumb_size - emoji_height) // 2
                 draw.text((emoji_x, emoji_y), emoji, fill=theme['accent_color'], font=font)
             
-            # Texto (fuentes desde archivo + baseline correcto)
-            try:
-                # Arial: Bold para títulos, Normal para subtítulos
-                font_bold_path = os.path.join(os.path.dirname(__file__), "../assets/fonts/ARIALBD.TTF")
-                font_normal_path = os.path.join(os.path.dirname(__file__), "../assets/fonts/ARIAL.TTF")
-                font_title = ImageFont.truetype(font_bold_path, 14)  # SVG: 15px -> PNG: 14px (BOLD)
-                font_subtitle = ImageFont.truetype(font_normal_path, 11)  # SVG: 12px -> PNG: 11px (NORMAL)
-            except:
-                try:
-                    # Fallback a Arial del sistema
-                    font_title = ImageFont.truetype("arial.ttf", 14)
-                    font_subtitle = ImageFont.truetype("arial.ttf", 11)
-                except:
-                    try:
-                        # Fallback a fuentes del sistema Windows
-                        font_title = ImageFont.truetype("C:/Windows/Fonts/arial.ttf", 14)
-                        font_subtitle = ImageFont.truetype("C:/Windows/Fonts/arial.ttf", 11)
-                    except:
-                        # Último fallback
-                        font_title = ImageFont.load_default()
-                        font_subtitle = ImageFont.load_default()
+            # Texto (fuentes desde archivo, cacheadas por tamaño)
+            font_title, font_subtitle = load_fonts(layout['title_font'], layout['subtitle_font'])
             
             # Generar texto según tipo
             if session_data['type'] == 'track':
@@ -146,27 +340,8 @@ class ImageGenerator:
                 album = session_data.get('album', 'Álbum desconocido')
                 
                 # Truncar si es muy largo
-                max_width = self.width - text_x - 10
-                track_title = self._truncate_text(draw, track_title, font_title, max_width)
-                artist_album = self._truncate_text(draw, f"{artist} • {album}", font_subtitle, max_width)
-                
-                # Dibujar texto (baseline correcto, igual que SVG)
-                # SVG: y="16" y y="36" (baseline) -> PNG: calcular top desde baseline
-                ascent_title, descent_title = font_title.getmetrics()
-                y_baseline_title = 16  # Igual que SVG
-                y_top_title = y_baseline_title - ascent_title
-                draw.text((text_x, y_top_title), track_title, fill=theme['text_color'], font=font_title)
-                
-                ascent_sub, descent_sub = font_subtitle.getmetrics()
-                y_baseline_sub = 36  # Igual que SVG
-                y_top_sub = y_baseline_sub - ascent_sub
-                draw.text((text_x, y_top_sub), artist_album, fill=theme['accent_color'], font=font_subtitle)
-                
-                # Barras estáticas (igual que dinámicas pero sin movimiento)
-                # Posición ajustada: más arriba para que se vean mejor (height=90, posición en 82)
-                # Alineadas con el texto (mismo text_x y mismo ancho que el texto)
-                # Con fondo blur de la portada del álbum
-                self._generate_static_bars(draw, img, text_x + 2, 82, max_width, theme, thumbnail)
+                title_text = self._truncate_text(draw, track_title, font_title, max_width)
+                subtitle_text = self._truncate_text(draw, f"{artist} • {album}", font_subtitle, max_width)
                 
             elif session_data['type'] == 'episode':
                 # Serie
@@ -175,94 +350,60 @@ class ImageGenerator:
                 episode = session_data.get('episode', 0)
                 episode_title = session_data.get('episode_title', session_data.get('title', 'Episodio'))
                 
-                max_width = self.width - text_x - 10
-                show_info = self._truncate_text(draw, f"{show_title} • S{season:02d}E{episode:02d}", font_title, max_width)
-                episode_info = self._truncate_text(draw, episode_title, font_subtitle, max_width)
-                
-                # Baseline correcto para series (igual que SVG)
-                ascent_title, descent_title = font_title.getmetrics()
-                y_baseline_title = 16  # Igual que SVG
-                y_top_title = y_baseline_title - ascent_title
-                draw.text((text_x, y_top_title), show_info, fill=theme['text_color'], font=font_title)
-                
-                ascent_sub, descent_sub = font_subtitle.getmetrics()
-                y_baseline_sub = 36  # Igual que SVG
-                y_top_sub = y_baseline_sub - ascent_sub
-                draw.text((text_x, y_top_sub), episode_info, fill=theme['accent_color'], font=font_subtitle)
+                title_text = self._truncate_text(draw, f"{show_title} • S{season:02d}E{episode:02d}", font_title, max_width)
+                subtitle_text = self._truncate_text(draw, episode_title, font_subtitle, max_width)
                 
             else:
                 # Película u otros
                 title = session_data.get('title', 'Título desconocido')
                 year = session_data.get('year', '')
                 
-                max_width = self.width - text_x - 10
                 title_text = self._truncate_text(draw, title, font_title, max_width)
-                
-                # Baseline correcto para películas (igual que SVG)
-                ascent_title, descent_title = font_title.getmetrics()
-                y_baseline_title = 16  # Actualizado para coincidir con SVG
-                y_top_title = y_baseline_title - ascent_title
-                draw.text((text_x, y_top_title), title_text, fill=theme['text_color'], font=font_title)
-                
-                if year:
-                    ascent_sub, descent_sub = font_subtitle.getmetrics()
-                    y_baseline_sub = 36  # Actualizado para coincidir con SVG
-                    y_top_sub = y_baseline_sub - ascent_sub
-                    draw.text((text_x, y_top_sub), str(year), fill=theme['accent_color'], font=font_subtitle)
+                subtitle_text = str(year) if year else None
+            
+            # Dibujar texto (baseline correcto, igual que SVG): calcular top desde baseline
+            ascent_title, descent_title = font_title.getmetrics()
+            draw.text((text_x, layout['title_baseline'] - ascent_title), title_text, fill=theme['text_color'], font=font_title)
+            if subtitle_text:
+                ascent_sub, descent_sub = font_subtitle.getmetrics()
+                draw.text((text_x, layout['subtitle_baseline'] - ascent_sub), subtitle_text, fill=theme['accent_color'], font=font_subtitle)
             
-            # Convertir a BytesIO
-            img_buffer = io.BytesIO()
-            img.save(img_buffer, format='PNG', optimize=True)
-            img_buffer.seek(0)
-            return img_buffer
+            # Barras estáticas (igual que dinámicas pero sin movimiento), solo música
+            # Alineadas con el texto y con fondo blur de la portada del álbum
+            if bars and session_data['type'] == 'track':
+                self._generate_static_bars(draw, img, theme, thumbnail)
+            
+            return img
             
         except Exception as e:
-            logger.error(f"Error generando PNG manual: {e}")
-            return self._generate_error_png(session_data)
+            logger.error("Error generando PNG manual: %s", e)
+            return self._render_error_image(session_data)
     
-    def _generate_idle_png(self, draw) -> io.BytesIO:
-        """Genera PNG cuando no hay reproducción"""
+    def _render_idle_image(self):
+        """Renderiza la imagen cuando no hay reproducción (la misma para cada tamaño)"""
         try:
-            from PIL import Image, ImageDraw, ImageFont
-            
-            # Crear imagen
-            img = Image.new('RGBA', (self.width, self.height), (255, 255, 255, 0))
-            draw = ImageDraw.Draw(img)
-            
-            try:
-                font = ImageFont.truetype("arial.ttf", 16)
-            except:
-                font = ImageFont.load_default()
-            
-            text = "⏸️ Sin actividad"
-            bbox = draw.textbbox((0, 0), text, font=font)
-            text_width = bbox[2] - bbox[0]
-            text_height = bbox[3] - bbox[1]
-            
-            x = (self.width - text_width) // 2
-            y = (self.height - text_height) // 2
-            
-            draw.text((x, y), text, fill=(255, 255, 255, 255), font=font)
-            
-            img_buffer = io.BytesIO()
-            img.save(img_buffer, format='PNG', optimize=True)
-            img_buffer.seek(0)
-            return img_buffer
-            
+            # Copia: Image.save anota la imagen y varias peticiones pueden codificarla a la vez
+            return render_idle_image(self.width, self.height, self.scale).copy()
         except Exception as e:
-            logger.error(f"Error generando PNG idle: {e}")
-            return self._generate_error_png(None)
+            logger.error("Error generando PNG idle: %s", e)
+            return self._render_error_image(None)
     
-    def _download_thumbnail(self, url: str, target_size: tuple = (120, 120)):
-        """Descarga thumbnail desde URL y lo redimensiona"""
+    def _download_thumbnail(self, url: str, target_size: Optional[tuple] = None):
+        """
+        Devuelve la carátula al tamaño pedido (por defecto, 1.5x el tamaño en pantalla)
+        
+        Todas las escalas parten de la misma decodificación de alta resolución.
+        """
         try:
-            import requests
             from PIL import Image
             
-            response = requests.get(url, timeout=5)
-            response.raise_for_status()
+            side = self.layout['thumb_size'] * 3 // 2
+            target_size = target_size or (side, side)
+            source = get_decoded_artwork(url)
+            if source is None:
+                return None
             
-            image = Image.open(io.BytesIO(response.content))
+            image = source.copy()
             image.thumbnail(target_size, Image.Resampling.LANCZOS)
             
             if image.size != target_size:
@@ -274,7 +415,7 @@ class ImageGenerator:
             
             return image
         except Exception as e:
-            logger.warning(f"Error descargando thumbnail: {e}")
+            logger.warning("Error descargando thumbnail: %s", e)
             return None
     
     def _truncate_text(self, draw, text: str, font, max_width: int) -> str:
@@ -289,32 +430,20 @@ class ImageGenerator:
     
     def _hex_to_rgb(self, hex_color: str) -> tuple:
         """Convierte color hexadecimal a RGB"""
-        hex_color = hex_color.lstrip('#')
-        return tuple(int(hex_color[i:i+2], 16) for i in (0, 2, 4))
+        return hex_to_rgb(hex_color)
     
-    def _generate_static_bars(self, draw, img, start_x: int, start_y: int, width: int, theme: dict, thumbnail=None) -> None:
+    def _generate_static_bars(self, draw, img, theme: dict, thumbnail=None) -> None:
         """Genera barras de ecualizador estáticas con fondo del color dominante del álbum"""
-        # Parámetros ajustados para mejor visualización
-        bar_width = 2   # Ancho reducido a 2px para barras más finas
-        bar_spacing = 1 # Separación de 1px
-        
-        # Usar el ancho que se pasa como parámetro (mismo que el texto)
-        max_total_width = width
-        
-        # Calcular cuántas barras caben en el ancho disponible
-        # Cada barra ocupa: bar_width + bar_spacing, excepto la última que no tiene spacing
-        bar_count = (max_total_width + bar_spacing) // (bar_width + bar_spacing)
-        # Añadir 2 barras más para ocupar mejor el espacio
-        bar_count += 2
-        total_bar_width = bar_count * (bar_width + bar_spacing) - bar_spacing
-        
-        # Centrar las barras en el ancho disponible
-        bars_start_x = start_x + (width - total_bar_width) // 2
+        layout = self.layout
+        scale = self.scale
+        bar_width = layout['bar_width']
+        step = bar_width + layout['bar_spacing']
+        bars_start_x = layout['bars_start_x']
+        start_y = layout['bars_baseline']
         
         # Generar alturas aleatorias pero consistentes (mismo seed para consistencia)
-        import random
-        random.seed(42)  # Seed fijo para que siempre sean las mismas alturas
-        bar_heights = [random.randint(3, 22) for _ in range(bar_count)]
+        rng = random.Random(42)  # Seed fijo para que siempre sean las mismas alturas
+        bar_heights = [rng.randint(3, 22) * scale for _ in range(layout['bar_count'])]
         
         # Crear fondo blur de la portada para las barras
         background_blur = None
@@ -322,84 +451,58 @@ class ImageGenerator:
             try:
                 from PIL import ImageFilter, Image
                 
-                # Crear una versión estirada y con blur de la portada
-                # Redimensionar para cubrir toda el área de las barras
-                bg_width = total_bar_width
-                bg_height = max(bar_heights)
-                
-                # Estirar la imagen para cubrir el área de las barras
-                # Asegurarse de que la orientación sea correcta
-                background = thumbnail.copy()
-                background = background.resize((bg_width, bg_height), Image.Resampling.LANCZOS)
+                # Estirar la portada para cubrir toda el área de las barras
+                bg_size = (layout['bars_total_width'], max(bar_heights))
+                background = thumbnail.resize(bg_size, Image.Resampling.LANCZOS)
                 
                 # Aplicar blur/bloom effect más sutil
-                background_blur = background.filter(ImageFilter.GaussianBlur(radius=3))
+                background_blur = background.filter(ImageFilter.GaussianBlur(radius=3 * scale)).convert('RGBA')
+                # Reducir la opacidad de toda la imagen a 150 (60%)
+                background_blur.putalpha(150)
                 
-                # Reducir opacidad para que no sea muy intenso
-                background_blur = background_blur.convert('RGBA')
-                # Ajustar la opacidad de toda la imagen
-                alpha_data = []
-                for pixel in background_blur.getdata():
-                    # Mantener RGB pero reducir alpha a 150 (60% opacidad)
-                    alpha_data.append((pixel[0], pixel[1], pixel[2], 150))
-                background_blur.putdata(alpha_data)
-                
-                logger.info(f"Fondo blur creado: {bg_width}x{bg_height}")
+                logger.debug("Fondo blur creado: %dx%d", *bg_size)
                 
             except Exception as e:
-                logger.warning(f"Error creando fondo blur: {e}")
+                logger.warning("Error creando fondo blur: %s", e)
                 background_blur = None
         
         # Dibujar cada barra individual con fondo blur como máscara
-        for i in range(bar_count):
-            bar_x = bars_start_x + i * (bar_width + bar_spacing)
-            bar_height = bar_heights[i]
+        for i, bar_height in enumerate(bar_heights):
+            bar_x = bars_start_x + i * step
             bar_y = start_y - bar_height  # Crecer hacia arriba desde la base
             
             if background_blur:
                 # Recortar la parte del fondo blur que corresponde a esta barra
                 crop_x = bar_x - bars_start_x
-                crop_y = 0  # Empezar desde arriba del fondo blur
-                crop_box = (crop_x, crop_y, crop_x + bar_width, bar_height)
+                crop_box = (crop_x, 0, crop_x + bar_width, bar_height)
                 
                 try:
-                    # Recortar la porción del fondo blur para esta barra
-                    bar_bg = background_blur.crop(crop_box)
                     # Pegar solo esta porción en la posición de la barra
+                    bar_bg = background_blur.crop(crop_box)
                     img.paste(bar_bg, (bar_x, bar_y), bar_bg)
-                    logger.info(f"Barra {i}: pegando blur en ({bar_x}, {bar_y})")
                 except Exception as e:
-                    logger.warning(f"Error aplicando blur a barra {i}: {e}")
+                    logger.warning("Error aplicando blur a barra %d: %s", i, e)
                     # Fallback: dibujar barra normal
-                    bar_color = self._hex_to_rgb(theme['accent_color'])
-                    draw.rectangle(
-                        [bar_x, bar_y, bar_x + bar_width, start_y],
-                        fill=bar_color
-                    )
+                    draw.rectangle([bar_x, bar_y, bar_x + bar_width, start_y], fill=theme['accent_color_rgb'])
             else:
                 # Fallback al color del tema si no hay fondo blur
-                bar_color = self._hex_to_rgb(theme['accent_color'])
-                draw.rectangle(
-                    [bar_x, bar_y, bar_x + bar_width, start_y],
-                    fill=bar_color
-                )
+                draw.rectangle([bar_x, bar_y, bar_x + bar_width, start_y], fill=theme['accent_color_rgb'])
     
-    def _generate_error_png(self, session_data: Optional[Dict[str, Any]]) -> io.BytesIO:
+    def _render_error_image(self, session_data: Optional[Dict[str, Any]]):
         """
-        Genera PNG básico de error si no se puede renderizar SVG
+        Renderiza una imagen básica de error si no se puede renderizar el layout
         """
+        from PIL import Image, ImageDraw
+        
+        scale = self.scale
+        width, height = self.layout['canvas']
         try:
-            from PIL import Image, ImageDraw, ImageFont
-            
             # Crear imagen básica con fondo transparente
-            img = Image.new('RGBA', (self.width, self.height), (255, 255, 255, 0))
+            img = Image.new('RGBA', (width, height), (255, 255, 255, 0))
             draw = ImageDraw.Draw(img)
             
             # Texto de error simple
-            try:
-                font = ImageFont.truetype("arial.ttf", 14)
-            except:
-                font = ImageFont.load_default()
+            font = load_system_font(14 * scale)
             
             # Información básica
             if session_data:
@@ -414,40 +517,28 @@ class ImageGenerator:
             
             # Centrar texto
             lines = text.split('\n')
-            y_start = (self.height - len(lines) * 20) // 2
+            line_height = 20 * scale
+            y_start = (height - len(lines) * line_height) // 2
             
             for i, line in enumerate(lines):
                 bbox = draw.textbbox((0, 0), line, font=font)
                 text_width = bbox[2] - bbox[0]
-                x = (self.width - text_width) // 2
-                y = y_start + i * 20
+                x = (width - text_width) // 2
+                y = y_start + i * line_height
                 
                 # Fondo semi-transparente para el texto
-                padding = 4
+                padding = 4 * scale
                 draw.rectangle(
-                    [x - padding, y - padding, x + text_width + padding, y + 16 + padding],
+                    [x - padding, y - padding, x + text_width + padding, y + 16 * scale + padding],
                     fill=(0, 0, 0, 128)
                 )
                 
                 # Texto blanco
                 draw.text((x, y), line, fill=(255, 255, 255, 255), font=font)
             
-            # Convertir a BytesIO
-            img_buffer = io.BytesIO()
-            img.save(img_buffer, format='PNG', optimize=True)
-            img_buffer.seek(0)
-            return img_buffer
+            return img
             
         except Exception as e:
-            logger.error(f"Error generando PNG de fallback: {e}")
+            logger.error("Error generando PNG de fallback: %s", e)
             # Retornar imagen vacía como último recurso
-            try:
-                from PIL import Image
-                empty_img = Image.new('RGBA', (self.width, self.height), (255, 255, 255, 255))
-                img_buffer = io.BytesIO()
-                empty_img.save(img_buffer, format='PNG')
-                img_buffer.seek(0)
-                return img_buffer
-            except:
-                # Último recurso: imagen mínima
-                return io.BytesIO(b'\x89PNG\r\n\x1a\n\x00\x00\x00\rIHDR\x00\x00\x01\x90\x00\x00\x00\x96\x08\x06\x00\x00\x00\x00\x00\x00\x00IEND\xaeB`\x82')
+            return Image.new('RGBA', (width, height), (255, 255, 255, 255))
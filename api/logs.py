@@ -0,0 +1,197 @@
+"""
+Configuración de logging: cola asíncrona, límite por tipo de mensaje y campos estructurados
+
+Los hilos de petición solo encolan el registro; el formateo del mensaje y la
+escritura ocurren en un hilo aparte (QueueListener). Los mensajes usan el estilo
+perezoso de logging (`logger.info("... %s", valor)`), de modo que la plantilla
+identifica el tipo de mensaje para el límite de frecuencia y los argumentos no se
+formatean si el nivel está desactivado o el mensaje se descarta.
+"""
+import os
+import sys
+import json
+import queue
+import atexit
+import logging
+import threading
+import time
+from logging.handlers import QueueHandler, QueueListener
+from typing import Dict, Optional, Tuple
+
+# Formato de salida: 'text' (el de siempre) o 'json' (una línea por registro, con los campos de extra=)
+LOG_FORMAT = os.getenv('LOG_FORMAT', 'text').lower()
+# Registros en espera antes de descartar (nunca se bloquea la petición)
+LOG_QUEUE_SIZE = int(os.getenv('LOG_QUEUE_SIZE', 10000))
+# Registros por tipo de mensaje y ventana que pasan siempre; después, uno de cada LOG_SAMPLE_EVERY
+LOG_RATE_LIMIT = int(os.getenv('LOG_RATE_LIMIT', 20))
+LOG_RATE_WINDOW = float(os.getenv('LOG_RATE_WINDOW', 60))
+LOG_SAMPLE_EVERY = int(os.getenv('LOG_SAMPLE_EVERY', 100))
+
+# Tipos de registro (logger, plantilla) con contador propio en el limitador
+_MAX_RATE_KEYS = 1024
+
+TEXT_FORMAT = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+
+# Atributos propios de LogRecord: el resto llegan de extra= y son campos estructurados
+_RECORD_ATTRIBUTES = frozenset(vars(logging.LogRecord('', 0, '', 0, '', (), None))) | {'message', 'asctime'}
+
+
+def record_fields(record: logging.LogRecord) -> Dict[str, object]:
+    """Campos estructurados del registro (los pasados con extra=)"""
+    return {name: value for name, value in vars(record).items() if name not in _RECORD_ATTRIBUTES}
+
+
+class JSONFormatter(logging.Formatter):
+    """Una línea JSON por registro: instante, nivel, logger, mensaje y campos de extra="""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            'time': self.formatTime(record),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+        }
+        entry.update(record_fields(record))
+        if record.exc_info:
+            entry['exception'] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class RateLimitFilter(logging.Filter):
+    """
+    Límite de frecuencia por tipo de mensaje (logger + plantilla)
+
+    En cada ventana pasan los primeros `limit` registros de cada tipo y, a partir
+    de ahí, uno de cada `sample_every` (0 = ninguno). El primer registro que pasa
+    tras descartar otros lleva el campo `suppressed` con cuántos se omitieron.
+    Los errores no se limitan.
+    """
+
+    def __init__(self, limit: int = LOG_RATE_LIMIT, window: float = LOG_RATE_WINDOW,
+                 sample_every: int = LOG_SAMPLE_EVERY):
+        super().__init__()
+        self.limit = limit
+        self.window = window
+        self.sample_every = sample_every
+        self._lock = threading.Lock()
+        # (logger, plantilla) -> [inicio de ventana, registros en la ventana, descartados sin avisar]
+        self._counters: Dict[Tuple[str, str], list] = {}
+        self.dropped = 0
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if self.limit <= 0 or record.levelno >= logging.ERROR:
+            return True
+        key = (record.name, str(record.msg))
+        now = time.monotonic()
+        with self._lock:
+            counter = self._counters.get(key)
+            if counter is None and len(self._counters) >= _MAX_RATE_KEYS:
+                # Plantillas que varían con cada mensaje no deben hacer crecer el diccionario sin límite
+                self._counters = {k: c for k, c in self._counters.items() if now - c[0] < self.window}
+                if len(self._counters) >= _MAX_RATE_KEYS:
+                    self._counters.clear()
+            if counter is None or now - counter[0] >= self.window:
+                pending = counter[2] if counter else 0
+                counter = self._counters[key] = [now, 0, pending]
+            counter[1] += 1
+            seen = counter[1]
+            if seen > self.limit and (not self.sample_every or (seen - self.limit) % self.sample_every):
+                counter[2] += 1
+                self.dropped += 1
+                return False
+            suppressed, counter[2] = counter[2], 0
+        if suppressed:
+            record.suppressed = suppressed
+        return True
+
+
+class AsyncQueueHandler(QueueHandler):
+    """
+    QueueHandler que no formatea en el hilo que registra y nunca bloquea
+
+    Si la cola está llena el registro se descarta (y se cuenta). En un proceso
+    hijo creado con fork el hilo lector no existe: allí se escribe directamente.
+    """
+
+    def __init__(self, log_queue: queue.Queue, fallback: logging.Handler):
+        super().__init__(log_queue)
+        self.fallback = fallback
+        self.pid = os.getpid()
+        self.dropped = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # El lector formatea; la plantilla y los argumentos viajan tal cual
+        return record
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+    def emit(self, record: logging.LogRecord) -> None:
+        if os.getpid() != self.pid:
+            self.fallback.handle(record)
+            return
+        super().emit(record)
+
+
+class TextFormatter(logging.Formatter):
+    """Formato de texto habitual, con los mensajes omitidos por el límite de frecuencia"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        text = super().format(record)
+        suppressed = getattr(record, 'suppressed', 0)
+        return f"{text} ({suppressed} similares omitidos)" if suppressed else text
+
+
+_listener: Optional[QueueListener] = None
+_queue_handler: Optional[AsyncQueueHandler] = None
+_rate_limit: Optional[RateLimitFilter] = None
+
+
+def configure_logging(level: int = logging.INFO, stream=None) -> None:
+    """
+    Configura el logger raíz con la cola asíncrona (idempotente)
+
+    Args:
+        level: Nivel del logger raíz
+        stream: Destino de los registros (por defecto, stderr)
+    """
+    global _listener, _queue_handler, _rate_limit
+    shutdown_logging()
+    output = logging.StreamHandler(stream or sys.stderr)
+    output.setFormatter(JSONFormatter() if LOG_FORMAT == 'json' else TextFormatter(TEXT_FORMAT))
+
+    _rate_limit = RateLimitFilter()
+    log_queue = queue.Queue(maxsize=LOG_QUEUE_SIZE)
+    _queue_handler = AsyncQueueHandler(log_queue, output)
+    _queue_handler.addFilter(_rate_limit)
+    _listener = QueueListener(log_queue, output, respect_handler_level=True)
+    _listener.start()
+
+    root = logging.getLogger()
+    for handler in root.handlers[:]:
+        root.removeHandler(handler)
+    root.addHandler(_queue_handler)
+    root.setLevel(level)
+
+
+def shutdown_logging() -> None:
+    """Vacía la cola y detiene el hilo lector (al salir del proceso)"""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+
+def logging_stats() -> Dict[str, int]:
+    """Registros descartados por el límite de frecuencia y por cola llena"""
+    return {
+        'rate_limited': _rate_limit.dropped if _rate_limit else 0,
+        'queue_full': _queue_handler.dropped if _queue_handler else 0,
+        'queued': _queue_handler.queue.qsize() if _queue_handler else 0,
+    }
+
+
+atexit.register(shutdown_logging)
@@ -0,0 +1,203 @@
+"""
+Métricas en formato de texto de Prometheus (sin dependencias externas)
+
+Contadores e histogramas en memoria del proceso; observar una muestra es un
+bisect y dos sumas bajo un lock, así que la instrumentación se deja siempre activa.
+"""
+import time
+import bisect
+import threading
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterator, List, Sequence, Tuple
+from api.tracing import trace_stage, trace_cache
+
+# Cubos de latencia en segundos (de 1 ms a 10 s)
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+CONTENT_TYPE = 'text/plain; version=0.0.4'
+
+
+def _escape(value) -> str:
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels(names: Sequence[str], values: Sequence, extra: str = '') -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def _number(value: float) -> str:
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    """Contador monótono con etiquetas"""
+
+    kind = 'counter'
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values: Dict[tuple, float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1, **labels) -> None:
+        key = tuple(labels.get(name, '') for name in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def samples(self) -> Iterator[str]:
+        with self._lock:
+            values = sorted(self._values.items())
+        for key, value in values:
+            yield f"{self.name}{_labels(self.labelnames, key)} {_number(value)}"
+
+
+class Histogram:
+    """Histograma con cubos fijos y etiquetas"""
+
+    kind = 'histogram'
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # Por etiquetas: [recuentos por cubo (el último es +Inf), suma]
+        self._series: Dict[tuple, list] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels) -> None:
+        key = tuple(labels.get(name, '') for name in self.labelnames)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [[0] * (len(self.buckets) + 1), 0.0]
+            series[0][index] += 1
+            series[1] += value
+
+    def samples(self) -> Iterator[str]:
+        with self._lock:
+            series = sorted((key, (list(counts), total)) for key, (counts, total) in self._series.items())
+        for key, (counts, total) in series:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += count
+                le = '+Inf' if bound == float('inf') else _number(float(bound))
+                bucket_labels = _labels(self.labelnames, key, 'le="' + le + '"')
+                yield f"{self.name}_bucket{bucket_labels} {cumulative}"
+            yield f"{self.name}_sum{_labels(self.labelnames, key)} {_number(total)}"
+            yield f"{self.name}_count{_labels(self.labelnames, key)} {cumulative}"
+
+
+class Gauge:
+    """Valor instantáneo leído de una función en cada exposición"""
+
+    kind = 'gauge'
+
+    def __init__(self, name: str, documentation: str, read: Callable[[], float]):
+        self.name = name
+        self.documentation = documentation
+        self.read = read
+
+    def samples(self) -> Iterator[str]:
+        yield f"{self.name} {_number(self.read())}"
+
+
+class Registry:
+    """Conjunto de métricas expuestas en /metrics"""
+
+    def __init__(self):
+        self._metrics: List = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        """Exposición en formato de texto 0.0.4"""
+        lines = []
+        for metric in self._metrics:
+            try:
+                samples = list(metric.samples())
+            except Exception:
+                # Un gauge que falla no debe romper el resto de la exposición
+                continue
+            lines.append(f"# HELP {metric.name} {metric.documentation}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            lines.extend(samples)
+        return '\n'.join(lines) + '\n'
+
+
+REGISTRY = Registry()
+
+STAGE_SECONDS = REGISTRY.register(Histogram(
+    'plex2sign_stage_seconds', 'Duración de cada etapa del pipeline de badges', ('stage',)))
+CACHE_REQUESTS = REGISTRY.register(Counter(
+    'plex2sign_cache_requests_total', 'Consultas a las caches por resultado', ('cache', 'result')))
+PLEX_REQUESTS = REGISTRY.register(Counter(
+    'plex2sign_plex_requests_total', 'Llamadas a Plex Media Server y plex.tv por endpoint', ('endpoint',)))
+BADGE_RENDERS = REGISTRY.register(Counter(
+    'plex2sign_badge_renders_total', 'Badges generados según lo que muestran (live, history, idle) o error',
+    ('outcome',)))
+RENDER_POOL_RESTARTS = REGISTRY.register(Counter(
+    'plex2sign_render_pool_restarts_total', 'Pools de render recreados tras la caída de un proceso'))
+
+# Etapas acumuladas por hilo mientras se ejecuta un trabajo de render (ver collect_stages)
+_local = threading.local()
+
+
+def record_stage(name: str, seconds: float) -> None:
+    """
+    Registra la duración de una etapa (o la acumula si hay un collect_stages activo)
+    y la anota en la traza de la petición en curso
+    """
+    collected = getattr(_local, 'stages', None)
+    if collected is not None:
+        collected.append((name, seconds))
+    else:
+        STAGE_SECONDS.observe(seconds, stage=name)
+        trace_stage(name, seconds)
+
+
+def record_cache(cache: str, result: str) -> None:
+    """Cuenta una consulta a cache y la anota en la traza de la petición en curso"""
+    CACHE_REQUESTS.inc(cache=cache, result=result)
+    trace_cache(cache, result)
+
+
+@contextmanager
+def stage(name: str):
+    """Mide el bloque como una etapa del pipeline"""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_stage(name, time.perf_counter() - start)
+
+
+@contextmanager
+def collect_stages():
+    """
+    Acumula las etapas del bloque en una lista en lugar de observarlas
+
+    Se usa dentro de los trabajos de render: en un proceso del pool las métricas se
+    perderían, así que viajan con el resultado y las observa el proceso principal.
+    """
+    previous = getattr(_local, 'stages', None)
+    _local.stages = []
+    try:
+        yield _local.stages
+    finally:
+        _local.stages = previous
+
+
+def observe_stages(stages: Sequence[Tuple[str, float]]) -> None:
+    """Observa en este proceso las etapas devueltas por un trabajo de render"""
+    for name, seconds in stages:
+        STAGE_SECONDS.observe(seconds, stage=name)
@@ -3,15 +3,60 @@ Cliente para interactuar con Plex Media Server
 """
 import os
 import logging
-import requests
 import xml.etree.ElementTree as ET
 from typing import Optional, Dict, Any
-from plexapi.server import PlexServer
-from plexapi.exceptions import PlexApiException, Unauthorized
-from datetime import datetime, timedelta
+from api.metrics import stage, PLEX_REQUESTS
+from api import disk_cache
+
+# requests y plexapi se importan al conectar: el módulo se carga en frío (y lo usa
+# asgi.py a través de select_server_uri) sin pagar su importación
 
 logger = logging.getLogger(__name__)
 
+# API de cuentas de Plex (configurable para apuntar a un servidor simulado en pruebas de carga)
+PLEX_TV_URL = os.getenv('PLEX_TV_URL', 'https://plex.tv').rstrip('/')
+
+
+def select_server_uri(resources_xml: bytes) -> Optional[str]:
+    """
+    Elige la conexión del servidor a partir de la respuesta XML de /api/resources de plex.tv
+    
+    Args:
+        resources_xml: Cuerpo de la respuesta de plex.tv
+        
+    Returns:
+        URI de la conexión externa (o local si no hay externa) o None
+    
+    Raises:
+        ET.ParseError: si la respuesta no es XML válido
+    """
+    root = ET.fromstring(resources_xml)
+    
+    # Buscar el servidor Plex Media Server
+    external_connection = None
+    local_connection = None
+    
+    for device in root.findall('Device'):
+        if device.get('provides') and 'server' in device.get('provides'):
+            # Buscar todas las conexiones
+            for connection in device.findall('Connection'):
+                uri = connection.get('uri')
+                local = connection.get('local', 'true')
+                
+                if uri:
+                    if local == 'false' or local == '0' or 'plex.direct' in uri:
+                        # Conexión externa
+                        external_connection = uri
+                        logger.info("Servidor Plex encontrado (externo): %s - %s", device.get('name'), uri)
+                    else:
+                        # Conexión local (solo si no hay externa)
+                        if not external_connection:
+                            local_connection = uri
+                            logger.info("Servidor Plex encontrado (local): %s - %s", device.get('name'), uri)
+    
+    # Retornar conexión externa si existe, sino local
+    return external_connection or local_connection
+
 
 class PlexClient:
     """Cliente para obtener información de reproducción actual de Plex"""
@@ -28,10 +73,20 @@ class PlexClient:
         self.base_url = plex_url
         self.plex = None
         
-        # Si no se proporciona URL, obtenerla automáticamente
-        if not self.base_url:
-            self.base_url = self._get_server_url()
+        if self.base_url:
+            self._connect()
+            return
         
+        # URL descubierta en un arranque anterior (con almacén persistente)
+        self.base_url = disk_cache.load_json('servers', token)
+        if self.base_url and self._connect():
+            return
+        if self.base_url:
+            # La URL guardada ya no responde: se vuelve a descubrir
+            disk_cache.discard('servers', token)
+        
+        # Si no se proporciona URL, obtenerla automáticamente
+        self.base_url = self._get_server_url()
         if self.base_url:
             self._connect()
     
@@ -42,55 +97,32 @@ class PlexClient:
         Returns:
             URL del servidor Plex o None si no se puede obtener
         """
+        import requests
         try:
             # API de Plex Account para obtener recursos
-            api_url = f"https://plex.tv/api/resources?X-Plex-Token={self.token}"
+            api_url = f"{PLEX_TV_URL}/api/resources?X-Plex-Token={self.token}"
             
-            response = requests.get(api_url, timeout=10)
+            PLEX_REQUESTS.inc(endpoint='resources')
+            with stage('discovery'):
+                response = requests.get(api_url, timeout=10)
             response.raise_for_status()
             
-            # Parsear XML
-            root = ET.fromstring(response.content)
-            
-            # Buscar el servidor Plex Media Server
-            external_connection = None
-            local_connection = None
-            
-            for device in root.findall('Device'):
-                if device.get('provides') and 'server' in device.get('provides'):
-                    # Buscar todas las conexiones
-                    for connection in device.findall('Connection'):
-                        uri = connection.get('uri')
-                        local = connection.get('local', 'true')
-                        
-                        if uri:
-                            if local == 'false' or local == '0' or 'plex.direct' in uri:
-                                # Conexión externa
-                                external_connection = uri
-                                logger.info(f"Servidor Plex encontrado (externo): {device.get('name')} - {uri}")
-                            else:
-                                # Conexión local (solo si no hay externa)
-                                if not external_connection:
-                                    local_connection = uri
-                                    logger.info(f"Servidor Plex encontrado (local): {device.get('name')} - {uri}")
-            
-            # Retornar conexión externa si existe, sino local
-            if external_connection:
-                return external_connection
-            elif local_connection:
-                return local_connection
+            server_url = select_server_uri(response.content)
+            if server_url:
+                disk_cache.save_json('servers', self.token, server_url)
+                return server_url
             
             logger.warning("No se encontró ningún servidor Plex en la cuenta")
             return None
             
         except requests.RequestException as e:
-            logger.error(f"Error obteniendo recursos de Plex: {e}")
+            logger.error("Error obteniendo recursos de Plex: %s", e)
             return None
         except ET.ParseError as e:
-            logger.error(f"Error parseando respuesta XML: {e}")
+            logger.error("Error parseando respuesta XML: %s", e)
             return None
         except Exception as e:
-            logger.error(f"Error inesperado obteniendo URL del servidor: {e}")
+            logger.error("Error inesperado obteniendo URL del servidor: %s", e)
             return None
     
     def _connect(self) -> bool:
@@ -100,18 +132,21 @@ class PlexClient:
         Returns:
             True si la conexión es exitosa, False en caso contrario
         """
+        from plexapi.server import PlexServer
+        from plexapi.exceptions import PlexApiException, Unauthorized
         try:
+            PLEX_REQUESTS.inc(endpoint='server')
             self.plex = PlexServer(self.base_url, self.token)
-            logger.info(f"Conectado exitosamente a Plex Server: {self.plex.friendlyName}")
+            logger.info("Conectado exitosamente a Plex Server: %s", self.plex.friendlyName)
             return True
         except Unauthorized:
             logger.error("Token de Plex inválido o expirado")
             return False
         except PlexApiException as e:
-            logger.error(f"Error conectando a Plex: {e}")
+            logger.error("Error conectando a Plex: %s", e)
             return False
         except Exception as e:
-            logger.error(f"Error inesperado conectando a Plex: {e}")
+            logger.error("Error inesperado conectando a Plex: %s", e)
             return False
     
     def _get_token_user(self) -> Optional[str]:
@@ -121,11 +156,17 @@ class PlexClient:
         Returns:
             Nombre de usuario del token o None si no se puede obtener
         """
+        username = disk_cache.load_json('users', self.token)
+        if username:
+            return username
+        
+        import requests
         try:
             # Obtener información de la cuenta usando el token
-            api_url = f"https://plex.tv/api/v2/user"
+            api_url = f"{PLEX_TV_URL}/api/v2/user"
             headers = {'X-Plex-Token': self.token}
             
+            PLEX_REQUESTS.inc(endpoint='user')
             response = requests.get(api_url, headers=headers, timeout=10)
             response.raise_for_status()
             
@@ -133,11 +174,13 @@ class PlexClient:
             import xml.etree.ElementTree as ET
             root = ET.fromstring(response.content)
             username = root.get('username')
-            logger.info(f"Usuario del token: {username}")
+            logger.info("Usuario del token: %s", username)
+            if username:
+                disk_cache.save_json('users', self.token, username)
             return username
             
         except Exception as e:
-            logger.warning(f"Error obteniendo usuario del token: {e}")
+            logger.warning("Error obteniendo usuario del token: %s", e)
             return None
 
     def get_current_session(self, allowed_user: Optional[str] = None) -> Optional[Dict[str, Any]]:
@@ -153,11 +196,14 @@ class PlexClient:
         if not self.plex:
             logger.error("No hay conexión con Plex")
             return None
+        from plexapi.exceptions import PlexApiException
         
         try:
-            sessions = self.plex.sessions()
+            PLEX_REQUESTS.inc(endpoint='sessions')
+            with stage('sessions'):
+                sessions = self.plex.sessions()
             if not sessions:
-                logger.info("No hay sesiones activas")
+                logger.debug("No hay sesiones activas")
                 return None
             
             # Determinar usuario objetivo
@@ -177,20 +223,20 @@ class PlexClient:
                 # Buscar sesión del usuario objetivo
                 for session in sessions:
                     if session.usernames and session.usernames[0] == target_user:
-                        logger.info(f"Sesión encontrada para usuario: {target_user}")
+                        logger.debug("Sesión encontrada para usuario: %s", target_user)
                         break
                 else:
-                    logger.info(f"No hay sesión activa para el usuario: {target_user}")
+                    logger.debug("No hay sesión activa para el usuario: %s", target_user)
                     return None
             else:
                 # Tomar la primera sesión activa si no se puede determinar usuario
                 session = sessions[0]
-                logger.info(f"Usando primera sesión activa de: {session.usernames[0] if session.usernames else 'Unknown'}")
+                logger.debug("Usando primera sesión activa de: %s", session.usernames[0] if session.usernames else 'Unknown')
             
             return self._format_session_data(session)
             
         except PlexApiException as e:
-            logger.error(f"Error obteniendo sesiones: {e}")
+            logger.error("Error obteniendo sesiones: %s", e)
             return None
     
     def get_recent_playback_history(self, allowed_user: Optional[str] = None, limit: int = 5, offset: int = 0) -> Optional[Dict[str, Any]]:
@@ -228,36 +274,38 @@ class PlexClient:
             try:
                 # Obtener elementos recientemente reproducidos (sin filtro de usuario por ahora)
                 # Obtener más elementos para asegurar que tenemos suficientes canciones
-                recent_items = self.plex.history(maxresults=limit * 2)
+                PLEX_REQUESTS.inc(endpoint='history')
+                with stage('history'):
+                    recent_items = self.plex.history(maxresults=limit * 2)
                 
                 if not recent_items:
-                    logger.info(f"No hay historial de reproducciones para {target_user}")
+                    logger.info("No hay historial de reproducciones para %s", target_user)
                     return None
                 
                 # Buscar elementos de música válidos
                 valid_music_items = []
-                logger.info(f"Revisando {len(recent_items)} elementos del historial...")
+                logger.debug("Revisando %d elementos del historial...", len(recent_items))
                 for i, item in enumerate(recent_items):
                     title = getattr(item, 'title', '')
                     item_type = getattr(item, 'type', '')
-                    logger.info(f"Elemento {i+1}: título='{title}', tipo={item_type}, clase={type(item).__name__}")
+                    logger.debug("Elemento %d: título='%s', tipo=%s, clase=%s", i + 1, title, item_type, type(item).__name__)
                     
                     # Solo considerar elementos de música (track)
                     if (item_type == 'track' and 
                         title and title.strip() and 
                         title != 'TBA' and title != 'Unknown'):
                         valid_music_items.append(item)
-                        logger.info(f"Elemento de música válido encontrado: {title}")
+                        logger.debug("Elemento de música válido encontrado: %s", title)
                 
                 # Seleccionar elemento según offset
                 if not valid_music_items:
-                    logger.info("No hay elementos válidos en el historial, usando el primero disponible")
+                    logger.debug("No hay elementos válidos en el historial, usando el primero disponible")
                     recent_item = recent_items[0] if recent_items else None
                 else:
                     # Usar offset para alternar entre canciones
                     item_index = offset % len(valid_music_items)
                     recent_item = valid_music_items[item_index]
-                    logger.info(f"Seleccionando canción {item_index + 1} de {len(valid_music_items)}: {getattr(recent_item, 'title', 'Unknown')}")
+                    logger.debug("Seleccionando canción %d de %d: %s", item_index + 1, len(valid_music_items), getattr(recent_item, 'title', 'Unknown'))
                 
                 if not recent_item:
                     logger.info("No hay elementos en el historial")
@@ -314,26 +362,26 @@ class PlexClient:
                     history_data['album'] = 'Álbum desconocido'
                 
                 # URLs de imágenes (para música usar art, no thumb)
-                logger.info(f"Campos de imagen disponibles: art={getattr(recent_item, 'art', None)}, thumb={getattr(recent_item, 'thumb', None)}")
+                logger.debug("Campos de imagen disponibles: art=%s, thumb=%s", getattr(recent_item, 'art', None), getattr(recent_item, 'thumb', None))
                 
                 # Para música, siempre intentar obtener la imagen del álbum primero
                 album_image_found = False
                 try:
                     if hasattr(recent_item, 'album') and recent_item.album:
                         album_obj = recent_item.album() if callable(recent_item.album) else recent_item.album
-                        logger.info(f"Objeto álbum: {album_obj}")
+                        logger.debug("Objeto álbum: %s", album_obj)
                         if hasattr(album_obj, 'thumb') and album_obj.thumb:
                             history_data['thumb'] = f"{self.base_url}{album_obj.thumb}?X-Plex-Token={self.token}"
                             history_data['art'] = history_data['thumb']  # Para música, art = thumb
                             album_image_found = True
-                            logger.info(f"Portada del álbum encontrada: {album_obj.thumb}")
+                            logger.debug("Portada del álbum encontrada: %s", album_obj.thumb)
                         elif hasattr(album_obj, 'art') and album_obj.art:
                             history_data['art'] = f"{self.base_url}{album_obj.art}?X-Plex-Token={self.token}"
                             history_data['thumb'] = history_data['art']
                             album_image_found = True
-                            logger.info(f"Imagen del álbum encontrada: {album_obj.art}")
+                            logger.debug("Imagen del álbum encontrada: %s", album_obj.art)
                 except Exception as e:
-                    logger.warning(f"Error obteniendo imagen del álbum: {e}")
+                    logger.warning("Error obteniendo imagen del álbum: %s", e)
                 
                 if not album_image_found and hasattr(recent_item, 'art') and recent_item.art:
                     history_data['art'] = f"{self.base_url}{recent_item.art}?X-Plex-Token={self.token}"
@@ -346,19 +394,21 @@ class PlexClient:
                     if 'X-Plex-Token=' not in thumb_url:
                         thumb_url += f"?X-Plex-Token={self.token}"
                     history_data['thumb'] = thumb_url
-                    logger.info(f"URL del thumbnail generada: {thumb_url}")
+                    logger.debug("Thumbnail del elemento: %s", recent_item.thumb)
                 elif not album_image_found:
-                    logger.info("No se encontró imagen del álbum, usando fallback")
+                    logger.debug("No se encontró imagen del álbum, usando fallback")
                 
-                logger.info(f"Historial encontrado para {target_user}: {history_data['title']} - {history_data['artist']}")
+                logger.info("Historial encontrado para %s: %s - %s", target_user, history_data['title'], history_data['artist'])
                 return history_data
                 
             except Exception as e:
-                logger.warning(f"Error obteniendo historial específico del usuario: {e}")
+                logger.warning("Error obteniendo historial específico del usuario: %s", e)
                 
                 # Fallback: obtener historial general
                 try:
-                    recent_items = self.plex.history(maxresults=limit)
+                    PLEX_REQUESTS.inc(endpoint='history')
+                    with stage('history'):
+                        recent_items = self.plex.history(maxresults=limit)
                     
                     if not recent_items:
                         logger.info("No hay historial de reproducciones disponible")
@@ -387,15 +437,15 @@ class PlexClient:
                     if hasattr(recent_item, 'thumb') and recent_item.thumb:
                         history_data['thumb'] = f"{self.base_url}{recent_item.thumb}?X-Plex-Token={self.token}"
                     
-                    logger.info(f"Historial general encontrado: {history_data['title']}")
+                    logger.info("Historial general encontrado: %s", history_data['title'])
                     return history_data
                     
                 except Exception as e2:
-                    logger.error(f"Error obteniendo historial general: {e2}")
+                    logger.error("Error obteniendo historial general: %s", e2)
                     return None
             
         except Exception as e:
-            logger.error(f"Error inesperado obteniendo historial: {e}")
+            logger.error("Error inesperado obteniendo historial: %s", e)
             return None
     
     def _format_session_data(self, session) -> Dict[str, Any]:
@@ -467,7 +517,7 @@ class PlexClient:
             return data
             
         except Exception as e:
-            logger.error(f"Error formateando datos de sesión: {e}")
+            logger.error("Error formateando datos de sesión: %s", e)
             return {
                 'title': 'Error obteniendo información',
                 'type': 'unknown',
@@ -493,6 +543,10 @@ class PlexClient:
             pass
         return False
     
+    def _count_sessions(self) -> int:
+        PLEX_REQUESTS.inc(endpoint='sessions')
+        return len(self.plex.sessions())
+    
     def get_server_info(self) -> Dict[str, Any]:
         """
         Obtiene información básica del servidor
@@ -508,10 +562,10 @@ class PlexClient:
                 'name': self.plex.friendlyName,
                 'version': self.plex.version,
                 'platform': self.plex.platform,
-                'sessions_count': len(self.plex.sessions()),
+                'sessions_count': self._count_sessions(),
             }
         except Exception as e:
-            logger.error(f"Error obteniendo info del servidor: {e}")
+            logger.error("Error obteniendo info del servidor: %s", e)
             return {'error': str(e)}
 
 
@@ -532,4 +586,5 @@ def create_plex_client(token: Optional[str] = None) -> Optional[PlexClient]:
         logger.error("Falta token de Plex (parámetro o variable de entorno PLEX_TOKEN)")
         return None
     
-    return PlexClient(plex_token, plex_url)
+    with stage('client'):
+        return PlexClient(plex_token, plex_url)
@@ -0,0 +1,383 @@
+"""
+Ejecutor de renders en un pool de procesos con cola acotada y plazos por trabajo
+"""
+import os
+import time
+import logging
+import threading
+import contextvars
+from functools import partial
+from collections import deque
+from concurrent.futures import Future, BrokenExecutor, TimeoutError as FutureTimeoutError
+from typing import Optional, Dict, Any, TYPE_CHECKING
+from api.metrics import stage, collect_stages, observe_stages, RENDER_POOL_RESTARTS
+from api.tracing import trace_stages
+
+if TYPE_CHECKING:
+    from concurrent.futures import ProcessPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+# Procesos de render (0 = renderizar en el hilo de la petición, p. ej. en Vercel)
+RENDER_WORKERS = int(os.getenv('RENDER_WORKERS', os.cpu_count() or 1))
+# Trabajos que pueden esperar a un proceso libre antes de rechazar nuevos
+RENDER_QUEUE_SIZE = int(os.getenv('RENDER_QUEUE_SIZE', 16))
+# Plazo máximo de un trabajo (espera en cola + render) en segundos
+RENDER_TIMEOUT = float(os.getenv('RENDER_TIMEOUT', 10))
+# 'spawn' evita heredar hilos y locks del servidor web al crear los procesos
+RENDER_START_METHOD = os.getenv('RENDER_START_METHOD', 'spawn')
+
+# Ventana (segundos) sobre la que se calcula la utilización de los procesos
+UTILIZATION_WINDOW = 60
+
+
+class RenderPoolError(Exception):
+    """Error base del ejecutor de renders"""
+
+
+class RenderQueueFull(RenderPoolError):
+    """La cola de renders está llena: la petición se rechaza en vez de esperar"""
+
+
+class RenderTimeout(RenderPoolError):
+    """El trabajo no terminó dentro de su plazo"""
+
+
+class RenderWorkerLost(RenderPoolError):
+    """Un proceso del pool murió (OOM, segfault) mientras había trabajos pendientes"""
+
+
+class RenderJob:
+    """
+    Trabajo de render serializable: una copia de la sesión más los bytes de la carátula,
+    de forma que el proceso de render no necesita acceder a Plex ni a la red
+    """
+
+    KINDS = ('image', 'animation', 'svg')
+
+    def __init__(self, kind: str, session_data: Optional[Dict[str, Any]], theme: str,
+                 width: int, height: int, artwork: Optional[bytes] = None, **options):
+        """
+        Args:
+            kind: 'image' (PNG/WebP), 'animation' (APNG/GIF) o 'svg'
+            session_data: Datos de la sesión o None si no hay reproducción
+            theme: Tema a usar
+            width: Ancho del badge
+            height: Alto del badge
+            artwork: Bytes de la carátula de session_data['thumb'] (si se descargó)
+            options: Opciones del render (fmt, effort, scale, equalizer_mode)
+        """
+        if kind not in self.KINDS:
+            raise ValueError(f"Tipo de render no soportado: {kind}")
+        self.kind = kind
+        self.session_data = dict(session_data) if session_data else None
+        self.theme = theme
+        self.width = width
+        self.height = height
+        self.artwork = artwork
+        self.options = options
+        self.submitted_at = time.time()
+        self.deadline: Optional[float] = None
+
+
+def execute_job(job: RenderJob) -> Dict[str, Any]:
+    """
+    Ejecuta un trabajo de render (en un proceso del pool o en el hilo actual)
+
+    Returns:
+        Diccionario con 'body' (bytes), 'started', 'busy' (segundos de render) y
+        'stages' (duración de cada etapa, para las métricas del proceso principal)
+    """
+    started = time.time()
+    if job.deadline is not None and started > job.deadline:
+        # Caducó mientras esperaba en cola: nadie recogerá el resultado
+        raise RenderTimeout("El trabajo caducó en la cola")
+
+    with collect_stages() as stages:
+        body = _render_job(job)
+    return {'body': body, 'started': started, 'busy': time.time() - started, 'stages': stages}
+
+
+def _render_job(job: RenderJob) -> bytes:
+    """Renderiza y codifica el trabajo"""
+    from api.artwork import put_artwork
+    session_data = job.session_data
+    if job.artwork and session_data and session_data.get('thumb'):
+        put_artwork(session_data['thumb'], job.artwork)
+
+    fmt = job.options.get('fmt')
+    effort = job.options.get('effort')
+    if job.kind == 'svg':
+        from api.svg_generator import SVGGenerator
+        generator = SVGGenerator(job.width, job.height, job.theme,
+                                 equalizer_mode=job.options.get('equalizer_mode'))
+        with stage('svg'):
+            return generator.render_now_playing_svg(session_data)
+    else:
+        from api.image_generator import ImageGenerator
+        generator = ImageGenerator(theme=job.theme, width=job.width, height=job.height,
+                                   scale=job.options.get('scale', 1))
+        if job.kind == 'animation':
+            with stage('rasterize'):
+                frames = generator.render_now_playing_frames(session_data)
+            with stage('encode'):
+                return generator.encode_animation(frames, fmt, effort).getvalue()
+        with stage('rasterize'):
+            render = generator.render_now_playing_image(session_data)
+        with stage('encode'):
+            return generator.encode(render, fmt, effort).getvalue()
+
+
+def warm_up_worker() -> None:
+    """Inicializador de cada proceso del pool: carga PIL, fuentes y plantillas antes del primer trabajo"""
+    from api.warmup import warm_up, WARMUP
+    if WARMUP != 'off':
+        warm_up(plex=False)
+
+
+class RenderExecutor:
+    """Ejecuta trabajos de render en procesos, con cola acotada, plazos y métricas"""
+
+    def __init__(self, workers: int = RENDER_WORKERS, queue_size: int = RENDER_QUEUE_SIZE,
+                 timeout: float = RENDER_TIMEOUT):
+        """
+        Inicializa el ejecutor (los procesos se crean bajo demanda)
+
+        Args:
+            workers: Número de procesos (0 = render en el hilo de la petición)
+            queue_size: Trabajos en espera admitidos además de los que se ejecutan
+            timeout: Plazo por defecto de cada trabajo en segundos
+        """
+        self.workers = max(0, workers)
+        self.queue_size = max(0, queue_size)
+        self.timeout = timeout
+        self._pool: Optional['ProcessPoolExecutor'] = None
+        self._lock = threading.Lock()
+        self._in_flight = 0
+        self._counters = {'completed': 0, 'failed': 0, 'rejected': 0, 'timed_out': 0, 'restarts': 0}
+        self._wait_total = 0.0
+        self._wait_max = 0.0
+        self._busy_window: deque = deque()
+
+    @property
+    def max_in_flight(self) -> int:
+        """Trabajos admitidos a la vez (en ejecución + en cola)"""
+        return max(1, self.workers) + self.queue_size
+
+    def _get_pool(self) -> Optional['ProcessPoolExecutor']:
+        """Crea el pool la primera vez; si el entorno no lo permite, pasa a modo en línea"""
+        if self.workers == 0:
+            return None
+        if self._pool is None:
+            with self._lock:
+                if self._pool is None:
+                    try:
+                        # multiprocessing solo se carga si hay procesos (no en modo en línea)
+                        import multiprocessing
+                        from concurrent.futures import ProcessPoolExecutor
+                        context = multiprocessing.get_context(RENDER_START_METHOD)
+                        self._pool = ProcessPoolExecutor(max_workers=self.workers, mp_context=context,
+                                                         initializer=warm_up_worker)
+                        logger.info("Pool de render iniciado: %s procesos (%s)", self.workers, RENDER_START_METHOD)
+                    except (OSError, ValueError, NotImplementedError) as e:
+                        # Entornos sin semáforos POSIX (funciones serverless)
+                        logger.warning("Pool de procesos no disponible, se renderiza en línea: %s", e)
+                        self.workers = 0
+                        return None
+        return self._pool
+
+    def _restart_pool(self, broken) -> None:
+        """
+        Descarta un pool roto (un proceso murió): el siguiente trabajo crea uno nuevo
+
+        Args:
+            broken: Pool que falló; si ya se reemplazó no se hace nada
+        """
+        with self._lock:
+            if broken is None or self._pool is not broken:
+                return
+            self._pool = None
+            self._counters['restarts'] += 1
+        RENDER_POOL_RESTARTS.inc()
+        logger.warning("Un proceso de render terminó de forma abrupta: se recrea el pool")
+        # Sus procesos ya se terminaron; solo se liberan los recursos del ejecutor
+        broken.shutdown(wait=False)
+
+    def _acquire(self) -> None:
+        """Reserva un hueco en la cola o rechaza el trabajo"""
+        with self._lock:
+            if self._in_flight >= self.max_in_flight:
+                self._counters['rejected'] += 1
+                raise RenderQueueFull(f"Cola de render llena ({self._in_flight} trabajos)")
+            self._in_flight += 1
+
+    def _release(self, result: Optional[Dict[str, Any]], submitted_at: float, error: bool) -> None:
+        """Libera el hueco del trabajo y registra sus métricas"""
+        with self._lock:
+            self._in_flight -= 1
+            if result is None:
+                if error:
+                    self._counters['failed'] += 1
+                return
+            self._counters['completed'] += 1
+            observe_stages(result.get('stages', ()))
+            wait = max(0.0, result['started'] - submitted_at)
+            self._wait_total += wait
+            self._wait_max = max(self._wait_max, wait)
+            now = time.time()
+            self._busy_window.append((now, result['busy']))
+            while self._busy_window and now - self._busy_window[0][0] > UTILIZATION_WINDOW:
+                self._busy_window.popleft()
+
+    def submit(self, job: RenderJob, timeout: Optional[float] = None) -> Future:
+        """
+        Encola un trabajo sin esperar su resultado
+
+        Raises:
+            RenderQueueFull: si ya hay demasiados trabajos pendientes
+        """
+        self._acquire()
+        job.submitted_at = time.time()
+        job.deadline = job.submitted_at + (timeout if timeout is not None else self.timeout)
+
+        try:
+            pool = self._get_pool()
+            future: Optional[Future] = None
+            if pool is not None:
+                try:
+                    future = pool.submit(execute_job, job)
+                except BrokenExecutor:
+                    # El pool se rompió antes de enterarnos: se recrea y se reintenta una vez
+                    self._restart_pool(pool)
+                    pool = self._get_pool()
+                    if pool is not None:
+                        future = pool.submit(execute_job, job)
+            if future is None:
+                # En línea: sin pool o porque no se pudo recrear (_get_pool pasó a modo en línea)
+                future = Future()
+                try:
+                    future.set_result(execute_job(job))
+                except Exception as e:
+                    future.set_exception(e)
+        except Exception:
+            self._release(None, job.submitted_at, error=True)
+            raise
+
+        def on_done(done: Future, submitted_at=job.submitted_at, pool=pool) -> None:
+            if not done.cancelled() and isinstance(done.exception(), BrokenExecutor):
+                self._restart_pool(pool)
+            if done.cancelled():
+                self._release(None, submitted_at, error=False)
+            elif done.exception() is not None:
+                # Los plazos vencidos se cuentan aparte (timed_out), no como fallos
+                self._release(None, submitted_at, error=not isinstance(done.exception(), RenderTimeout))
+            else:
+                self._release(done.result(), submitted_at, error=False)
+
+        future.add_done_callback(on_done)
+        return future
+
+    def run(self, job: RenderJob, timeout: Optional[float] = None) -> bytes:
+        """
+        Ejecuta un trabajo y espera su resultado dentro del plazo
+
+        Returns:
+            Cuerpo renderizado y codificado
+
+        Raises:
+            RenderQueueFull: si la cola está llena
+            RenderTimeout: si el trabajo no termina a tiempo
+        """
+        future = self.submit(job, timeout)
+        return self.result(future, job)
+
+    def result(self, future: Future, job: RenderJob) -> bytes:
+        """Espera el resultado de un trabajo ya encolado hasta su plazo"""
+        try:
+            result = future.result(timeout=max(0.0, job.deadline - time.time()))
+        except FutureTimeoutError:
+            # Si aún no empezó, se descarta; si ya corre, su proceso lo abandonará al terminar
+            future.cancel()
+            with self._lock:
+                self._counters['timed_out'] += 1
+            raise RenderTimeout(f"Render '{job.kind}' sin completar en el plazo")
+        except RenderTimeout:
+            with self._lock:
+                self._counters['timed_out'] += 1
+            raise
+        except BrokenExecutor as e:
+            raise RenderWorkerLost(f"Render '{job.kind}' perdido: el proceso terminó de forma abrupta") from e
+        trace_stages(result['stages'])
+        return result['body']
+
+    async def run_async(self, job: RenderJob, timeout: Optional[float] = None) -> bytes:
+        """
+        Versión para asyncio de run(): el bucle de eventos no se bloquea mientras se renderiza
+
+        En modo en línea el render se ejecuta en el pool de hilos por defecto del bucle;
+        con procesos se espera el futuro del pool sin ocupar ningún hilo.
+        """
+        import asyncio
+        loop = asyncio.get_running_loop()
+        if self._get_pool() is None:
+            # run_in_executor no propaga el contexto: sin copiarlo se perdería la traza de la petición
+            return await loop.run_in_executor(None, partial(contextvars.copy_context().run, self.run, job, timeout))
+
+        future = self.submit(job, timeout)
+        try:
+            result = await asyncio.wait_for(asyncio.wrap_future(future),
+                                            max(0.0, job.deadline - time.time()))
+        except asyncio.TimeoutError:
+            future.cancel()
+            with self._lock:
+                self._counters['timed_out'] += 1
+            raise RenderTimeout(f"Render '{job.kind}' sin completar en el plazo")
+        except RenderTimeout:
+            with self._lock:
+                self._counters['timed_out'] += 1
+            raise
+        except BrokenExecutor as e:
+            raise RenderWorkerLost(f"Render '{job.kind}' perdido: el proceso terminó de forma abrupta") from e
+        trace_stages(result['stages'])
+        return result['body']
+
+    def stats(self) -> Dict[str, Any]:
+        """Métricas del ejecutor: profundidad de cola, espera y utilización"""
+        with self._lock:
+            workers = max(1, self.workers)
+            now = time.time()
+            busy = sum(seconds for finished, seconds in self._busy_window
+                       if now - finished <= UTILIZATION_WINDOW)
+            completed = self._counters['completed']
+            return {
+                'mode': 'process' if self.workers else 'inline',
+                'workers': self.workers,
+                'in_flight': self._in_flight,
+                'queue_depth': max(0, self._in_flight - workers),
+                'queue_limit': self.queue_size,
+                **self._counters,
+                'wait_ms_avg': round(1000 * self._wait_total / completed, 2) if completed else 0.0,
+                'wait_ms_max': round(1000 * self._wait_max, 2),
+                'utilization': round(min(1.0, busy / (workers * UTILIZATION_WINDOW)), 4),
+            }
+
+    def shutdown(self) -> None:
+        """Detiene los procesos del pool"""
+        with self._lock:
+            pool, self._pool = self._pool, None
+        if pool is not None:
+            pool.shutdown(wait=False, cancel_futures=True)
+
+
+_executor: Optional[RenderExecutor] = None
+_executor_lock = threading.Lock()
+
+
+def get_render_executor() -> RenderExecutor:
+    """Devuelve el ejecutor de renders compartido por el proceso"""
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = RenderExecutor()
+    return _executor
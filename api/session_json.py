@@ -0,0 +1,99 @@
+"""
+Datos de la sesión en JSON para clientes que dibujan el badge por su cuenta
+"""
+import re
+import json
+import hashlib
+from typing import Any, Dict, Optional
+from urllib.parse import urlsplit, urlencode
+from api.cache import session_fingerprint
+
+# Campos con URLs de imágenes de Plex: llevan el token, se sustituyen por el proxy
+PROXIED_IMAGE_FIELDS = ('thumb', 'art')
+
+# Únicas rutas que sirve el proxy: imágenes de un elemento de la biblioteca. Cualquier
+# otra (listados, /library/parts/.../file) se pediría a Plex con el token del servidor
+ARTWORK_PATH_PATTERN = re.compile(r'/library/metadata/\d+/(thumb|art|grandparentThumb|parentThumb)(/\d+)?')
+
+
+def artwork_path(image_url: Optional[str]) -> Optional[str]:
+    """Ruta /library/metadata/<id>/<imagen> de una URL de imagen de Plex (None si no es una carátula)"""
+    if not image_url:
+        return None
+    path = urlsplit(image_url).path
+    return path if ARTWORK_PATH_PATTERN.fullmatch(path) else None
+
+
+def plex_artwork_url(base_url: str, token: str, path: str) -> str:
+    """URL de la imagen en Plex, con la misma forma que las de la sesión (comparten cache)"""
+    return f"{base_url}{path}?X-Plex-Token={token}"
+
+
+def proxy_artwork_url(url_root: str, image_url: Optional[str], token: str = None) -> Optional[str]:
+    """
+    URL de /api/artwork para una imagen de la sesión
+
+    La ruta de Plex incluye la fecha de actualización de la imagen, así que la URL
+    cambia cuando cambia la carátula y puede cachearse mucho tiempo. Solo se añade
+    el token si el cliente lo pasó en su petición.
+    """
+    path = artwork_path(image_url)
+    if path is None:
+        return None
+    params = {'path': path}
+    if token:
+        params['token'] = token
+    return f"{url_root}api/artwork?{urlencode(params)}"
+
+
+def session_payload(session_data: Optional[Dict[str, Any]], url_root: str, token: str = None) -> Dict[str, Any]:
+    """
+    Sesión formateada (como la usa el render) con las imágenes servidas por el proxy
+
+    Returns:
+        Diccionario con fingerprint, playing, source ('live', 'history' o 'idle') y
+        los campos de la sesión
+    """
+    fingerprint = session_fingerprint(session_data)
+    if not session_data:
+        return {'fingerprint': fingerprint, 'playing': False, 'source': 'idle'}
+    payload = dict(session_data)
+    for field in PROXIED_IMAGE_FIELDS:
+        payload[field] = proxy_artwork_url(url_root, session_data.get(field), token)
+    payload.update(fingerprint=fingerprint, playing=session_data.get('state') == 'playing',
+                   source='history' if session_data.get('state') == 'stopped' else 'live')
+    return payload
+
+
+def select_fields(payload: Dict[str, Any], fields: Optional[str]) -> Dict[str, Any]:
+    """Deja solo los campos pedidos (fields=title,artist,...); sin parámetro, todos"""
+    if not fields:
+        return payload
+    wanted = [field.strip() for field in fields.split(',') if field.strip()]
+    return {field: payload.get(field) for field in wanted}
+
+
+def json_body(payload: Dict[str, Any]) -> bytes:
+    """Serialización estable (claves ordenadas) para que el ETag no dependa del orden"""
+    return json.dumps(payload, sort_keys=True, ensure_ascii=False, separators=(',', ':'), default=str).encode('utf-8')
+
+
+def make_etag(body: bytes) -> str:
+    """ETag débil del cuerpo sin comprimir (la misma para todas las codificaciones)"""
+    return f'W/"{hashlib.sha1(body).hexdigest()[:16]}"'
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """Comparación débil de If-None-Match con el ETag actual"""
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == '*':
+        return True
+    opaque = etag[2:] if etag.startswith('W/') else etag
+    for candidate in if_none_match.split(','):
+        candidate = candidate.strip()
+        if candidate.startswith('W/'):
+            candidate = candidate[2:]
+        if candidate == opaque:
+            return True
+    return False
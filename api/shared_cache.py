@@ -0,0 +1,161 @@
+"""
+Cache compartida por todos los workers de la máquina (SQLite en modo WAL)
+
+Con varios workers de gunicorn/uvicorn cada proceso tiene sus propias caches en
+memoria: todos consultan Plex y renderizan el mismo badge por separado. Con
+SHARED_CACHE_PATH configurado, las instantáneas de sesión y los renders se
+guardan además en una base SQLite local que leen y escriben todos los procesos:
+la consulta a Plex o el render de un worker sirve para el resto.
+
+- Modo WAL: los lectores no bloquean al escritor ni entre sí; cada escritura es
+  una transacción corta (INSERT OR REPLACE de una fila).
+- Codificación binaria compacta con marshal (dicts, listas, tuplas, str, bytes,
+  números y None); los valores con otros tipos no se comparten.
+- Cerrojos con caducidad en la tabla locks (un solo worker refresca cada
+  usuario; ver api.cache_backends.get_or_compute).
+- Las claves se guardan como hash SHA-256; el fichero se crea con permisos 0600
+  porque las sesiones incluyen URLs de carátula con el token del servidor.
+- Tamaño máximo (SHARED_CACHE_MAX_BYTES): cada cierto número de escrituras se
+  borran las filas caducadas y, si aún se supera, las más antiguas.
+
+Es el backend 'sqlite' de api.cache_backends: cualquier error de SQLite se
+trata como un fallo de cache y la petición sigue por el camino normal.
+"""
+import os
+import time
+import sqlite3
+import logging
+import threading
+from typing import Optional, Dict, Any
+from api.cache_backends import CacheBackend
+
+logger = logging.getLogger(__name__)
+
+# Fichero de la base compartida (vacío: desactivada)
+SHARED_CACHE_PATH = os.getenv('SHARED_CACHE_PATH', '')
+# Tamaño máximo de los valores guardados
+SHARED_CACHE_MAX_BYTES = int(os.getenv('SHARED_CACHE_MAX_BYTES', 32 * 1024 * 1024))
+
+# Escrituras entre limpiezas de filas caducadas
+_TRIM_EVERY = 200
+
+_SCHEMA = (
+    """
+    CREATE TABLE IF NOT EXISTS cache (
+        namespace TEXT NOT NULL,
+        key TEXT NOT NULL,
+        expires REAL NOT NULL,
+        value BLOB NOT NULL,
+        PRIMARY KEY (namespace, key)
+    ) WITHOUT ROWID
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS locks (
+        name TEXT PRIMARY KEY,
+        token TEXT NOT NULL,
+        expires REAL NOT NULL
+    ) WITHOUT ROWID
+    """,
+)
+
+
+class SharedCache(CacheBackend):
+    """Backend con TTL en una base SQLite compartida entre los procesos de la máquina"""
+
+    name = 'sqlite'
+
+    def __init__(self, path: str, max_bytes: int = SHARED_CACHE_MAX_BYTES):
+        """
+        Inicializa la cache (la conexión se abre en el primer uso de cada hilo)
+
+        Args:
+            path: Fichero de la base de datos
+            max_bytes: Tamaño máximo aproximado de los valores guardados
+        """
+        super().__init__()
+        self.path = path
+        self.max_bytes = max_bytes
+        self._local = threading.local()
+        self._writes = 0
+        self._writes_lock = threading.Lock()
+
+    def _connection(self) -> sqlite3.Connection:
+        """Conexión de este hilo (se abre de nuevo tras un fork)"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or self._local.pid != os.getpid():
+            if not os.path.exists(self.path):
+                # Crear el fichero con permisos 0600 antes de que lo haga SQLite
+                os.close(os.open(self.path, os.O_CREAT | os.O_WRONLY, 0o600))
+            conn = sqlite3.connect(self.path, timeout=1.0, isolation_level=None, check_same_thread=False)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            for statement in _SCHEMA:
+                conn.execute(statement)
+            self._local.conn, self._local.pid = conn, os.getpid()
+        return conn
+
+    def _get(self, namespace: str, digest: str) -> Optional[bytes]:
+        row = self._connection().execute(
+            'SELECT value FROM cache WHERE namespace = ? AND key = ? AND expires > ?',
+            (namespace, digest, time.time())).fetchone()
+        return row[0] if row else None
+
+    def _set(self, namespace: str, digest: str, data: bytes, expires: float) -> None:
+        self._connection().execute(
+            'INSERT OR REPLACE INTO cache (namespace, key, expires, value) VALUES (?, ?, ?, ?)',
+            (namespace, digest, expires, data))
+        with self._writes_lock:
+            self._writes += 1
+            trim = self._writes % _TRIM_EVERY == 0
+        if trim:
+            self.trim()
+
+    def _delete(self, namespace: str, digest: str) -> None:
+        self._connection().execute('DELETE FROM cache WHERE namespace = ? AND key = ?', (namespace, digest))
+
+    def _acquire(self, name: str, token: str, expires: float) -> bool:
+        # Inserta el cerrojo o reemplaza uno caducado en una sola sentencia
+        cursor = self._connection().execute(
+            'INSERT INTO locks (name, token, expires) VALUES (?, ?, ?) '
+            'ON CONFLICT (name) DO UPDATE SET token = excluded.token, expires = excluded.expires '
+            'WHERE locks.expires <= ?', (name, token, expires, time.time()))
+        return cursor.rowcount == 1
+
+    def _release(self, name: str, token: str) -> None:
+        self._connection().execute('DELETE FROM locks WHERE name = ? AND token = ?', (name, token))
+
+    def trim(self) -> None:
+        """Borra las filas caducadas y, si se supera el máximo, las que caducan antes"""
+        try:
+            conn = self._connection()
+            now = time.time()
+            conn.execute('DELETE FROM locks WHERE expires <= ?', (now,))
+            evicted = conn.execute('DELETE FROM cache WHERE expires <= ?', (now,)).rowcount
+            total = conn.execute('SELECT COALESCE(SUM(LENGTH(value)), 0) FROM cache').fetchone()[0]
+            if total > self.max_bytes:
+                excess = total - int(self.max_bytes * 0.9)
+                removed = 0
+                victims = []
+                for namespace, key, size in conn.execute(
+                        'SELECT namespace, key, LENGTH(value) FROM cache ORDER BY expires').fetchall():
+                    if removed >= excess:
+                        break
+                    victims.append((namespace, key))
+                    removed += size
+                conn.executemany('DELETE FROM cache WHERE namespace = ? AND key = ?', victims)
+                evicted += len(victims)
+        except sqlite3.Error as e:
+            self._error('limpiar', e)
+            return
+        if evicted:
+            logger.debug("Cache compartida: %d entradas eliminadas", evicted)
+
+    def _clear(self) -> None:
+        self._connection().execute('DELETE FROM cache')
+
+    def _report(self) -> Dict[str, Any]:
+        rows = self._connection().execute(
+            'SELECT namespace, COUNT(*), COALESCE(SUM(LENGTH(value)), 0) FROM cache GROUP BY namespace').fetchall()
+        return {'path': self.path, 'max_bytes': self.max_bytes,
+                'namespaces': {namespace: {'entries': count, 'bytes': size} for namespace, count, size in rows},
+                'entries': sum(count for _, count, _ in rows), 'bytes': sum(size for _, _, size in rows)}
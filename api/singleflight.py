@@ -0,0 +1,157 @@
+"""
+Single-flight: peticiones idénticas simultáneas comparten una sola ejecución
+"""
+import os
+import logging
+import threading
+from typing import Any, Awaitable, Callable, Dict, Hashable, Optional, Tuple, TYPE_CHECKING
+
+if TYPE_CHECKING:
+    import asyncio
+
+logger = logging.getLogger(__name__)
+
+# Espera máxima de las peticiones que se suman a una ejecución en curso (segundos)
+SINGLEFLIGHT_TIMEOUT = float(os.getenv('SINGLEFLIGHT_TIMEOUT', 15))
+
+
+class SingleFlightTimeout(Exception):
+    """La ejecución compartida no terminó dentro del plazo de espera"""
+
+
+class _Call:
+    """Ejecución en curso de una clave"""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result: Any = None
+        self.error: BaseException = None
+        self.waiters = 0
+
+
+class SingleFlight:
+    """
+    Agrupa llamadas concurrentes con la misma clave: la primera ejecuta la función
+    y las demás esperan y reciben su mismo resultado (o su misma excepción).
+    Al terminar, la clave se libera; no es una cache.
+    """
+
+    def __init__(self, timeout: Optional[float] = SINGLEFLIGHT_TIMEOUT):
+        """
+        Args:
+            timeout: Segundos que esperan las demás llamadas (None = sin límite)
+        """
+        self.timeout = timeout
+        self._calls: Dict[Hashable, _Call] = {}
+        self._lock = threading.Lock()
+        self._counters = {'executed': 0, 'shared': 0, 'timed_out': 0}
+
+    def do(self, key: Hashable, function: Callable[[], Any]) -> Tuple[Any, bool]:
+        """
+        Ejecuta la función una sola vez por clave entre las llamadas simultáneas
+
+        Args:
+            key: Clave que identifica el trabajo
+            function: Función sin argumentos a ejecutar
+
+        Returns:
+            Tupla (resultado, compartido) donde compartido indica que el resultado
+            lo calculó otra petición
+
+        Raises:
+            SingleFlightTimeout: si la ejecución de otra petición no termina a tiempo
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            if call is not None:
+                call.waiters += 1
+                self._counters['shared'] += 1
+                leader = False
+            else:
+                call = self._calls[key] = _Call()
+                self._counters['executed'] += 1
+                leader = True
+
+        if not leader:
+            if not call.done.wait(self.timeout):
+                with self._lock:
+                    self._counters['timed_out'] += 1
+                raise SingleFlightTimeout(f"Sin resultado tras {self.timeout:g} s esperando otra petición")
+            if call.error is not None:
+                raise call.error
+            return call.result, True
+
+        try:
+            call.result = function()
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+            if call.waiters:
+                logger.debug("Single-flight: %s peticiones compartieron el resultado", call.waiters)
+        return call.result, False
+
+    def stats(self) -> Dict[str, int]:
+        """Ejecuciones reales, peticiones servidas con un resultado compartido y claves en curso"""
+        with self._lock:
+            return dict(self._counters, in_flight=len(self._calls))
+
+
+class AsyncSingleFlight:
+    """
+    Variante para asyncio de SingleFlight: la primera corrutina ejecuta el trabajo y
+    las demás esperan su futuro. Solo se usa desde el bucle de eventos (sin locks).
+    """
+
+    def __init__(self, timeout: Optional[float] = SINGLEFLIGHT_TIMEOUT):
+        """
+        Args:
+            timeout: Segundos que esperan las demás corrutinas (None = sin límite)
+        """
+        self.timeout = timeout
+        self._calls: Dict[Hashable, 'asyncio.Future'] = {}
+        self._counters = {'executed': 0, 'shared': 0, 'timed_out': 0}
+
+    async def do(self, key: Hashable, function: Callable[[], Awaitable[Any]]) -> Tuple[Any, bool]:
+        """
+        Ejecuta la corrutina una sola vez por clave entre las llamadas simultáneas
+
+        Args:
+            key: Clave que identifica el trabajo
+            function: Función sin argumentos que devuelve la corrutina a ejecutar
+
+        Returns:
+            Tupla (resultado, compartido) igual que SingleFlight.do
+        """
+        import asyncio
+        future = self._calls.get(key)
+        if future is not None:
+            self._counters['shared'] += 1
+            # shield: si se cancela o vence la espera de un cliente, el trabajo sigue para los demás
+            try:
+                return await asyncio.wait_for(asyncio.shield(future), self.timeout), True
+            except asyncio.TimeoutError:
+                self._counters['timed_out'] += 1
+                raise SingleFlightTimeout(f"Sin resultado tras {self.timeout:g} s esperando otra petición")
+
+        future = self._calls[key] = asyncio.get_running_loop().create_future()
+        self._counters['executed'] += 1
+        try:
+            result = await function()
+        except BaseException as e:
+            future.set_exception(e)
+            # Recuperar la excepción para que asyncio no avise si nadie esperaba
+            future.exception()
+            raise
+        else:
+            future.set_result(result)
+        finally:
+            del self._calls[key]
+        return result, False
+
+    def stats(self) -> Dict[str, int]:
+        """Ejecuciones reales, peticiones servidas con un resultado compartido y claves en curso"""
+        return dict(self._counters, in_flight=len(self._calls))
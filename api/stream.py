@@ -0,0 +1,265 @@
+"""
+Difusión de cambios de reproducción por Server-Sent Events
+
+Todos los suscriptores de un mismo servidor y usuario comparten un único sondeo a
+Plex; solo se envía un evento cuando cambia la huella de lo que muestra el badge.
+"""
+import os
+import json
+import logging
+import threading
+from typing import Any, Callable, Dict, Hashable, Iterator, AsyncIterator, Optional
+from api.cache import session_fingerprint
+
+logger = logging.getLogger(__name__)
+
+# Intervalo de sondeo a Plex mientras haya suscriptores
+STREAM_POLL_SECONDS = float(os.getenv('STREAM_POLL_SECONDS', 5))
+# Comentario de latido para mantener viva la conexión (y detectar clientes desconectados)
+STREAM_HEARTBEAT_SECONDS = float(os.getenv('STREAM_HEARTBEAT_SECONDS', 15))
+# Suscriptores simultáneos admitidos en el proceso
+STREAM_MAX_SUBSCRIBERS = int(os.getenv('STREAM_MAX_SUBSCRIBERS', 100))
+# Espera sugerida al navegador antes de reconectar (campo retry de SSE)
+STREAM_RETRY_MS = 5000
+
+
+class StreamFull(Exception):
+    """Se alcanzó el máximo de suscriptores simultáneos"""
+
+
+def compact_event(session_data: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+    """
+    Datos visibles de la sesión para el evento (sin URLs: llevan el token de Plex)
+
+    Returns:
+        Diccionario con fingerprint, playing y, si hay sesión, título, subtítulo y estado
+    """
+    fingerprint = session_fingerprint(session_data)
+    if not session_data:
+        return {'fingerprint': fingerprint, 'playing': False}
+    media_type = session_data.get('type')
+    if media_type == 'track':
+        subtitle = session_data.get('artist')
+    elif media_type == 'episode':
+        subtitle = session_data.get('show_title')
+    else:
+        subtitle = session_data.get('year')
+    return {
+        'fingerprint': fingerprint,
+        'playing': session_data.get('state') == 'playing',
+        'state': session_data.get('state'),
+        'type': media_type,
+        'title': session_data.get('title'),
+        'subtitle': subtitle,
+        'album': session_data.get('album'),
+        'user': session_data.get('user'),
+    }
+
+
+def format_event(event: Dict[str, Any]) -> str:
+    """Evento SSE 'now-playing' cuyo id es la huella (válido entre reinicios y procesos)"""
+    data = json.dumps(event, ensure_ascii=False, separators=(',', ':'))
+    return f"id: {event['fingerprint']}\nevent: now-playing\ndata: {data}\n\n"
+
+
+HEARTBEAT = ": ping\n\n"
+
+
+class NowPlayingFeed:
+    """Estado compartido de una clave (token, usuario), actualizado por un hilo de sondeo"""
+
+    def __init__(self, key: Hashable, fetch: Callable[[], Optional[Dict[str, Any]]], poll_seconds: float):
+        self.key = key
+        self.fetch = fetch
+        self.poll_seconds = poll_seconds
+        self.event: Optional[Dict[str, Any]] = None
+        self.version = 0
+        self.subscribers = 0
+        self._cond = threading.Condition()
+        self._async_waiters = set()
+        self._thread: Optional[threading.Thread] = None
+
+    def _start(self) -> None:
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(target=self._run, name='sse-poll', daemon=True)
+            self._thread.start()
+
+    def _run(self) -> None:
+        """Sondea Plex mientras haya suscriptores y publica solo los cambios"""
+        while True:
+            with self._cond:
+                if self.subscribers == 0:
+                    self._thread = None
+                    return
+            try:
+                event = compact_event(self.fetch())
+            except Exception as e:
+                logger.warning("Error consultando Plex para el stream: %s", e)
+            else:
+                if self.event is None or event['fingerprint'] != self.event['fingerprint']:
+                    self._publish(event)
+            with self._cond:
+                # Se despierta antes si se va el último suscriptor
+                self._cond.wait_for(lambda: self.subscribers == 0, timeout=self.poll_seconds)
+
+    def _publish(self, event: Dict[str, Any]) -> None:
+        with self._cond:
+            self.event = event
+            self.version += 1
+            self._cond.notify_all()
+            waiters = list(self._async_waiters)
+        for loop, changed in waiters:
+            loop.call_soon_threadsafe(changed.set)
+        logger.debug("Stream: nuevo estado %s para %s suscriptores", event['fingerprint'], self.subscribers)
+
+    def wait(self, version: int, timeout: float) -> bool:
+        """Espera (bloqueando) a que haya una versión posterior; False si vence el plazo"""
+        with self._cond:
+            return self._cond.wait_for(lambda: self.version > version, timeout=timeout)
+
+    async def wait_async(self, version: int, timeout: float) -> bool:
+        """Como wait(), sin bloquear el bucle de eventos"""
+        import asyncio
+        changed = asyncio.Event()
+        waiter = (asyncio.get_running_loop(), changed)
+        with self._cond:
+            if self.version > version:
+                return True
+            self._async_waiters.add(waiter)
+        try:
+            await asyncio.wait_for(changed.wait(), timeout)
+            return True
+        except asyncio.TimeoutError:
+            return self.version > version
+        finally:
+            with self._cond:
+                self._async_waiters.discard(waiter)
+
+
+class Subscription:
+    """Alta de un suscriptor en un feed; close() es idempotente"""
+
+    def __init__(self, hub: 'NowPlayingHub', feed: NowPlayingFeed):
+        self.hub = hub
+        self.feed = feed
+        self._closed = False
+        self._lock = threading.Lock()
+
+    def close(self) -> None:
+        """Da de baja al suscriptor (también si el stream nunca llegó a empezar)"""
+        with self._lock:
+            if self._closed:
+                return
+            self._closed = True
+        self.hub._release(self.feed)
+
+
+class NowPlayingHub:
+    """Registro de feeds por clave con límite global de suscriptores"""
+
+    def __init__(self, max_subscribers: int = STREAM_MAX_SUBSCRIBERS, poll_seconds: float = STREAM_POLL_SECONDS,
+                 heartbeat_seconds: float = STREAM_HEARTBEAT_SECONDS):
+        self.max_subscribers = max_subscribers
+        self.poll_seconds = poll_seconds
+        self.heartbeat_seconds = heartbeat_seconds
+        self._feeds: Dict[Hashable, NowPlayingFeed] = {}
+        self._subscribers = 0
+        self._lock = threading.Lock()
+        self._counters = {'subscribed': 0, 'rejected': 0, 'events': 0}
+
+    def subscribe(self, key: Hashable, fetch: Callable[[], Optional[Dict[str, Any]]]) -> Subscription:
+        """
+        Registra un suscriptor en el feed de la clave (lo crea y arranca si hace falta)
+
+        Args:
+            key: Clave del feed (servidor y usuario)
+            fetch: Función sin argumentos que devuelve la sesión actual; solo se usa
+                si el feed es nuevo
+
+        Raises:
+            StreamFull: si ya hay max_subscribers conexiones abiertas
+        """
+        with self._lock:
+            if self._subscribers >= self.max_subscribers:
+                self._counters['rejected'] += 1
+                raise StreamFull(f"Máximo de {self.max_subscribers} suscriptores alcanzado")
+            feed = self._feeds.get(key)
+            if feed is None:
+                feed = self._feeds[key] = NowPlayingFeed(key, fetch, self.poll_seconds)
+            self._subscribers += 1
+            self._counters['subscribed'] += 1
+            with feed._cond:
+                feed.subscribers += 1
+                feed._start()
+        return Subscription(self, feed)
+
+    def _release(self, feed: NowPlayingFeed) -> None:
+        """Da de baja un suscriptor; el feed sin suscriptores se descarta"""
+        with self._lock:
+            self._subscribers -= 1
+            with feed._cond:
+                feed.subscribers -= 1
+                feed._cond.notify_all()
+                if feed.subscribers == 0 and self._feeds.get(feed.key) is feed:
+                    del self._feeds[feed.key]
+
+    def _pending_event(self, feed: NowPlayingFeed, version: int, last_id: Optional[str]) -> tuple:
+        """Evento a enviar tras una espera (o None) y versión vista"""
+        with feed._cond:
+            event, current = feed.event, feed.version
+        if current <= version or event is None:
+            return None, version
+        if last_id is not None and event['fingerprint'] == last_id:
+            # El cliente ya tiene este estado (reconexión con Last-Event-ID)
+            return None, current
+        return event, current
+
+    def events(self, subscription: Subscription, last_id: Optional[str] = None) -> Iterator[str]:
+        """
+        Genera el stream SSE de un suscriptor (servidores con un hilo por petición)
+
+        El estado actual se envía al conectar salvo que coincida con Last-Event-ID;
+        después, un evento por cambio y un latido si no hay cambios. Al cerrarse el
+        generador (cliente desconectado) se da de baja al suscriptor.
+        """
+        feed = subscription.feed
+        try:
+            yield f"retry: {STREAM_RETRY_MS}\n\n"
+            version = 0
+            while True:
+                event, version = self._pending_event(feed, version, last_id)
+                if event is not None:
+                    self._count_event()
+                    last_id = None
+                    yield format_event(event)
+                elif not feed.wait(version, self.heartbeat_seconds):
+                    yield HEARTBEAT
+        finally:
+            subscription.close()
+
+    async def aevents(self, subscription: Subscription, last_id: Optional[str] = None) -> AsyncIterator[str]:
+        """Versión asyncio de events() para el punto de entrada ASGI"""
+        feed = subscription.feed
+        try:
+            yield f"retry: {STREAM_RETRY_MS}\n\n"
+            version = 0
+            while True:
+                event, version = self._pending_event(feed, version, last_id)
+                if event is not None:
+                    self._count_event()
+                    last_id = None
+                    yield format_event(event)
+                elif not await feed.wait_async(version, self.heartbeat_seconds):
+                    yield HEARTBEAT
+        finally:
+            subscription.close()
+
+    def _count_event(self) -> None:
+        with self._lock:
+            self._counters['events'] += 1
+
+    def stats(self) -> Dict[str, Any]:
+        """Suscriptores conectados, feeds activos y eventos enviados"""
+        with self._lock:
+            return dict(self._counters, subscribers=self._subscribers, feeds=len(self._feeds),
+                        max_subscribers=self.max_subscribers)
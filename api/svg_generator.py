@@ -4,39 +4,77 @@ Generador de SVG animados para Plex2Sign
 import os
 import io
 import logging
-import requests
-import base64
 from typing import Dict, Any, Optional, List, Tuple
 from datetime import timedelta
-from colorthief import ColorThief
-from PIL import Image
+from api.themes import THEMES, DEFAULT_THEME
+from api.svg_templates import get_template, slot
+from api.artwork import get_decoded_artwork, get_embedded_artwork
+from api.animation import equalizer_bar_params
+from api.metrics import stage
+from api import disk_cache
 
 logger = logging.getLogger(__name__)
 
+# Carátula embebida: tamaño en pantalla, factor HiDPI, formato con pérdida y calidad
+ARTWORK_DISPLAY_SIZE = 80
+ARTWORK_SCALE = float(os.getenv('SVG_ARTWORK_SCALE', 1))
+ARTWORK_FORMAT = os.getenv('SVG_ARTWORK_FORMAT', 'jpeg').lower()
+ARTWORK_QUALITY = int(os.getenv('SVG_ARTWORK_QUALITY', 80))
+
+# Modos del ecualizador: 'compact' (CSS) o 'smil'
+EQUALIZER_MODES = ('compact', 'smil')
+# Modo del ecualizador por defecto
+SVG_EQUALIZER_MODE = os.getenv('SVG_EQUALIZER_MODE', 'compact').strip().lower()
+if SVG_EQUALIZER_MODE not in EQUALIZER_MODES:
+    SVG_EQUALIZER_MODE = 'compact'
+
+# Colores del degradado del ecualizador cuando no se pueden extraer de la carátula
+FALLBACK_GRADIENT_COLORS = [
+    (122, 216, 255),  # #7ad8ff
+    (94, 255, 105),   # #5eff69
+    (120, 255, 140),  # #78ff8c
+    (122, 216, 255)   # #7ad8ff
+]
+
+
+def normalize_equalizer_mode(value: Optional[str]) -> str:
+    """Convierte el parámetro `equalizer=` en un modo admitido (SVG_EQUALIZER_MODE si no lo es)"""
+    mode = str(value or '').strip().lower()
+    return mode if mode in EQUALIZER_MODES else SVG_EQUALIZER_MODE
+
 
 class SVGGenerator:
 
     def _extract_colors_from_image(self, image_url: str, num_colors: int = 4) -> Optional[List[Tuple[int, int, int]]]:
         """Extrae los colores dominantes de una imagen usando ColorThief."""
+        # Paleta calculada en un arranque anterior (con almacén persistente)
+        palette = disk_cache.load_json('palettes', (image_url, num_colors))
+        if palette:
+            return [tuple(color) for color in palette]
+        # Importación diferida: colorthief arrastra PIL y solo hace falta con carátula
+        from colorthief import ColorThief
         try:
-            response = requests.get(image_url, timeout=5)
-            response.raise_for_status()
-            img = Image.open(io.BytesIO(response.content))
-            img = img.convert('RGB')
-            with io.BytesIO() as buf:
-                img.save(buf, format='PNG')
-                buf.seek(0)
-                ct = ColorThief(buf)
-                palette = ct.get_palette(color_count=num_colors)
+            # La copia ya decodificada a tamaño de render basta para la paleta
+            img = get_decoded_artwork(image_url)
+            if img is None:
+                return None
+            with stage('palette'):
+                img = img.convert('RGB')
+                with io.BytesIO() as buf:
+                    img.save(buf, format='PNG')
+                    buf.seek(0)
+                    ct = ColorThief(buf)
+                    palette = ct.get_palette(color_count=num_colors)
+            disk_cache.save_json('palettes', (image_url, num_colors), palette)
             return palette
         except Exception as e:
-            logger.warning(f"No se pudieron extraer colores de la imagen: {e}")
+            logger.warning("No se pudieron extraer colores de la imagen: %s", e)
             return None
 
     def _create_dynamic_gradient(self, colors: List[Tuple[int, int, int]], gradient_id: str = "barGradient") -> str:
         """Crea un gradiente SVG <linearGradient> a partir de una lista de colores RGB."""
         if not colors:
-            colors = [(122, 216, 255), (94, 255, 105), (120, 255, 140), (122, 216, 255)]
+            colors = FALLBACK_GRADIENT_COLORS
         stops = []
         n = len(colors)
         for i, color in enumerate(colors):
@@ -67,64 +105,28 @@ class SVGGenerator:
             return f"{hours}:{minutes:02d}:{secs:02d}"
         else:
             return f"{minutes}:{secs:02d}"
-    def _load_themes(self) -> Dict[str, Dict[str, Any]]:
-        """Devuelve un diccionario con temas por defecto usados por el generador.
 
-        Cada tema incluye las claves que el resto del código espera:
-        `font_family`, `text_color`, `accent_color`, `progress_bg`,
-        `progress_fg`, `font_size_title`, `font_size_subtitle`, `font_size_time`.
-        """
-        base = {
-            'font_family': 'Arial, Helvetica, sans-serif',
-            'font_size_title': '15px',
-            'font_size_subtitle': '12px',
-            'font_size_time': '11px',
-        }
-        themes = {
-            'normal': {
-                **base,
-                'text_color': '#FFFFFF',
-                'accent_color': '#7ad8ff',
-                'progress_bg': '#000000',
-                'progress_fg': '#7ad8ff'
-            },
-            'dark': {
-                **base,
-                'text_color': '#E6E6E6',
-                'accent_color': '#78ff8c',
-                'progress_bg': '#0F1720',
-                'progress_fg': '#78ff8c'
-            },
-            'minimal': {
-                **base,
-                'text_color': '#FFFFFF',
-                'accent_color': '#5eff69',
-                'progress_bg': '#111827',
-                'progress_fg': '#5eff69'
-            }
-        }
-        return themes
+    def _load_themes(self) -> Dict[str, Dict[str, Any]]:
+        """Devuelve el registro de temas compartido por el proceso (ver api/themes.py)."""
+        return THEMES
 
-    def __init__(self, width: int = 400, height: int = 90, theme: str = 'minimal'):
+    def __init__(self, width: int = 400, height: int = 90, theme: str = 'minimal', equalizer_mode: Optional[str] = None):
         self.width = width
         self.height = height
         self.theme = theme
+        # 'compact' (animaciones CSS compartidas) o 'smil' (tres <animate> por barra)
+        self.equalizer_mode = normalize_equalizer_mode(equalizer_mode)
         self.themes = self._load_themes()
+        # Nombre efectivo del tema: las plantillas se comparten por tema real
+        self.theme_name = theme if theme in self.themes else DEFAULT_THEME
     
-    def _generate_tv_svg(self, data: Dict[str, Any]) -> str:
+    def _generate_tv_svg(self, data: Dict[str, Any]) -> bytes:
         """Genera SVG para series/episodios"""
-        theme = self.themes[self.theme]
         show_title = data.get('show_title', data.get('title', 'Serie desconocida'))
         season = data.get('season', 1)
         episode = data.get('episode', 1)
         episode_title = data.get('episode_title', data.get('title', 'Episodio desconocido'))
         
-        # Información del episodio
-        
-        # Tiempos
-        current_time = self._format_duration(data.get('progress', 0))
-        total_time = self._format_duration(data.get('duration', 0))
-        
         # Thumbnail y extracción de colores para series
         thumbnail_data = ""
         extracted_colors = None
@@ -134,8 +136,24 @@ class SVGGenerator:
         
         # Estado
         is_playing = data.get('state') == 'playing'
-        state_emoji = "▶️" if is_playing else "⏸️"
         
+        # Solo se calculan los campos dinámicos; el resto viene de la plantilla compilada
+        template = get_template(self._template_key('tv'), self._tv_svg_source)
+        return template.render({
+            'emoji_animation': 'pulse 2s infinite' if is_playing else 'none',
+            'artwork': f'<image x="5" y="5" width="80" height="80" href="{thumbnail_data}" />' if thumbnail_data else '<text x="50" y="85" text-anchor="middle" style="font-size: 24px;">📺</text>',
+            'title': self._escape_xml(self._truncate_text(f"{show_title} • S{season:02d}E{episode:02d}", 55)),
+            'subtitle': self._escape_xml(self._truncate_text(episode_title, 30)),
+            'gradient': self._equalizer_gradient_def(extracted_colors),
+        })
+    
+    def _template_key(self, kind: str) -> tuple:
+        """Clave de la plantilla compilada para este generador"""
+        return (kind, self.theme_name, self.width, self.height, self.equalizer_mode)
+    
+    def _tv_svg_source(self) -> str:
+        """Texto fuente de la plantilla de series, con los huecos dinámicos marcados"""
+        theme = self.themes[self.theme_name]
         svg = f'''
         <svg width="{self.width}" height="{self.height}" xmlns="http://www.w3.org/2000/svg">
             <defs>
@@ -167,7 +185,7 @@ class SVGGenerator:
                     }}
                     .state-emoji {{
                         font-size: 16px;
-                        animation: {'pulse 2s infinite' if is_playing else 'none'};
+                        animation: {slot('emoji_animation')};
                     }}
                     @keyframes progress-slide {{
                         0% {{ opacity: 0.6; }}
@@ -184,8 +202,7 @@ class SVGGenerator:
             
             <!-- Thumbnail placeholder o imagen -->
             <rect x="5" y="5" width="80" height="80" rx="8" fill="transparent" opacity="0.0"/>
-            {f'<image x="5" y="5" width="80" height="80" href="{thumbnail_data}" />' if thumbnail_data else ''}
-            {f'<text x="50" y="85" text-anchor="middle" style="font-size: 24px;">📺</text>' if not thumbnail_data else ''}
+            {slot('artwork')}
             
             <!-- Área de recorte para texto (igual que música) -->
             <defs>
@@ -197,31 +214,37 @@ class SVGGenerator:
             <!-- Información del episodio con posiciones iguales a música -->
             <g clip-path="url(#textClipTV)">
                 <text x="95" y="16" class="show-title">
-                    {self._escape_xml(self._truncate_text(f"{show_title} • S{season:02d}E{episode:02d}", 55))}
+                    {slot('title')}
                 </text>
                 <text x="95" y="36" class="episode-info">
-                    {self._escape_xml(self._truncate_text(episode_title, 30))}
+                    {slot('subtitle')}
                 </text>
             </g>
             
             <!-- Ecualizador estilo Spotify (solo cuando reproduce) -->
-            {self._generate_enhanced_equalizer_bars(theme, is_playing, 95, 56, extracted_colors, 300)}
+            {slot('gradient')}{self._equalizer_markup(95, 56)}
             
         </svg>
         '''
-        return svg.strip()
+        return svg
 
     def generate_now_playing_svg(self, data: Optional[Dict[str, Any]]) -> str:
-        """Public API: genera el SVG apropiado según el tipo de contenido.
+        """Public API: genera el SVG apropiado según el tipo de contenido (como texto).
+
+        Equivale a render_now_playing_svg() decodificado; ver allí los detalles.
+        """
+        return self.render_now_playing_svg(data).decode('utf-8')
+    
+    def render_now_playing_svg(self, data: Optional[Dict[str, Any]]) -> bytes:
+        """Genera el SVG apropiado según el tipo de contenido, en bytes UTF-8.
 
         - Si `data` es None o no contiene `type`, devuelve un SVG 'idle'.
         - Si `type` es 'track' -> música, 'episode' -> TV, 'movie' -> película.
         """
         try:
             if not data:
-                # Simple idle SVG
-                theme = self._load_themes().get(self.theme, self._load_themes()['minimal'])
-                return f"<svg width=\"{self.width}\" height=\"{self.height}\" xmlns=\"http://www.w3.org/2000/svg\"><rect width=\"100%\" height=\"100%\" fill=\"{theme['progress_bg']}\"/><text x=\"50%\" y=\"50%\" dominant-baseline=\"middle\" text-anchor=\"middle\" fill=\"{theme['text_color']}\">⏸️ Sin actividad</text></svg>"
+                # Simple idle SVG (sin campos dinámicos)
+                return get_template(self._template_key('idle'), self._idle_svg_source).render({})
 
             content_type = data.get('type', 'track')
             if content_type == 'track':
@@ -233,32 +256,31 @@ class SVGGenerator:
             else:
                 return self._generate_generic_svg(data)
         except Exception as e:
-            logger.error(f"Error generando SVG en dispatcher: {e}")
+            logger.error("Error generando SVG en dispatcher: %s", e)
             # Fallback simple
-            return f"<svg width=\"{self.width}\" height=\"{self.height}\" xmlns=\"http://www.w3.org/2000/svg\"><text x=\"10\" y=\"20\">Error generando SVG</text></svg>"
+            return f"<svg width=\"{self.width}\" height=\"{self.height}\" xmlns=\"http://www.w3.org/2000/svg\"><text x=\"10\" y=\"20\">Error generando SVG</text></svg>".encode('utf-8')
+    
+    def _idle_svg_source(self) -> str:
+        """Texto fuente del SVG 'sin actividad'"""
+        theme = self.themes[self.theme_name]
+        return f"<svg width=\"{self.width}\" height=\"{self.height}\" xmlns=\"http://www.w3.org/2000/svg\"><rect width=\"100%\" height=\"100%\" fill=\"{theme['progress_bg']}\"/><text x=\"50%\" y=\"50%\" dominant-baseline=\"middle\" text-anchor=\"middle\" fill=\"{theme['text_color']}\">⏸️ Sin actividad</text></svg>"
     
-    def _generate_movie_svg(self, data: Dict[str, Any]) -> str:
+    def _generate_movie_svg(self, data: Dict[str, Any]) -> bytes:
         """Genera SVG para películas"""
         # Por ahora usar el mismo layout que TV
         return self._generate_tv_svg(data)
     
-    def _generate_generic_svg(self, data: Dict[str, Any]) -> str:
+    def _generate_generic_svg(self, data: Dict[str, Any]) -> bytes:
         """Genera SVG genérico"""
         return self._generate_tv_svg(data)
     
     def _generate_enhanced_equalizer_bars(self, theme: Dict[str, Any], is_playing: bool, start_x: int, start_y: int, extracted_colors: Optional[List[Tuple[int, int, int]]] = None, bar_area_width: float = 330) -> str:
         """Genera ecualizador estilo novatorem.svg"""
         # Siempre mostrar barras animadas, sin importar el estado
-        # if not is_playing:
-        #     return f'''
-        #     <g opacity="0.3">
-        #         <text x="{start_x}" y="{start_y + 15}" 
-        #               style="font-family: {theme['font_family']}; font-size: 12px; fill: {theme['text_color']};">
-        #             ⏸️ Pausado
-        #         </text>
-        #     </g>
-        #     '''
-        
+        return self._equalizer_gradient_def(extracted_colors) + self._smil_equalizer_markup(start_x, start_y)
+    
+    def _smil_equalizer_markup(self, start_x: int, start_y: int) -> str:
+        """Barras del ecualizador con tres <animate> SMIL cada una (sin el degradado)"""
         bars = []
         # Configuración para barras más gruesas
         bar_width = 2   # Más delgadas (2px)
@@ -268,38 +290,15 @@ class SVGGenerator:
         # Calcular número de barras para ocupar exactamente 300px
         pixels_per_bar = bar_width + bar_spacing  # 2px + 1px = 3px por barra
         bar_count = int(300 // pixels_per_bar)  # 300px ÷ 3px = 100 barras
-        
-        # Crear degradado dinámico basado en colores de la carátula
         gradient_id = "barGradient"
-        if extracted_colors:
-            gradient_def = f'<defs>{self._create_dynamic_gradient(extracted_colors, gradient_id)}</defs>'
-        else:
-            # Fallback a colores por defecto
-            fallback_colors = [
-                (122, 216, 255),  # #7ad8ff
-                (94, 255, 105),   # #5eff69
-                (120, 255, 140),  # #78ff8c
-                (122, 216, 255)   # #7ad8ff
-            ]
-            gradient_def = f'<defs>{self._create_dynamic_gradient(fallback_colors, gradient_id)}</defs>'
         
         # Generar barras con degradado animado
         for i in range(bar_count):
             x = start_x + i * (bar_width + bar_spacing)
             
             # Patrones de altura (pulse animation como en novatorem)
-            if i % 7 == 0:  # Barras principales
-                heights = "3;15;3;15;3;15;3"
-            elif i % 5 == 0:  # Barras secundarias
-                heights = "2;12;2;12;2;12;2"
-            elif i % 3 == 0:  # Barras medias
-                heights = "4;22;4;22;4;22;4"
-            else:  # Barras normales
-                heights = "2;10;2;10;2;10;2"
-            
-            # Timing más lento (mitad de velocidad)
-            duration = 1.6 + (i % 4) * 0.4  # Entre 1.6s y 2.8s (mitad de velocidad)
-            delay = (i * 0.05) % 1.0  # Desfase progresivo
+            low, high, duration, delay = self._equalizer_bar_params(i)
+            heights = ';'.join([str(low), str(high)] * 3 + [str(low)])
             
             # Calcular Y dinámicamente para que crezca hacia arriba
             y_values = []
@@ -329,82 +328,94 @@ class SVGGenerator:
             </rect>
             ''')
         
-        return f'{gradient_def}<g class="equalizer-container">{"".join(bars)}</g>'
+        return f'<g class="equalizer-container">{"".join(bars)}</g>'
     
-    def _get_thumbnail_base64(self, url: str, target_size: tuple = (120, 120)) -> str:
-        """Obtiene thumbnail, lo redimensiona y convierte a base64 para embeber en SVG"""
-        try:
-            from PIL import Image
-            import io
-            
-            response = requests.get(url, timeout=5)
-            response.raise_for_status()
-            
-            # Abrir imagen con PIL
-            image = Image.open(io.BytesIO(response.content))
-            
-            # Redimensionar manteniendo aspect ratio y centrando (método original)
-            image.thumbnail(target_size, Image.Resampling.LANCZOS)
-            
-            # Crear imagen cuadrada con fondo transparente si es necesario
-            if image.size != target_size:
-                new_image = Image.new('RGBA', target_size, (255, 255, 255, 0))  # Transparente
-                # Centrar la imagen redimensionada
-                paste_x = (target_size[0] - image.size[0]) // 2
-                paste_y = (target_size[1] - image.size[1]) // 2
-                new_image.paste(image, (paste_x, paste_y))
-                image = new_image
-            
-            # Procesar imagen para quitar fondo blanco de forma inteligente
-            if image.mode != 'RGBA':
-                image = image.convert('RGBA')
-            
-            # Solo procesar si la imagen es más grande que el tamaño objetivo (tiene padding)
-            # Para imágenes 80x80 (música) no procesar, para imágenes más grandes (películas/series) sí
-            if image.size[0] > target_size[0] or image.size[1] > target_size[1]:
-                # Obtener datos de píxeles
-                data = image.getdata()
-                new_data = []
-                
-                # Calcular área central que debe preservarse
-                width, height = image.size
-                center_x = width // 2
-                center_y = height // 2
-                preserve_radius = min(width, height) // 3  # Radio de área a preservar
-                
-                # Procesar cada píxel
-                for y in range(height):
-                    for x in range(width):
-                        item = data[y * width + x]
-                        
-                        # Calcular distancia al centro
-                        distance_to_center = ((x - center_x) ** 2 + (y - center_y) ** 2) ** 0.5
-                        
-                        # Si está en el área central, preservar siempre
-                        if distance_to_center <= preserve_radius:
-                            new_data.append(item)
-                        # Si está fuera del área central y es blanco, hacer transparente
-                        elif item[0] > 240 and item[1] > 240 and item[2] > 240:
-                            new_data.append((255, 255, 255, 0))  # Transparente
-                        else:
-                            new_data.append(item)
-                
-                # Aplicar los nuevos datos
-                image.putdata(new_data)
-            
-            # Convertir a base64 con fondo transparente
-            buffer = io.BytesIO()
-            image.save(buffer, format='PNG', optimize=True)
-            image_data = base64.b64encode(buffer.getvalue()).decode('utf-8')
-            
-            return f"data:image/png;base64,{image_data}"
-        except Exception as e:
-            logger.warning(f"Error procesando thumbnail para SVG: {e}")
-            return ""
+    def _equalizer_gradient_def(self, extracted_colors: Optional[List[Tuple[int, int, int]]] = None) -> str:
+        """Crea el degradado dinámico de las barras basado en colores de la carátula"""
+        # Fallback a colores por defecto
+        colors = extracted_colors or FALLBACK_GRADIENT_COLORS
+        return f'<defs>{self._create_dynamic_gradient(colors, "barGradient")}</defs>'
+    
+    def _equalizer_markup(self, start_x: int, start_y: int) -> str:
+        """Parte estática del ecualizador (sin el degradado) en el modo configurado"""
+        if self.equalizer_mode == 'smil':
+            return self._smil_equalizer_markup(start_x, start_y)
+        return self._compact_equalizer_markup(start_x, start_y)
+    
+    def _truncate_text(self, text: str, max_chars: int) -> str:
+        """Trunca texto a un número máximo de caracteres"""
+        if len(text) <= max_chars:
+            return text
+        return text[:max_chars - 3].rstrip() + "..."
+    
+    def _equalizer_bar_params(self, index: int) -> Tuple[int, int, float, float]:
+        """
+        Parámetros de animación de una barra del ecualizador
+        
+        Returns:
+            Tupla (altura mínima, altura máxima, duración en s, retardo en s)
+        """
+        return equalizer_bar_params(index)
+    
+    def _generate_equalizer_bars(self, theme: Dict[str, Any], is_playing: bool, start_x: int, start_y: int, extracted_colors: Optional[List[Tuple[int, int, int]]] = None, bar_area_width: float = 330) -> str:
+        """Genera el ecualizador en el modo configurado ('compact' o 'smil')"""
+        return self._equalizer_gradient_def(extracted_colors) + self._equalizer_markup(start_x, start_y)
     
-    def _generate_music_svg(self, data: Dict[str, Any]) -> str:
+    def _generate_compact_equalizer_bars(self, theme: Dict[str, Any], is_playing: bool, start_x: int, start_y: int, extracted_colors: Optional[List[Tuple[int, int, int]]] = None, bar_area_width: float = 330) -> str:
+        """Genera el ecualizador compacto (animaciones CSS compartidas)"""
+        return self._equalizer_gradient_def(extracted_colors) + self._compact_equalizer_markup(start_x, start_y)
+    
+    def _compact_equalizer_markup(self, start_x: int, start_y: int) -> str:
+        """
+        Genera las mismas barras que _smil_equalizer_markup, pero con animaciones
+        CSS compartidas en lugar de tres <animate> por barra.
+        
+        Cada barra tiene la altura máxima de su patrón y se escala en vertical desde
+        la base; un ciclo min-max-min de SMIL (valores a;b;a;b;a;b;a) equivale a una
+        animación lineal de un tercio de la duración.
+        """
+        bar_width = 2
+        bar_spacing = 1
+        base_y_fixed = start_y + 25
+        bar_count = int(300 // (bar_width + bar_spacing))
+        gradient_id = "barGradient"
+        
+        # Clases compartidas: patrón de altura (keyframes), duración y retardo
+        patterns = {}
+        durations = {}
+        delays = {}
+        bars = []
+        for i in range(bar_count):
+            low, high, duration, delay = self._equalizer_bar_params(i)
+            # Patrones con la misma proporción mínimo/máximo comparten keyframes
+            pattern = patterns.setdefault(round(low / high, 3), f"p{len(patterns)}")
+            duration_class = durations.setdefault(round(duration, 2), f"d{len(durations)}")
+            delay_class = delays.setdefault(round(delay, 2), f"l{len(delays)}")
+            x = start_x + i * (bar_width + bar_spacing)
+            bars.append(f'<rect x="{x}" y="{base_y_fixed - high}" width="{bar_width}" height="{high}" class="{pattern} {duration_class} {delay_class}"/>')
+        
+        rules = ['.eq rect{transform-box:fill-box;transform-origin:50% 100%;'
+                 'animation-timing-function:linear;animation-iteration-count:infinite;'
+                 'animation-fill-mode:backwards}']
+        for scale, name in patterns.items():
+            rules.append(f'@keyframes {name}{{0%,100%{{transform:scaleY({scale});opacity:.35}}'
+                         f'50%{{transform:scaleY(1);opacity:.95}}}}.{name}{{animation-name:{name}}}')
+        for duration, name in durations.items():
+            rules.append(f'.{name}{{animation-duration:{round(duration / 3, 3)}s}}')
+        for delay, name in delays.items():
+            rules.append(f'.{name}{{animation-delay:{delay}s}}')
+        
+        return (f'<defs><style>{"".join(rules)}</style></defs>'
+                f'<g class="equalizer-container eq" fill="url(#{gradient_id})">{"".join(bars)}</g>')
+    
+    def _get_thumbnail_base64(self, url: str, target_size: Optional[tuple] = None) -> str:
+        """Obtiene thumbnail al tamaño de visualización y lo convierte a data URI para embeber en SVG"""
+        # 80x80 en pantalla (x2/x3 con SVG_ARTWORK_SCALE para pantallas HiDPI)
+        size = max(target_size) if target_size else int(ARTWORK_DISPLAY_SIZE * ARTWORK_SCALE)
+        return get_embedded_artwork(url, size, ARTWORK_FORMAT, ARTWORK_QUALITY)
+    
+    def _generate_music_svg(self, data: Dict[str, Any]) -> bytes:
         """Genera SVG para música con animaciones"""
-        theme = self.themes[self.theme]
         # Información de la canción
         track_title = data.get('track_title', data.get('title', 'Canción desconocida'))
         artist = data.get('artist', 'Artista desconocido')
@@ -413,28 +424,30 @@ class SVGGenerator:
         artist_album_text = f"{artist} • {album}"
         max_chars_visible = 41  # Caracteres que caben sin scroll
         # Con 400px de ancho, podemos mostrar más texto sin marquee
-        # Barras ocupan TODO el ancho disponible (400px total)
-        bar_area_width = 300  # 400px - 80px portada - 20px gap = 300px
         # Determinar si necesita animación marquee
         title_needs_marquee = len(track_title) > max_chars_visible
         artist_needs_marquee = len(artist_album_text) > max_chars_visible
-        # Progreso
-        progress = 0
-        if data.get('duration', 0) > 0:
-            progress = (data.get('progress', 0) / data['duration']) * 100
-        # Tiempos
-        current_time = self._format_duration(data.get('progress', 0))
-        total_time = self._format_duration(data.get('duration', 0))
         # Thumbnail: usar solo la URL de Plex
         thumbnail_data = ""
         extracted_colors = None
         if data.get('thumb'):
             thumbnail_data = self._get_thumbnail_base64(data['thumb'])
             extracted_colors = self._extract_colors_from_image(data['thumb'])
-        # Estado
-        is_playing = data.get('state') == 'playing'
-        state_emoji = "▶️" if is_playing else "⏸️"
-        # Las barras de ecualizador se generan directamente en el SVG
+        # Solo se calculan los campos dinámicos; el resto viene de la plantilla compilada
+        template = get_template(self._template_key('music'), self._music_svg_source)
+        return template.render({
+            'artwork': f'<image x="5" y="5" width="80" height="80" href="{thumbnail_data}" />' if thumbnail_data else '<text x="50" y="85" text-anchor="middle" style="font-size: 24px;">🎵</text>',
+            'title': self._escape_xml(track_title),
+            'title_marquee': f'<animate attributeName="x" values="95;{95 - len(track_title) * 4 + 95};95" dur="12s" repeatCount="indefinite"/>' if title_needs_marquee else '',
+            'subtitle': self._escape_xml(artist_album_text),
+            'subtitle_marquee': f'<animate attributeName="x" values="95;{95 - len(artist_album_text) * 4 + 95};95" dur="15s" repeatCount="indefinite"/>' if artist_needs_marquee else '',
+            'gradient': self._equalizer_gradient_def(extracted_colors),
+        })
+    
+    def _music_svg_source(self) -> str:
+        """Texto fuente de la plantilla de música, con los huecos dinámicos marcados"""
+        theme = self.themes[self.theme_name]
+        # Barras ocupan TODO el ancho disponible: 400px - 80px portada - 20px gap = 300px
         svg = f'''
 <svg width="{self.width}" height="{self.height}" xmlns="http://www.w3.org/2000/svg">
     <defs>
@@ -482,8 +495,7 @@ class SVGGenerator:
     </defs>
     <!-- Thumbnail placeholder o imagen -->
     <rect x="5" y="5" width="80" height="80" rx="8" fill="{theme['progress_bg']}" opacity="0.2"/>
-    {f'<image x="5" y="5" width="80" height="80" href="{thumbnail_data}" />' if thumbnail_data else ''}
-    {f'<text x="50" y="85" text-anchor="middle" style="font-size: 24px;">🎵</text>' if not thumbnail_data else ''}
+    {slot('artwork')}
     <!-- Área de recorte para texto (más ancha con 450px) -->
     <defs>
         <clipPath id="textClip">
@@ -493,19 +505,19 @@ class SVGGenerator:
     <!-- Información de la canción con marquee inteligente -->
     <g clip-path="url(#textClip)">
         <text x="95" y="16" class="song-title fade-in">
-            {self._escape_xml(track_title)}
-            {f'<animate attributeName="x" values="95;{95 - len(track_title) * 4 + 95};95" dur="12s" repeatCount="indefinite"/>' if title_needs_marquee else ''}
+            {slot('title')}
+            {slot('title_marquee')}
         </text>
         <text x="95" y="36" class="song-info fade-in">
-            {self._escape_xml(artist_album_text)}
-            {f'<animate attributeName="x" values="95;{95 - len(artist_album_text) * 4 + 95};95" dur="15s" repeatCount="indefinite"/>' if artist_needs_marquee else ''}
+            {slot('subtitle')}
+            {slot('subtitle_marquee')}
         </text>
     </g>
     <!-- Ecualizador estilo Spotify (solo cuando reproduce) -->
-    {self._generate_enhanced_equalizer_bars(theme, is_playing, 95, 56, extracted_colors, 300)}
+    {slot('gradient')}{self._equalizer_markup(95, 56)}
 </svg>
         '''
-        return svg.strip()
+        return svg
     
     def _interpolate_color(self, color1: Tuple[int, int, int], color2: Tuple[int, int, int], ratio: float) -> Tuple[int, int, int]:
         """Interpola entre dos colores RGB"""
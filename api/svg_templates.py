@@ -0,0 +1,82 @@
+"""
+Plantillas SVG precompiladas en segmentos de bytes
+"""
+import re
+import threading
+from typing import Dict, List, Callable, Hashable
+from api.diagnostics import register_cache
+
+# Los huecos dinámicos se marcan en el texto fuente como \x00nombre\x00,
+# un carácter que nunca aparece en un SVG válido
+_SLOT_PATTERN = re.compile('\x00(\\w+)\x00')
+
+
+def slot(name: str) -> str:
+    """Devuelve el marcador de un hueco dinámico para usar en el texto fuente"""
+    return f'\x00{name}\x00'
+
+
+class SVGTemplate:
+    """Plantilla compilada: segmentos estáticos en bytes intercalados con huecos"""
+
+    def __init__(self, source: str):
+        """
+        Compila la plantilla
+
+        Args:
+            source: Texto SVG con los huecos marcados mediante slot()
+        """
+        parts = _SLOT_PATTERN.split(source.strip())
+        # split() alterna texto estático y nombres de hueco: [s0, n0, s1, n1, ..., sN]
+        self.segments: List[bytes] = [part.encode('utf-8') for part in parts[0::2]]
+        self.slots: List[str] = parts[1::2]
+
+    def render(self, fields: Dict[str, str]) -> bytes:
+        """
+        Rellena los huecos con los valores dados (ya escapados)
+
+        Args:
+            fields: Valor de cada hueco; los que falten quedan vacíos
+
+        Returns:
+            SVG completo en bytes
+        """
+        out = [self.segments[0]]
+        for name, segment in zip(self.slots, self.segments[1:]):
+            value = fields.get(name)
+            if value:
+                out.append(value.encode('utf-8'))
+            out.append(segment)
+        return b''.join(out)
+
+
+# Límite de plantillas en memoria (ancho y alto vienen de la petición)
+MAX_TEMPLATES = 256
+
+_templates: Dict[Hashable, SVGTemplate] = {}
+_templates_lock = threading.Lock()
+register_cache('svg_templates', lambda: {'entries': len(_templates), 'max_entries': MAX_TEMPLATES})
+
+
+def get_template(key: Hashable, build_source: Callable[[], str]) -> SVGTemplate:
+    """
+    Devuelve la plantilla compilada de la clave, compilándola la primera vez
+
+    Args:
+        key: Clave (tipo, tema, ancho, alto, ...) de la plantilla
+        build_source: Función que genera el texto fuente con los huecos marcados
+
+    Returns:
+        Plantilla compilada, compartida por todo el proceso
+    """
+    template = _templates.get(key)
+    if template is None:
+        with _templates_lock:
+            template = _templates.get(key)
+            if template is None:
+                template = SVGTemplate(build_source())
+                if len(_templates) >= MAX_TEMPLATES:
+                    # Descartar la plantilla más antigua
+                    del _templates[next(iter(_templates))]
+                _templates[key] = template
+    return template
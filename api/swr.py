@@ -0,0 +1,177 @@
+"""
+Stale-while-revalidate: se sirve el último resultado bueno y se refresca en segundo plano
+"""
+import os
+import time
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Awaitable, Callable, Dict, Hashable, Tuple
+from api.cache import LRUCache
+from api.metrics import record_cache
+
+logger = logging.getLogger(__name__)
+
+# Edad hasta la que una entrada se sirve sin refrescar
+SWR_FRESH_SECONDS = int(os.getenv('SWR_FRESH_SECONDS', 10))
+# Edad extra durante la que se sirve caducada mientras se refresca; después, la petición espera.
+# En Vercel los hilos se congelan al responder y el refresco no llegaría a ejecutarse: 0 por defecto
+SWR_MAX_STALE_SECONDS = int(os.getenv('SWR_MAX_STALE_SECONDS', 0 if os.getenv('VERCEL') else 300))
+# Hilos que ejecutan los refrescos en segundo plano
+SWR_REFRESH_WORKERS = int(os.getenv('SWR_REFRESH_WORKERS', 4))
+
+
+class StaleWhileRevalidate:
+    """
+    Cache de resultados con tres estados según su edad:
+
+    - fresca (edad <= fresh_seconds): se sirve tal cual
+    - caducada (hasta fresh_seconds + max_stale_seconds): se sirve al instante y se
+      programa un refresco en segundo plano, como mucho uno a la vez por clave
+    - demasiado antigua o ausente: la petición calcula el resultado y espera
+    """
+
+    def __init__(self, fresh_seconds: int = SWR_FRESH_SECONDS, max_stale_seconds: int = SWR_MAX_STALE_SECONDS,
+                 max_entries: int = 256, refresh_workers: int = SWR_REFRESH_WORKERS, name: str = 'swr'):
+        """
+        Args:
+            fresh_seconds: Segundos que una entrada se considera fresca
+            max_stale_seconds: Segundos adicionales que se puede servir caducada
+            max_entries: Número máximo de entradas en memoria
+            refresh_workers: Hilos para los refrescos en segundo plano
+            name: Nombre de la cache en las métricas
+        """
+        self.name = name
+        self.fresh_seconds = fresh_seconds
+        self.max_stale_seconds = max_stale_seconds
+        self._entries = LRUCache(max_entries=max_entries, ttl=fresh_seconds + max_stale_seconds)
+        self._refreshing = set()
+        self._lock = threading.Lock()
+        self._refresh_pool = ThreadPoolExecutor(max_workers=max(1, refresh_workers),
+                                                thread_name_prefix='swr-refresh')
+        self._counters = {'fresh': 0, 'stale': 0, 'miss': 0, 'refreshes': 0, 'refresh_errors': 0}
+        self._tasks = set()
+
+    def _count(self, name: str) -> None:
+        with self._lock:
+            self._counters[name] += 1
+        if name in ('fresh', 'stale', 'miss'):
+            record_cache(self.name, name)
+
+    def _store(self, key: Hashable, value: Any) -> None:
+        self._entries.set(key, (time.time(), value))
+
+    def _refresh(self, key: Hashable, compute: Callable[[], Any]) -> None:
+        """Recalcula la entrada en segundo plano; si falla, se conserva la anterior"""
+        try:
+            self._store(key, compute())
+            self._count('refreshes')
+        except Exception as e:
+            self._count('refresh_errors')
+            logger.warning("Error refrescando entrada en segundo plano: %s", e)
+        finally:
+            with self._lock:
+                self._refreshing.discard(key)
+
+    def _schedule_refresh(self, key: Hashable, compute: Callable[[], Any]) -> None:
+        """Programa un refresco salvo que ya haya uno en curso para la clave"""
+        with self._lock:
+            if key in self._refreshing:
+                return
+            self._refreshing.add(key)
+        try:
+            self._refresh_pool.submit(self._refresh, key, compute)
+        except RuntimeError:
+            # Pool detenido (cierre del proceso): se calculará en la próxima petición
+            with self._lock:
+                self._refreshing.discard(key)
+
+    def get(self, key: Hashable, compute: Callable[[], Any], refresh: bool = False) -> Tuple[Any, int, str]:
+        """
+        Devuelve el valor de la clave aplicando stale-while-revalidate
+
+        Args:
+            key: Clave de la entrada
+            compute: Función sin argumentos que calcula el valor (no debe depender
+                del contexto de la petición: puede ejecutarse en otro hilo)
+            refresh: Ignora la entrada guardada y recalcula esperando el resultado
+
+        Returns:
+            Tupla (valor, edad en segundos, estado 'fresh' | 'stale' | 'miss')
+        """
+        entry = None if refresh else self._entries.get(key)
+        if entry is not None:
+            created, value = entry
+            age = time.time() - created
+            if age <= self.fresh_seconds:
+                self._count('fresh')
+                return value, int(age), 'fresh'
+            if age <= self.fresh_seconds + self.max_stale_seconds:
+                self._count('stale')
+                self._schedule_refresh(key, compute)
+                return value, int(age), 'stale'
+
+        self._count('miss')
+        value = compute()
+        self._store(key, value)
+        return value, 0, 'miss'
+
+    async def _arefresh(self, key: Hashable, compute: Callable[[], Awaitable[Any]]) -> None:
+        """Como _refresh, pero como tarea del bucle de eventos"""
+        import asyncio
+        try:
+            self._store(key, await compute())
+            self._count('refreshes')
+        except Exception as e:
+            self._count('refresh_errors')
+            logger.warning("Error refrescando entrada en segundo plano: %s", e)
+        finally:
+            with self._lock:
+                self._refreshing.discard(key)
+                self._tasks.discard(asyncio.current_task())
+
+    async def aget(self, key: Hashable, compute: Callable[[], Awaitable[Any]],
+                   refresh: bool = False) -> Tuple[Any, int, str]:
+        """
+        Versión asyncio de get(): compute devuelve una corrutina y el refresco en
+        segundo plano es una tarea del bucle en lugar de un hilo del pool
+
+        Returns:
+            Tupla (valor, edad en segundos, estado 'fresh' | 'stale' | 'miss')
+        """
+        import asyncio
+        entry = None if refresh else self._entries.get(key)
+        if entry is not None:
+            created, value = entry
+            age = time.time() - created
+            if age <= self.fresh_seconds:
+                self._count('fresh')
+                return value, int(age), 'fresh'
+            if age <= self.fresh_seconds + self.max_stale_seconds:
+                self._count('stale')
+                with self._lock:
+                    if key not in self._refreshing:
+                        self._refreshing.add(key)
+                        # Guardar la referencia: el bucle solo mantiene referencias débiles
+                        self._tasks.add(asyncio.ensure_future(self._arefresh(key, compute)))
+                return value, int(age), 'stale'
+
+        self._count('miss')
+        value = await compute()
+        self._store(key, value)
+        return value, 0, 'miss'
+
+    @property
+    def store(self) -> LRUCache:
+        """Cache subyacente con los pares (instante de cálculo, valor)"""
+        return self._entries
+
+    def clear(self) -> None:
+        """Vacía las entradas (los refrescos en curso terminan normalmente)"""
+        self._entries.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        """Entradas servidas frescas, caducadas o calculadas, y refrescos en curso"""
+        with self._lock:
+            return dict(self._counters, refreshing=len(self._refreshing), entries=len(self._entries),
+                        fresh_seconds=self.fresh_seconds, max_stale_seconds=self.max_stale_seconds)
@@ -0,0 +1,75 @@
+"""
+Registro de temas visuales compartido por todo el proceso
+"""
+from typing import Dict, Any, Tuple
+
+DEFAULT_THEME = 'minimal'
+
+# Claves de color para las que se precalcula la tupla RGB (`<clave>_rgb`)
+COLOR_KEYS = ('text_color', 'accent_color', 'progress_bg', 'progress_fg')
+
+
+def hex_to_rgb(hex_color: str) -> Tuple[int, int, int]:
+    """Convierte color hexadecimal a RGB"""
+    hex_color = hex_color.lstrip('#')
+    return tuple(int(hex_color[i:i+2], 16) for i in (0, 2, 4))
+
+
+def _build_themes() -> Dict[str, Dict[str, Any]]:
+    """Construye los temas por defecto con sus colores RGB precalculados.
+
+    Cada tema incluye las claves que el resto del código espera:
+    `font_family`, `text_color`, `accent_color`, `progress_bg`,
+    `progress_fg`, `font_size_title`, `font_size_subtitle`, `font_size_time`,
+    y `text_color_rgb`, `accent_color_rgb`, `progress_bg_rgb`, `progress_fg_rgb`.
+    """
+    base = {
+        'font_family': 'Arial, Helvetica, sans-serif',
+        'font_size_title': '15px',
+        'font_size_subtitle': '12px',
+        'font_size_time': '11px',
+    }
+    themes = {
+        'normal': {
+            **base,
+            'text_color': '#FFFFFF',
+            'accent_color': '#7ad8ff',
+            'progress_bg': '#000000',
+            'progress_fg': '#7ad8ff'
+        },
+        'dark': {
+            **base,
+            'text_color': '#E6E6E6',
+            'accent_color': '#78ff8c',
+            'progress_bg': '#0F1720',
+            'progress_fg': '#78ff8c'
+        },
+        'minimal': {
+            **base,
+            'text_color': '#FFFFFF',
+            'accent_color': '#5eff69',
+            'progress_bg': '#111827',
+            'progress_fg': '#5eff69'
+        }
+    }
+    for theme in themes.values():
+        for key in COLOR_KEYS:
+            theme[f'{key}_rgb'] = hex_to_rgb(theme[key])
+    return themes
+
+
+# Registro único: se construye al importar el módulo y no debe modificarse
+THEMES: Dict[str, Dict[str, Any]] = _build_themes()
+
+
+def get_theme(name: str) -> Dict[str, Any]:
+    """
+    Devuelve un tema del registro
+
+    Args:
+        name: Nombre del tema
+
+    Returns:
+        Diccionario del tema (el tema por defecto si no existe)
+    """
+    return THEMES.get(name) or THEMES[DEFAULT_THEME]
@@ -0,0 +1,117 @@
+"""
+Traza por petición: etapas y consultas a cache de una sola petición
+
+Alimenta la cabecera Server-Timing (visible en la pestaña de red del navegador) y
+la respuesta de depuración ?trace=1. Las etapas y caches se anotan desde
+api.metrics, así que la instrumentación es la misma que la de /metrics.
+"""
+import time
+import threading
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Tuple
+
+# Traza de la petición en curso (por hilo en Flask, por tarea en ASGI)
+_current: ContextVar[Optional['RequestTrace']] = ContextVar('plex2sign_trace', default=None)
+
+
+class RequestTrace:
+    """Etapas medidas y resultados de cache de una petición"""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.stages: List[Tuple[str, float]] = []
+        self.caches: List[Tuple[str, str]] = []
+        # Los refrescos asíncronos pueden anotar desde otra tarea mientras se lee
+        self._lock = threading.Lock()
+
+    def add_stage(self, name: str, seconds: float) -> None:
+        with self._lock:
+            self.stages.append((name, seconds))
+
+    def add_cache(self, cache: str, result: str) -> None:
+        with self._lock:
+            self.caches.append((cache, result))
+
+    def elapsed(self) -> float:
+        """Segundos desde el inicio de la petición"""
+        return time.perf_counter() - self.started
+
+    def stage_totals(self) -> Dict[str, float]:
+        """Duración total por etapa, en el orden en que aparecieron"""
+        totals: Dict[str, float] = {}
+        with self._lock:
+            for name, seconds in self.stages:
+                totals[name] = totals.get(name, 0.0) + seconds
+        return totals
+
+    def server_timing(self) -> str:
+        """Valor de la cabecera Server-Timing (duraciones en milisegundos)"""
+        entries = [f"{name};dur={seconds * 1000:.2f}" for name, seconds in self.stage_totals().items()]
+        with self._lock:
+            entries.extend(f"cache-{cache};desc={result}" for cache, result in self.caches)
+        entries.append(f"total;dur={self.elapsed() * 1000:.2f}")
+        return ', '.join(entries)
+
+    def as_dict(self) -> Dict[str, Any]:
+        """Traza completa para la respuesta de depuración"""
+        with self._lock:
+            stages = [{'stage': name, 'ms': round(seconds * 1000, 3)} for name, seconds in self.stages]
+            caches = [{'cache': cache, 'result': result} for cache, result in self.caches]
+        return {
+            'total_ms': round(self.elapsed() * 1000, 3),
+            'stages': stages,
+            'stage_totals_ms': {name: round(seconds * 1000, 3) for name, seconds in self.stage_totals().items()},
+            'caches': caches,
+        }
+
+
+def current_trace() -> Optional[RequestTrace]:
+    """Traza de la petición en curso (None fuera de una petición)"""
+    return _current.get()
+
+
+def start_trace() -> Tuple[RequestTrace, Any]:
+    """
+    Abre una traza para la petición en curso
+
+    Returns:
+        Tupla (traza, token para end_trace)
+    """
+    trace = RequestTrace()
+    return trace, _current.set(trace)
+
+
+def end_trace(token) -> None:
+    """Cierra la traza abierta con start_trace"""
+    _current.reset(token)
+
+
+@contextmanager
+def traced() -> Iterator[RequestTrace]:
+    """Traza el bloque como una petición"""
+    trace, token = start_trace()
+    try:
+        yield trace
+    finally:
+        end_trace(token)
+
+
+def trace_stage(name: str, seconds: float) -> None:
+    trace = _current.get()
+    if trace is not None:
+        trace.add_stage(name, seconds)
+
+
+def trace_stages(stages: Sequence[Tuple[str, float]]) -> None:
+    """Anota en la traza las etapas devueltas por un trabajo de render"""
+    trace = _current.get()
+    if trace is not None:
+        for name, seconds in stages:
+            trace.add_stage(name, seconds)
+
+
+def trace_cache(cache: str, result: str) -> None:
+    trace = _current.get()
+    if trace is not None:
+        trace.add_cache(cache, result)
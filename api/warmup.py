@@ -0,0 +1,107 @@
+"""
+Calentamiento del proceso antes de la primera petición
+
+Los módulos pesados (PIL, colorthief, plexapi, requests) se importan solo en los
+caminos que los usan; este paso los carga de una vez junto con las fuentes, los
+layouts, las plantillas SVG y las imágenes 'sin actividad' del tamaño por
+defecto. Con WARMUP=background corre en un hilo mientras el proceso empieza a
+atender peticiones; 'sync' lo completa antes de seguir y 'off' lo desactiva.
+En Vercel el valor por defecto es 'off': la primera petición llega nada más
+importar la aplicación y necesita los mismos módulos, así que calentar antes
+solo retrasaría la respuesta.
+"""
+import os
+import time
+import logging
+import threading
+from typing import Dict, Optional
+from api.metrics import collect_stages
+
+logger = logging.getLogger(__name__)
+
+# Modo de calentamiento: 'background', 'sync' u 'off' (por defecto 'off' en Vercel)
+WARMUP = os.getenv('WARMUP', 'off' if os.getenv('VERCEL') else 'background').lower()
+
+# Sesión de muestra sin carátula: recorre el layout, las fuentes y el texto de un badge real
+SAMPLE_SESSION = {
+    'type': 'track', 'state': 'playing', 'title': 'Plex2Sign', 'track_title': 'Plex2Sign',
+    'artist': 'Plex2Sign', 'album': 'Plex2Sign', 'progress': 30, 'duration': 180, 'thumb': None,
+}
+
+
+def _load_pil() -> None:
+    from PIL import Image, ImageDraw, ImageFilter, ImageFont  # noqa: F401
+    # Plugins de los formatos que se sirven o se reciben (PNG, JPEG, GIF...)
+    Image.preinit()
+
+
+def _load_palette() -> None:
+    import colorthief  # noqa: F401
+
+
+def _load_plex() -> None:
+    import requests  # noqa: F401
+    import plexapi.server  # noqa: F401
+
+
+def _render_defaults(theme: str, width: int, height: int) -> None:
+    """Renders de muestra e idle (PNG y SVG) del tamaño y tema por defecto"""
+    from api.image_generator import ImageGenerator
+    from api.svg_generator import SVGGenerator
+
+    image = ImageGenerator(theme=theme, width=width, height=height)
+    svg = SVGGenerator(theme=theme, width=width, height=height)
+    # Las etapas de estos renders no son peticiones: fuera de /metrics
+    with collect_stages():
+        for session_data in (None, SAMPLE_SESSION):
+            image.generate_now_playing_image(session_data)
+            svg.render_now_playing_svg(session_data)
+
+
+def warm_up(plex: bool = True, render: bool = True) -> Dict[str, float]:
+    """
+    Carga los módulos pesados y precalcula el estado compartido del proceso
+
+    Args:
+        plex: Importar también el cliente de Plex (requests y plexapi)
+        render: Precalcular fuentes, layouts, plantillas e imágenes idle
+
+    Returns:
+        Segundos de cada paso
+    """
+    timings: Dict[str, float] = {}
+    steps = [('pil', _load_pil), ('palette', _load_palette)]
+    if plex:
+        steps.append(('plex', _load_plex))
+    if render:
+        theme = os.getenv('DEFAULT_THEME', 'normal')
+        width = int(os.getenv('IMAGE_WIDTH', 400))
+        steps.append(('render', lambda: _render_defaults(theme, width, 90)))
+
+    for name, step in steps:
+        start = time.perf_counter()
+        try:
+            step()
+        except Exception as e:
+            # Un paso fallido solo significa que la primera petición pagará ese coste
+            logger.warning("Calentamiento: error en %s: %s", name, e)
+        timings[name] = time.perf_counter() - start
+    logger.info("Calentamiento completado en %.0f ms (%s)", sum(timings.values()) * 1000,
+                ', '.join(f"{name} {seconds * 1000:.0f} ms" for name, seconds in timings.items()))
+    return timings
+
+
+def start_warm_up(mode: str = WARMUP) -> Optional[threading.Thread]:
+    """
+    Lanza el calentamiento según el modo ('background', 'sync' u 'off')
+
+    Returns:
+        Hilo del calentamiento en segundo plano (None en los otros modos)
+    """
+    if mode == 'sync':
+        warm_up()
+    elif mode == 'background':
+        thread = threading.Thread(target=warm_up, name='warmup', daemon=True)
+        thread.start()
+        return thread
+    return None
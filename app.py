@@ -3,28 +3,83 @@ Plex2Sign - Aplicación principal
 Muestra lo que estás reproduciendo en Plex en tu perfil de GitHub
 """
 import os
+import base64
 import logging
 import time
 from datetime import datetime, timedelta
-from dotenv import load_dotenv
-from flask import Flask, Response, request, jsonify
+from flask import Flask, Response, request, jsonify, stream_with_context, g
 from api.plex_client import create_plex_client
-from api.image_generator import ImageGenerator
-from api.svg_generator import SVGGenerator
+from api.image_generator import ImageGenerator, normalize_scale
+from api.svg_generator import normalize_equalizer_mode
+from api.image_encoder import negotiate_format, normalize_format, get_mimetype, clamp_effort, ANIMATED_FORMATS
+from api.cache import RenderCache, session_fingerprint
+from api.compression import negotiate_encoding, compress
+from api.artwork import clear_artwork_caches, fetch_artwork, artwork_stats, sniff_mimetype, IMAGE_MIMETYPES
+from api.render_pool import RenderJob, RenderPoolError, get_render_executor
+from api.singleflight import SingleFlight
+from api.swr import StaleWhileRevalidate, SWR_FRESH_SECONDS
+from api.stream import NowPlayingHub, StreamFull
+from api import metrics
+from api import disk_cache
+from api import cache_backends
+from api.tracing import start_trace, end_trace, current_trace
+from api.diagnostics import register_cache, diagnostics_response, profiler
+from api.logs import configure_logging, logging_stats
+from api.warmup import start_warm_up
+from api.session_json import (
+    session_payload, select_fields, json_body, make_etag, etag_matches, artwork_path, plex_artwork_url,
+)
+
+
+def load_env_file() -> None:
+    """Carga el .env más cercano a app.py, como load_dotenv(); sin .env (Vercel) no se importa dotenv"""
+    directory = os.path.dirname(os.path.abspath(__file__))
+    while True:
+        path = os.path.join(directory, '.env')
+        if os.path.isfile(path):
+            from dotenv import load_dotenv
+            load_dotenv(path)
+            return
+        parent = os.path.dirname(directory)
+        if parent == directory:
+            return
+        directory = parent
+
 
 # Cargar variables de entorno
-load_dotenv()
+load_env_file()
 
-# Configurar logging
-logging.basicConfig(
-    level=logging.INFO if os.getenv('DEBUG', 'false').lower() != 'true' else logging.DEBUG,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
-)
+# Configurar logging (escritura en un hilo aparte, ver api/logs.py)
+configure_logging(logging.INFO if os.getenv('DEBUG', 'false').lower() != 'true' else logging.DEBUG)
 logger = logging.getLogger(__name__)
 
 # Crear aplicación Flask
 app = Flask(__name__)
 
+
+@app.before_request
+def open_trace():
+    """Cada petición lleva su traza de etapas (cabecera Server-Timing)"""
+    g.trace_token = start_trace()[1]
+
+
+@app.after_request
+def add_server_timing(response: Response) -> Response:
+    trace = current_trace()
+    # En un stream la respuesta sale antes de que ocurra nada que medir
+    if trace is not None and not response.is_streamed:
+        response.headers['Server-Timing'] = trace.server_timing()
+    return response
+
+
+@app.teardown_request
+def close_trace(error=None):
+    token = g.pop('trace_token', None)
+    if token is not None:
+        end_trace(token)
+    # Perfil por número de peticiones (/api/debug/profile?requests=N)
+    profiler.note_request()
+
 # Cache simple para evitar regenerar imágenes constantemente
 image_cache = {
     'last_update': None,
@@ -33,10 +88,155 @@ image_cache = {
     'cache_duration': int(os.getenv('CACHE_DURATION', 60))  # segundos
 }
 
+# Cache de renders: cada imagen renderizada guarda junto a ella sus variantes codificadas
+render_cache = RenderCache(ttl=image_cache['cache_duration'])
+# Los fotogramas de una animación ocupan varios MB: cache aparte y más pequeña
+animation_cache = RenderCache(ttl=image_cache['cache_duration'],
+                              max_entries=int(os.getenv('ANIMATION_CACHE_SIZE', 8)))
+# Renders que se guardan también fuera del proceso: backend de cache compartido entre
+# workers o nodos (CACHE_BACKEND) y almacén persistente (PERSIST_DIR). Las animaciones ocupan MB
+SHARED_RENDER_KINDS = ('image', 'svg')
 
-@app.route('/')
-def index():
-    """Página principal con información del proyecto"""
+
+def render_job(kind: str, session_data, theme: str, width: int, height: int, **options) -> RenderJob:
+    """Prepara un trabajo de render con la carátula ya descargada (el pool no accede a la red)"""
+    artwork = None
+    if session_data and session_data.get('thumb'):
+        artwork = fetch_artwork(session_data['thumb'])
+    return RenderJob(kind, session_data, theme, width, height, artwork=artwork, **options)
+
+
+def render_target(fmt: str, session_data, theme: str, width: int, height: int,
+                  effort: int = None, equalizer_mode: str = None, scale: int = 1) -> dict:
+    """
+    Describe dónde se cachea un render y cómo generarlo. Las escalas HiDPI de una
+    imagen comparten entrada: solo difieren en la variante rasterizada
+
+    Returns:
+        Diccionario con cache, key, variant (None para SVG), kind, options y mimetype
+    """
+    fingerprint = session_fingerprint(session_data)
+    if fmt == 'svg':
+        equalizer_mode = normalize_equalizer_mode(equalizer_mode)
+        return {'cache': render_cache, 'key': ('svg', fingerprint, theme, width, height, equalizer_mode),
+                'variant': None, 'kind': 'svg', 'options': {'equalizer_mode': equalizer_mode},
+                'mimetype': 'image/svg+xml'}
+    # Las animaciones pesan más: van a su propia cache, más pequeña
+    if fmt in ANIMATED_FORMATS:
+        cache, kind, key = animation_cache, 'animation', ('anim', fingerprint, theme, width, height)
+    else:
+        cache, kind, key = render_cache, 'image', (fingerprint, theme, width, height)
+    return {'cache': cache, 'key': key, 'variant': (fmt, effort, scale), 'kind': kind,
+            'options': {'fmt': fmt, 'effort': effort, 'scale': scale}, 'mimetype': get_mimetype(fmt)}
+
+
+def _remember_render(target: dict, body: bytes) -> None:
+    """Guarda el cuerpo en la cache en memoria del render"""
+    if target['variant'] is None:
+        target['cache'].put_render(target['key'], body)
+    else:
+        target['cache'].put_variant(target['key'], target['variant'], body)
+
+
+def get_cached_render(target: dict, shared: bool = True):
+    """
+    Devuelve el cuerpo cacheado del render descrito por render_target(); si no está
+    en memoria se busca en el backend de cache y después en el almacén persistente
+
+    Args:
+        target: Descripción del render
+        shared: Buscar también fuera de memoria (False: la E/S se hace aparte con load_shared_render)
+    """
+    if target['variant'] is None:
+        body = target['cache'].get_render(target['key'])
+    else:
+        body = target['cache'].get_variant(target['key'], target['variant'])
+    metrics.record_cache('render', 'miss' if body is None else 'hit')
+    if body is None and shared:
+        body = load_shared_render(target)
+    return body
+
+
+def load_shared_render(target: dict):
+    """Cuerpo del render en el backend de cache o en el almacén persistente (hace E/S)"""
+    if target['kind'] not in SHARED_RENDER_KINDS:
+        return None
+    entry = cache_backends.load('renders', (target['key'], target['variant']))
+    body = entry[1] if entry else disk_cache.load('renders', (target['key'], target['variant']))
+    if body is not None:
+        _remember_render(target, body)
+    return body
+
+
+def put_cached_render(target: dict, body: bytes, shared: bool = True) -> None:
+    """
+    Guarda el cuerpo del render descrito por render_target() (en memoria, en el backend y en disco)
+
+    Args:
+        shared: Guardar también fuera de memoria (False: la E/S se hace aparte con store_shared_render)
+    """
+    _remember_render(target, body)
+    if shared:
+        store_shared_render(target, body)
+
+
+def store_shared_render(target: dict, body: bytes) -> None:
+    """Guarda el cuerpo del render en el backend de cache y en el almacén persistente (hace E/S)"""
+    if target['kind'] in SHARED_RENDER_KINDS:
+        key = (target['key'], target['variant'])
+        cache_backends.save('renders', key, body, ttl=target['cache'].ttl)
+        disk_cache.save('renders', key, body, ttl=target['cache'].ttl)
+
+
+def render_cached(target: dict, session_data, theme: str, width: int, height: int) -> bytes:
+    """Devuelve el render de cache o lo genera en el pool y lo guarda"""
+    body = get_cached_render(target)
+    if body is None:
+        job = render_job(target['kind'], session_data, theme, width, height, **target['options'])
+        body = get_render_executor().run(job)
+        put_cached_render(target, body)
+    return body
+
+
+def render_unavailable(error: RenderPoolError) -> Response:
+    """Respuesta cuando el pool de render está saturado o no cumple el plazo"""
+    logger.warning("Render rechazado: %s", error)
+    return Response("Render no disponible, reintenta en unos segundos", mimetype='text/plain',
+                    status=503, headers={'Retry-After': '1'})
+
+
+def encode_body(body: bytes, accept_encoding: str, cache_key=None, headers: dict = None) -> tuple:
+    """
+    Comprime el cuerpo según Accept-Encoding. Si se indica cache_key, la variante
+    comprimida se guarda junto al render para comprimir solo una vez por cambio
+    de estado y no en cada petición; sin ella se usa un nivel rápido
+
+    Returns:
+        Tupla (cuerpo, cabeceras con Vary y Content-Encoding)
+    """
+    headers = dict(headers or {})
+    headers['Vary'] = ', '.join(filter(None, [headers.get('Vary'), 'Accept-Encoding']))
+    encoding = negotiate_encoding(accept_encoding, len(body))
+    if encoding:
+        variant = ('content-encoding', encoding)
+        compressed = render_cache.get_variant(cache_key, variant) if cache_key else None
+        if compressed is None:
+            compressed = compress(body, encoding, fast=cache_key is None)
+            if cache_key:
+                render_cache.put_variant(cache_key, variant, compressed)
+        body = compressed
+        headers['Content-Encoding'] = encoding
+    return body, headers
+
+
+def encoded_response(body: bytes, mimetype: str, cache_key=None, headers: dict = None) -> Response:
+    """Respuesta con el cuerpo comprimido según el Accept-Encoding de la petición"""
+    body, headers = encode_body(body, request.headers.get('Accept-Encoding'), cache_key, headers)
+    return Response(body, mimetype=mimetype, headers=headers)
+
+
+def index_html(url_root: str) -> str:
+    """HTML de la página principal (url_root: URL base para el ejemplo de uso)"""
     return '''
     <!DOCTYPE html>
     <html>
@@ -87,7 +287,7 @@ def index():
         <div class="card">
             <h2>🔧 Uso en GitHub</h2>
             <p>Añade esto a tu <code>README.md</code> del perfil:</p>
-            <pre><code>![Plex2Sign](''' + request.url_root + '''api/now-playing)</code></pre>
+            <pre><code>![Plex2Sign](''' + url_root + '''api/now-playing)</code></pre>
         </div>
         
         <div class="card">
@@ -137,29 +337,54 @@ def index():
                     
                     // Imgur eliminado
                     
-                    if (data.current_session) {
-                        html += '<div class="success">🎵 Reproduciendo: ' + data.current_session.title + '</div>';
-                    } else {
-                        html += '<div class="warning">⏸️ No hay reproducción activa</div>';
-                    }
+                    html += '<div id="session">' + sessionHtml(data.current_session) + '</div>';
                     
                     statusDiv.innerHTML = html;
                 })
                 .catch(e => {
                     document.getElementById('status').innerHTML = '<div class="error">❌ Error obteniendo estado</div>';
                 });
+            
+            function sessionHtml(session) {
+                if (session) {
+                    return '<div class="success">🎵 Reproduciendo: ' + session.title + '</div>';
+                }
+                return '<div class="warning">⏸️ No hay reproducción activa</div>';
+            }
+            
+            // Cambios en directo: un evento por cambio en lugar de volver a consultar
+            if (window.EventSource) {
+                let first = true;
+                new EventSource('/api/now-playing/stream').addEventListener('now-playing', e => {
+                    const event = JSON.parse(e.data);
+                    const sessionDiv = document.getElementById('session');
+                    if (sessionDiv) sessionDiv.innerHTML = sessionHtml(event.state && event.state !== 'stopped' ? event : null);
+                    if (first) { first = false; return; }
+                    document.querySelectorAll('img[src^="/api/now-playing"]').forEach(img => {
+                        img.src = img.src.replace(/&v=[^&]*$/, '') + '&v=' + event.fingerprint;
+                    });
+                });
+            }
         </script>
     </body>
     </html>
     '''
 
 
-@app.route('/api/status')
-def api_status():
-    """Endpoint para verificar el estado del sistema"""
-    # Obtener token de parámetro de consulta o variable de entorno
-    token = request.args.get('token')
-    plex_client = create_plex_client(token)
+@app.route('/')
+def index():
+    """Página principal con información del proyecto"""
+    return index_html(request.url_root)
+
+
+def build_status(server_info: dict = None, session_data: dict = None) -> dict:
+    """
+    Estado del sistema para /api/status
+
+    Args:
+        server_info: Información del servidor (None si no se pudo conectar)
+        session_data: Sesión actual, si la hay
+    """
     status = {
         'plex': {
             'connected': False,
@@ -170,17 +395,20 @@ def api_status():
         'cache': {
             'last_update': image_cache['last_update'].isoformat() if image_cache['last_update'] else None,
             'has_cached_image': image_cache['image_url'] is not None
-        }
+        },
+        'render_pool': get_render_executor().stats(),
+        'artwork': artwork_stats(),
+        'singleflight': badge_flights.stats(),
+        'stale_while_revalidate': badge_swr.stats(),
+        'stream': now_playing_hub.stats(),
+        'logging': logging_stats(),
     }
     
-    if plex_client and plex_client.is_connected():
-        server_info = plex_client.get_server_info()
+    if server_info is not None:
         status['plex']['connected'] = True
         status['plex']['server_name'] = server_info.get('name', 'Unknown')
         status['plex']['sessions_count'] = server_info.get('sessions_count', 0)
         
-        # Obtener sesión actual
-        session_data = plex_client.get_current_session()
         if session_data:
             status['current_session'] = {
                 'title': session_data.get('title'),
@@ -190,79 +418,35 @@ def api_status():
             }
     else:
         status['plex']['error'] = 'No se pudo conectar'
-    
-    return jsonify(status)
+    return status
 
 
-@app.route('/api/now-playing')
-def api_now_playing():
-    """Endpoint principal que genera y devuelve la imagen de reproducción actual"""
-    try:
-        # Parámetros de la petición
-        theme = request.args.get('theme', os.getenv('DEFAULT_THEME', 'normal'))
-        width = int(request.args.get('width', os.getenv('IMAGE_WIDTH', 400)))
-        height = int(request.args.get('height', 90))  # Forzado a 90, ignorando IMAGE_HEIGHT
-        force_refresh = request.args.get('refresh', 'false').lower() == 'true'
-        
-        # No usar caché de Imgur ni redirección, solo lógica original
-        
-        # Obtener datos de Plex
-        token = request.args.get('token')
-        plex_client = create_plex_client(token)
-        if not plex_client:
-            logger.error("No se pudo crear cliente de Plex")
-            return generate_error_image("Error: Plex no configurado")
-        
-        # Obtener usuario específico si está configurado
-        allowed_user = request.args.get('user')
-        session_data = plex_client.get_current_session(allowed_user)
-        logger.info(f"Datos de sesión obtenidos: {session_data}")
-        
-        # Si no hay sesión activa, intentar usar historial
-        if not session_data:
-            import time
-            offset = int(time.time() // 30) % 5  # Alternar entre 0-4 cada 30 segundos
-            history_data = plex_client.get_recent_playback_history(allowed_user, limit=10, offset=offset)
-            logger.info(f"PNG: Historial obtenido: {history_data}")
-            if history_data:
-                logger.info("No hay sesión activa, usando historial de reproducciones")
-                session_data = history_data
-            else:
-                logger.info("No hay sesión activa, historial ni cache, generando imagen de 'sin actividad'")
-                session_data = None
-        
-        # Generar imagen y devolver directamente
-        image_generator = ImageGenerator(width, height, theme)
-        image_buffer = image_generator.generate_now_playing_image(session_data)
-        image_buffer.seek(0)
-        return Response(image_buffer.read(), mimetype='image/png')
-        
-    except Exception as e:
-        logger.error(f"Error generando imagen: {e}")
-        return generate_error_image(f"Error: {str(e)}")
+@app.route('/api/status')
+def api_status():
+    """Endpoint para verificar el estado del sistema"""
+    # Obtener token de parámetro de consulta o variable de entorno
+    token = request.args.get('token')
+    plex_client = create_plex_client(token)
+    if plex_client and plex_client.is_connected():
+        # Obtener sesión actual
+        status = build_status(plex_client.get_server_info(), plex_client.get_current_session())
+    else:
+        status = build_status()
+    
+    return encoded_response(jsonify(status).get_data(), 'application/json')
 
 
-def generate_error_image(message: str) -> Response:
-    """Genera imagen de error"""
-    try:
-        image_generator = ImageGenerator(400, 90, 'default')
-        error_data = {
-            'title': message,
-            'type': 'error',
-            'state': 'stopped'
-        }
-        image_buffer = image_generator.generate_now_playing_image(None)  # Imagen idle
-        image_buffer.seek(0)
-        return Response(image_buffer.read(), mimetype='image/png')
-    except Exception as e:
-        logger.error(f"Error generando imagen de error: {e}")
-        return Response("Error", mimetype='text/plain', status=500)
+def error_image_png() -> bytes:
+    """PNG mostrado en lugar del badge cuando algo falla (imagen idle)"""
+    image_generator = ImageGenerator(theme='default', width=400, height=90)
+    image_buffer = image_generator.generate_now_playing_image(None)  # Imagen idle
+    image_buffer.seek(0)
+    return image_buffer.read()
 
 
-def generate_error_svg(message: str) -> Response:
-    """Genera SVG de error"""
-    try:
-        svg_content = f'''
+def error_svg(message: str) -> str:
+    """SVG con el mensaje de error"""
+    return f'''
         <svg width="400" height="90" xmlns="http://www.w3.org/2000/svg">
             <defs>
                 <style>
@@ -277,110 +461,515 @@ def generate_error_svg(message: str) -> Response:
             <text x="200" y="80" class="error-text">{message}</text>
         </svg>
         '''
-        return Response(svg_content, mimetype='image/svg+xml')
+
+
+def generate_error_image(message: str) -> Response:
+    """Genera imagen de error"""
+    try:
+        return Response(error_image_png(), mimetype='image/png')
     except Exception as e:
-        logger.error(f"Error generando SVG de error: {e}")
-        return Response("Error SVG", mimetype='text/plain', status=500)
+        logger.error("Error generando imagen de error: %s", e)
+        return Response("Error", mimetype='text/plain', status=500)
 
 
-@app.route('/api/now-playing-svg')
-def api_now_playing_svg():
-    """Endpoint que genera y devuelve SVG animado de reproducción actual"""
+def generate_error_svg(message: str) -> Response:
+    """Genera SVG de error"""
     try:
-        # Parámetros de la petición
-        theme = request.args.get('theme', os.getenv('DEFAULT_THEME', 'normal'))
-        width = int(request.args.get('width', os.getenv('IMAGE_WIDTH', 400)))
-        height = int(request.args.get('height', 90))  # Forzado a 90, ignorando IMAGE_HEIGHT
-        
-        # Obtener datos de Plex
-        token = request.args.get('token')
+        return Response(error_svg(message), mimetype='image/svg+xml')
+    except Exception as e:
+        logger.error("Error generando SVG de error: %s", e)
+        return Response("Error SVG", mimetype='text/plain', status=500)
+
+
+# Peticiones idénticas simultáneas (mismo servidor, usuario, formato, tema y tamaño)
+# comparten una sola consulta a Plex y un solo render
+badge_flights = SingleFlight()
+# Último badge bueno por clave: se sirve al instante mientras se refresca en segundo plano
+badge_swr = StaleWhileRevalidate(name='badge')
+
+# Estado de la entrada servida -> cabecera X-Cache
+CACHE_STATUS_HEADERS = {'fresh': 'HIT', 'stale': 'STALE', 'miss': 'MISS'}
+
+# Tamaño lógico máximo de un badge (antes de aplicar scale)
+MAX_BADGE_WIDTH = 2000
+MAX_BADGE_HEIGHT = 1000
+
+# Cabeceras del endpoint PNG: los clientes no deben cachear la imagen
+NO_CACHE_HEADERS = {
+    'Cache-Control': 'no-cache, no-store, must-revalidate',
+    'Pragma': 'no-cache',
+    'Expires': '0',
+}
+
+
+class PlexUnavailableError(Exception):
+    """No se pudo crear el cliente de Plex"""
+
+
+def badge_outcome(session_data) -> str:
+    """Qué muestra el badge: 'live' (sesión activa), 'history' o 'idle'"""
+    if not session_data:
+        return 'idle'
+    return 'history' if session_data.get('state') == 'stopped' else 'live'
+
+
+def resolve_session_data(plex_client, allowed_user: str = None):
+    """Sesión actual del usuario o, si no hay, una entrada reciente del historial (None si nada)"""
+    session_data = plex_client.get_current_session(allowed_user)
+    if not session_data:
+        offset = int(time.time() // 30) % 5  # Alternar entre 0-4 cada 30 segundos
+        session_data = plex_client.get_recent_playback_history(allowed_user, limit=10, offset=offset) or None
+    return session_data
+
+
+def session_snapshot_key(token: str = None, user: str = None) -> tuple:
+    """Clave de la instantánea de sesión de un servidor (token) y usuario en el backend de cache"""
+    return (token or '', user)
+
+
+def fetch_session(token: str = None, user: str = None, refresh: bool = False):
+    """
+    Sesión a mostrar (sin renderizar nada): la que otro worker o nodo consultó hace
+    menos de SWR_FRESH_SECONDS o, si no hay, la de Plex. Con un backend de cache
+    configurado solo un worker o nodo consulta Plex por usuario a la vez
+
+    Args:
+        token: Token de Plex (por defecto, PLEX_TOKEN)
+        user: Usuario cuya sesión se muestra
+        refresh: Consultar Plex aunque haya una instantánea reciente
+    """
+    def query():
         plex_client = create_plex_client(token)
         if not plex_client:
-            logger.error("No se pudo crear cliente de Plex")
-            return generate_error_svg("Error: Plex no configurado")
-        
-        # Obtener usuario específico si está configurado
-        allowed_user = request.args.get('user')
-        session_data = plex_client.get_current_session(allowed_user)
-        logger.info(f"Datos de sesión obtenidos para SVG: {session_data}")
-        
-        # Si no hay sesión activa, intentar usar historial
-        if not session_data:
-            import time
-            offset = int(time.time() // 30) % 5  # Alternar entre 0-4 cada 30 segundos
-            history_data = plex_client.get_recent_playback_history(allowed_user, limit=10, offset=offset)
-            logger.info(f"Historial obtenido: {history_data}")
-            if history_data:
-                logger.info("No hay sesión activa, usando historial de reproducciones para SVG")
-                session_data = history_data
-            else:
-                logger.info("No hay sesión activa, historial ni cache, generando SVG de 'sin actividad'")
-                session_data = None
-        
-        # Generar SVG
-        svg_generator = SVGGenerator(width, height, theme)
-        svg_content = svg_generator.generate_now_playing_svg(session_data)
-        
-        logger.info("SVG generado exitosamente")
-        return Response(svg_content, mimetype='image/svg+xml')
-        
+            raise PlexUnavailableError("Plex no configurado")
+        return resolve_session_data(plex_client, user)
+    return cache_backends.get_or_compute('sessions', session_snapshot_key(token, user), query,
+                                         ttl=SWR_FRESH_SECONDS, refresh=refresh)
+
+
+def read_badge_params(svg: bool, args, headers) -> dict:
+    """
+    Lee los parámetros comunes de los endpoints de badge (formato negociado incluido)
+
+    Args:
+        svg: True para el SVG animado, False para imagen rasterizada
+        args: Parámetros de la consulta (mapping)
+        headers: Cabeceras de la petición (mapping, para Accept)
+    """
+    params = {
+        'theme': args.get('theme', os.getenv('DEFAULT_THEME', 'normal')),
+        # Acotados como en /api/now-playing/batch: con scale=3 el render crece x9
+        'width': min(max(int(args.get('width', os.getenv('IMAGE_WIDTH', 400))), 1), MAX_BADGE_WIDTH),
+        'height': min(max(int(args.get('height', 90)), 1), MAX_BADGE_HEIGHT),  # Forzado a 90, ignorando IMAGE_HEIGHT
+        'token': args.get('token'),
+        'user': args.get('user'),
+    }
+    if svg:
+        params.update(fmt='svg', effort=None, scale=1,
+                      equalizer_mode=normalize_equalizer_mode(args.get('equalizer')))
+    else:
+        effort_param = args.get('effort')
+        params.update(fmt=negotiate_format(headers.get('Accept'), args.get('format')),
+                      effort=clamp_effort(int(effort_param) if effort_param else None),
+                      scale=normalize_scale(args.get('scale', 1)),
+                      equalizer_mode=None)
+    return params
+
+
+def badge_flight_key(params: dict) -> tuple:
+    """Clave single-flight: servidor (token), usuario, formato, tema y tamaño"""
+    return (params['token'] or '', params['user'], params['fmt'], params['theme'],
+            params['width'], params['height'], params['scale'], params['effort'], params['equalizer_mode'])
+
+
+def build_badge(params: dict, refresh: bool = False) -> tuple:
+    """
+    Consulta Plex y devuelve el badge renderizado (o el de cache si la sesión no cambió)
+
+    Args:
+        params: Parámetros de read_badge_params()
+        refresh: Consultar Plex aunque otro worker lo haya hecho hace poco
+
+    Returns:
+        Tupla (cuerpo, render_target)
+    """
+    session_data = fetch_session(params['token'], params['user'], refresh)
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug("Sesión obtenida: %s", session_fingerprint(session_data))
+
+    target = render_target(params['fmt'], session_data, params['theme'], params['width'], params['height'],
+                           effort=params['effort'], equalizer_mode=params['equalizer_mode'], scale=params['scale'])
+    body = render_cached(target, session_data, params['theme'], params['width'], params['height'])
+    metrics.BADGE_RENDERS.inc(outcome=badge_outcome(session_data))
+    return body, target
+
+
+def wants_trace(args) -> bool:
+    """Parámetro de depuración ?trace=1: devolver la traza en JSON en lugar de la imagen"""
+    return args.get('trace', 'false').lower() in ('1', 'true')
+
+
+def badge_trace(params: dict, status: str, age: int, body: bytes) -> dict:
+    """Traza de la petición de un badge con lo que se sirvió (sin token ni datos de la sesión)"""
+    trace = current_trace()
+    payload = trace.as_dict() if trace is not None else {}
+    payload.update(format=params['fmt'], theme=params['theme'], width=params['width'], height=params['height'],
+                   scale=params['scale'], cache=status, age=age, bytes=len(body))
+    return payload
+
+
+def log_badge(params: dict, status: str, age: int, body: bytes) -> None:
+    """Registro de cada badge servido, con sus datos también como campos estructurados"""
+    logger.info("Badge %s servido (%s, %ss) - Tema: %s, Dimensiones: %sx%s, Tamaño: %s bytes",
+                params['fmt'], status, age, params['theme'], params['width'], params['height'], len(body),
+                extra={'badge_format': params['fmt'], 'cache': status, 'age': age, 'theme': params['theme'],
+                       'width': params['width'], 'height': params['height'], 'bytes': len(body)})
+
+
+def serve_badge(svg: bool, on_error, headers: dict = None) -> Response:
+    """
+    Pipeline común de /api/now-playing, /api/now-playing-png y /api/now-playing-svg
+
+    Args:
+        svg: True para el SVG animado, False para imagen rasterizada
+        on_error: Función que construye la respuesta de error a partir de un mensaje
+        headers: Cabeceras adicionales de la respuesta
+    """
+    try:
+        params = read_badge_params(svg, request.args, request.headers)
+        key = badge_flight_key(params)
+        force_refresh = request.args.get('refresh', 'false').lower() == 'true'
+        # build_badge no usa el contexto de la petición: puede refrescarse en segundo plano
+        (body, target), age, status = badge_swr.get(
+            key, lambda: badge_flights.do(key, lambda: build_badge(params, force_refresh))[0], refresh=force_refresh)
+        log_badge(params, status, age, body)
+        if wants_trace(request.args):
+            return jsonify(badge_trace(params, status, age, body))
+        headers = dict(headers or {}, Age=str(age))
+        headers['X-Cache'] = CACHE_STATUS_HEADERS[status]
+        if svg:
+            return encoded_response(body, target['mimetype'], cache_key=target['key'], headers=headers)
+        return Response(body, mimetype=target['mimetype'], headers=headers)
+
+    except PlexUnavailableError as e:
+        logger.error("No se pudo crear cliente de Plex")
+        metrics.BADGE_RENDERS.inc(outcome='error')
+        return on_error(f"Error: {e}")
+    except RenderPoolError as e:
+        metrics.BADGE_RENDERS.inc(outcome='error')
+        return render_unavailable(e)
     except Exception as e:
-        logger.error(f"Error generando SVG: {e}")
-        return generate_error_svg(f"Error: {str(e)}")
+        logger.error("Error generando badge: %s", e)
+        metrics.BADGE_RENDERS.inc(outcome='error')
+        return on_error(f"Error: {str(e)}")
+
+
+@app.route('/api/now-playing')
+def api_now_playing():
+    """Endpoint principal que genera y devuelve la imagen de reproducción actual"""
+    return serve_badge(svg=False, on_error=generate_error_image, headers={'Vary': 'Accept'})
+
+
+@app.route('/api/now-playing-svg')
+def api_now_playing_svg():
+    """Endpoint que genera y devuelve SVG animado de reproducción actual"""
+    return serve_badge(svg=True, on_error=generate_error_svg)
 
 
 @app.route('/api/now-playing-png')
 def api_now_playing_png():
     """Endpoint que genera y devuelve PNG estático de reproducción actual"""
+    return serve_badge(svg=False, on_error=lambda message: Response(message, mimetype='text/plain', status=500),
+                       headers=dict(NO_CACHE_HEADERS, Vary='Accept'))
+
+
+# Suscriptores SSE: comparten un sondeo a Plex por servidor y usuario
+now_playing_hub = NowPlayingHub()
+
+# Cabeceras de los streams SSE (sin cache ni buffering en proxies)
+STREAM_HEADERS = {'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+
+
+def stream_session_fetcher(token: str = None, user: str = None):
+    """Función de sondeo de un feed: reutiliza el cliente de Plex entre consultas"""
+    state = {'client': None}
+
+    def query():
+        if state['client'] is None:
+            state['client'] = create_plex_client(token)
+            if state['client'] is None:
+                raise PlexUnavailableError("Plex no configurado")
+        return resolve_session_data(state['client'], user)
+
+    def fetch():
+        # Otro worker o nodo pudo consultar Plex para el mismo usuario en este intervalo de sondeo
+        return cache_backends.get_or_compute('sessions', session_snapshot_key(token, user), query,
+                                             ttl=SWR_FRESH_SECONDS, max_age=now_playing_hub.poll_seconds)
+    return fetch
+
+
+@app.route('/api/now-playing/stream')
+def api_now_playing_stream():
+    """Server-Sent Events con un evento por cada cambio de lo que muestra el badge"""
+    token = request.args.get('token')
+    user = request.args.get('user')
+    try:
+        subscription = now_playing_hub.subscribe((token or '', user), stream_session_fetcher(token, user))
+    except StreamFull as e:
+        logger.warning("Stream rechazado: %s", e)
+        return Response("Demasiados suscriptores, reintenta más tarde", mimetype='text/plain',
+                        status=503, headers={'Retry-After': '30'})
+    last_id = request.headers.get('Last-Event-ID') or request.args.get('lastEventId')
+    response = Response(stream_with_context(now_playing_hub.events(subscription, last_id)),
+                        mimetype='text/event-stream', headers=STREAM_HEADERS)
+    # Si el stream no llega a empezar (HEAD, cliente que se va antes), la baja se hace al cerrar
+    response.call_on_close(subscription.close)
+    return response
+
+
+# Sesión (sin render) por servidor y usuario para /api/now-playing.json
+session_swr = StaleWhileRevalidate(name='session')
+
+# Las URLs del proxy de carátulas cambian con la imagen: se pueden cachear mucho tiempo
+ARTWORK_CACHE_CONTROL = 'public, max-age=86400'
+
+
+def conditional_body(body: bytes, if_none_match: str, accept_encoding: str = None, headers: dict = None) -> tuple:
+    """
+    Aplica ETag/If-None-Match (y compresión si se indica Accept-Encoding)
+
+    Returns:
+        Tupla (estado 200 o 304, cuerpo, cabeceras)
+    """
+    etag = make_etag(body)
+    headers = dict(headers or {}, ETag=etag)
+    if etag_matches(if_none_match, etag):
+        if accept_encoding is not None:
+            headers['Vary'] = ', '.join(filter(None, [headers.get('Vary'), 'Accept-Encoding']))
+        return 304, b'', headers
+    if accept_encoding is not None:
+        body, headers = encode_body(body, accept_encoding, headers=headers)
+    return 200, body, headers
+
+
+@app.route('/api/now-playing.json')
+def api_now_playing_json():
+    """Datos de la sesión en JSON (con carátula por proxy) para clientes que dibujan el badge"""
+    token = request.args.get('token')
+    user = request.args.get('user')
+    key = ('session', token or '', user)
+    force_refresh = request.args.get('refresh', 'false').lower() == 'true'
+    try:
+        session_data, age, status = session_swr.get(
+            key, lambda: badge_flights.do(key, lambda: fetch_session(token, user, force_refresh))[0],
+            refresh=force_refresh)
+    except PlexUnavailableError as e:
+        return jsonify({'error': str(e)}), 500
+    except Exception as e:
+        logger.error("Error obteniendo sesión: %s", e)
+        return jsonify({'error': str(e)}), 500
+
+    payload = select_fields(session_payload(session_data, request.url_root, token), request.args.get('fields'))
+    code, body, headers = conditional_body(
+        json_body(payload), request.headers.get('If-None-Match'), request.headers.get('Accept-Encoding'),
+        {'Cache-Control': 'no-cache', 'Age': str(age), 'X-Cache': CACHE_STATUS_HEADERS[status]})
+    return Response(body, status=code, mimetype='application/json', headers=headers)
+
+
+@app.route('/api/artwork')
+def api_artwork():
+    """Proxy de carátulas de Plex (sin exponer el token del servidor)"""
+    path = artwork_path(request.args.get('path'))
+    if path is None:
+        return Response("Ruta de carátula no válida", mimetype='text/plain', status=400)
+    plex_client = create_plex_client(request.args.get('token'))
+    if not plex_client:
+        return Response("Plex no configurado", mimetype='text/plain', status=500)
+    data = fetch_artwork(plex_artwork_url(plex_client.base_url, plex_client.token, path))
+    mimetype = sniff_mimetype(data) if data else None
+    if mimetype not in IMAGE_MIMETYPES:
+        return Response("Carátula no disponible", mimetype='text/plain', status=404)
+    code, body, headers = conditional_body(data, request.headers.get('If-None-Match'),
+                                           headers={'Cache-Control': ARTWORK_CACHE_CONTROL})
+    return Response(body, status=code, mimetype=mimetype, headers=headers)
+
+
+# Máximo de variantes por petición batch
+BATCH_MAX_VARIANTS = int(os.getenv('BATCH_MAX_VARIANTS', 24))
+
+
+def parse_batch_variants() -> list:
+    """
+    Lee las variantes pedidas: JSON {"variants": [{"format", "theme", "width", "height"}]}
+    o el parámetro variants=formato:tema:ANCHOxALTO[@ESCALA],...
+
+    Raises:
+        ValueError: si alguna variante no es válida
+    """
+    default_theme = os.getenv('DEFAULT_THEME', 'normal')
+    default_width = int(os.getenv('IMAGE_WIDTH', 400))
+    payload = request.get_json(silent=True) if request.method == 'POST' else None
+    if payload is not None:
+        raw = payload.get('variants') if isinstance(payload, dict) else payload
+        if not isinstance(raw, list):
+            raise ValueError("Se esperaba una lista 'variants'")
+    else:
+        raw = []
+        for spec in filter(None, request.args.get('variants', '').split(',')):
+            fmt, _, rest = spec.partition(':')
+            theme, _, size = rest.partition(':')
+            width, _, height = size.partition('x')
+            height, _, scale = height.partition('@')
+            raw.append({'format': fmt, 'theme': theme or None, 'width': width or None,
+                        'height': height or None, 'scale': scale or 1})
+
+    if not raw:
+        raise ValueError("No se indicó ninguna variante")
+    if len(raw) > BATCH_MAX_VARIANTS:
+        raise ValueError(f"Máximo {BATCH_MAX_VARIANTS} variantes por petición")
+
+    variants = []
+    for item in raw:
+        if not isinstance(item, dict):
+            raise ValueError(f"Variante no válida: {item!r}")
+        requested = str(item.get('format') or 'png').lower()
+        fmt = 'svg' if requested == 'svg' else normalize_format(requested)
+        if fmt is None:
+            raise ValueError(f"Formato no soportado: {requested}")
+        try:
+            width = int(item.get('width') or default_width)
+            height = int(item.get('height') or 90)
+            effort = clamp_effort(int(item['effort'])) if item.get('effort') is not None else clamp_effort(None)
+        except (TypeError, ValueError):
+            raise ValueError(f"Tamaño o esfuerzo no válido: {item!r}")
+        if not (0 < width <= MAX_BADGE_WIDTH and 0 < height <= MAX_BADGE_HEIGHT):
+            raise ValueError(f"Tamaño fuera de rango: {width}x{height}")
+        variants.append({'format': fmt, 'theme': item.get('theme') or default_theme,
+                         'width': width, 'height': height, 'effort': effort,
+                         'scale': normalize_scale(item.get('scale', 1)),
+                         'equalizer': item.get('equalizer')})
+    return variants
+
+
+def multipart_bundle(parts: list) -> Response:
+    """Empaqueta las variantes como multipart/mixed (una parte por variante)"""
+    boundary = os.urandom(16).hex()
+    chunks = []
+    for part in parts:
+        headers = [f"Content-Type: {part['mimetype']}",
+                   f"Content-Disposition: inline; name=\"{part['name']}\"",
+                   f"Content-Length: {len(part['body'])}"]
+        if part.get('error'):
+            headers.append(f"X-Render-Error: {part['error']}")
+        header_block = ''.join(f"{header}\r\n" for header in headers)
+        chunks.append(f"--{boundary}\r\n{header_block}\r\n".encode('utf-8'))
+        chunks.append(part['body'] + b"\r\n")
+    chunks.append(f"--{boundary}--\r\n".encode('utf-8'))
+    return Response(b''.join(chunks), mimetype=f'multipart/mixed; boundary={boundary}')
+
+
+@app.route('/api/now-playing/batch', methods=['GET', 'POST'])
+def api_now_playing_batch():
+    """Renderiza varias variantes (formato, tema, tamaño) de la misma sesión en una sola llamada"""
+    try:
+        variants = parse_batch_variants()
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
     try:
-        # Parámetros de la petición
-        theme = request.args.get('theme', os.getenv('DEFAULT_THEME', 'normal'))
-        width = int(request.args.get('width', os.getenv('IMAGE_WIDTH', 400)))
-        height = int(request.args.get('height', 90))  # Forzado a 90, ignorando IMAGE_HEIGHT
-        
-        # Obtener cliente Plex
         token = request.args.get('token')
         plex_client = create_plex_client(token)
         if not plex_client:
-            logger.error("No se pudo crear cliente Plex")
-            return "Error: No se pudo conectar a Plex", 500
-        
-        # Obtener sesión actual
-        allowed_user = request.args.get('user')
-        session_data = plex_client.get_current_session(allowed_user)
-        logger.info(f"Datos de sesión obtenidos para PNG: {session_data}")
-        
-        # Si no hay sesión activa, intentar usar historial
-        if not session_data:
-            import time
-            offset = int(time.time() // 30) % 5  # Alternar entre 0-4 cada 30 segundos
-            history_data = plex_client.get_recent_playback_history(allowed_user, limit=10, offset=offset)
-            logger.info(f"PNG: Historial obtenido: {history_data}")
-            if history_data:
-                logger.info("No hay sesión activa, usando historial de reproducciones para PNG")
-                session_data = history_data
-            else:
-                logger.info("No hay sesión activa, historial ni cache, generando PNG de 'sin actividad'")
-                session_data = None
-        # Generar imagen PNG
-        logger.info(f"Generando PNG con dimensiones: {width}x{height}")
-        image_generator = ImageGenerator(theme=theme, width=width, height=height)
-        image_buffer = image_generator.generate_now_playing_image(session_data)
-        image_bytes = image_buffer.getvalue()  # Convertir BytesIO a bytes
-        logger.info(f"PNG generado exitosamente - Tema: {theme}, Dimensiones: {width}x{height}, Tamaño: {len(image_bytes)} bytes")
-        return Response(
-            image_bytes,
-            mimetype='image/png',
-            headers={
-                'Cache-Control': 'no-cache, no-store, must-revalidate',
-                'Pragma': 'no-cache',
-                'Expires': '0'
-            }
-        )
-        
+            logger.error("No se pudo crear cliente de Plex")
+            return jsonify({'error': 'Plex no configurado'}), 500
+
+        # Sesión y carátula se resuelven una sola vez para todas las variantes
+        session_data = resolve_session_data(plex_client, request.args.get('user'))
+        executor = get_render_executor()
+        pending = []
+        for variant in variants:
+            target = render_target(variant['format'], session_data, variant['theme'], variant['width'],
+                                   variant['height'], effort=variant['effort'], equalizer_mode=variant['equalizer'],
+                                   scale=variant['scale'])
+            body = get_cached_render(target)
+            future, job, error = None, None, None
+            if body is None:
+                job = render_job(target['kind'], session_data, variant['theme'], variant['width'],
+                                 variant['height'], **target['options'])
+                try:
+                    future = executor.submit(job)
+                except RenderPoolError as e:
+                    error = str(e)
+            pending.append((variant, target, body, future, job, error))
+
+        # Los trabajos ya están en el pool: se recogen en orden mientras se renderizan en paralelo
+        parts = []
+        for variant, target, body, future, job, error in pending:
+            if future is not None:
+                try:
+                    body = executor.result(future, job)
+                    put_cached_render(target, body)
+                except Exception as e:
+                    error = str(e)
+            parts.append({
+                'name': f"{variant['format']}-{variant['theme']}-{variant['width']}x{variant['height']}"
+                        + (f"@{variant['scale']}x" if variant['scale'] > 1 and variant['format'] != 'svg' else ''),
+                'format': variant['format'],
+                'theme': variant['theme'],
+                'width': variant['width'],
+                'height': variant['height'],
+                'mimetype': target['mimetype'] if error is None else 'text/plain',
+                'body': body if error is None else error.encode('utf-8'),
+                'error': error,
+            })
+        logger.info("Batch renderizado: %d variantes, %d con error", len(parts), sum(1 for p in parts if p['error']))
+
+        if request.args.get('bundle') == 'multipart' or 'multipart/mixed' in request.headers.get('Accept', ''):
+            return multipart_bundle(parts)
+        bundle = {
+            'session': session_fingerprint(session_data),
+            'variants': [
+                {key: part[key] for key in ('name', 'format', 'theme', 'width', 'height', 'mimetype')}
+                | ({'error': part['error']} if part['error'] else
+                   {'bytes': len(part['body']), 'data': base64.b64encode(part['body']).decode('ascii')})
+                for part in parts
+            ],
+        }
+        return encoded_response(jsonify(bundle).get_data(), 'application/json')
+
     except Exception as e:
-        logger.error(f"Error generando PNG: {e}")
-        return "Error generando imagen PNG", 500
+        logger.error("Error en render batch: %s", e)
+        return jsonify({'error': str(e)}), 500
+
+
+# Estado instantáneo del pool de render y de los streams en /metrics
+metrics.REGISTRY.register(metrics.Gauge(
+    'plex2sign_render_in_flight', 'Renders en ejecución o en cola', lambda: get_render_executor().stats()['in_flight']))
+metrics.REGISTRY.register(metrics.Gauge(
+    'plex2sign_render_queue_depth', 'Renders esperando un proceso libre',
+    lambda: get_render_executor().stats()['queue_depth']))
+metrics.REGISTRY.register(metrics.Gauge(
+    'plex2sign_stream_subscribers', 'Suscriptores SSE conectados', lambda: now_playing_hub.stats()['subscribers']))
+
+# Caches de este módulo en /api/debug/caches (las de carátulas, plantillas y fuentes se registran solas)
+register_cache('render', render_cache)
+register_cache('animation', animation_cache)
+register_cache('badge_swr', badge_swr.store)
+register_cache('session_swr', session_swr.store)
+register_cache('stream_feeds', lambda: {'entries': now_playing_hub.stats()['feeds']})
+
+
+@app.route('/metrics')
+def api_metrics():
+    """Métricas del proceso en formato de texto de Prometheus"""
+    return Response(metrics.REGISTRY.render(), content_type=metrics.CONTENT_TYPE)
+
+
+@app.route('/api/debug/<name>')
+def api_debug(name: str):
+    """Perfil de CPU, diferencias de memoria y tamaño de las caches (requiere DIAGNOSTICS_TOKEN)"""
+    status, body, content_type, headers = diagnostics_response(name, request.args, request.headers)
+    return Response(body, status=status, mimetype=content_type, headers=headers)
 
 
 @app.route('/api/cache/clear')
@@ -393,9 +982,21 @@ def api_clear_cache():
         'session_data': None,
         'cache_duration': image_cache['cache_duration']
     }
+    render_cache.clear()
+    animation_cache.clear()
+    badge_swr.clear()
+    session_swr.clear()
+    clear_artwork_caches()
+    for store in (disk_cache.get_disk_cache(), cache_backends.get_cache_backend()):
+        if store:
+            store.clear()
     return jsonify({'success': True, 'message': 'Cache limpiado'})
 
 
+# Fuentes, plantillas, imágenes idle y módulos pesados antes de la primera petición (WARMUP)
+start_warm_up()
+
+
 if __name__ == '__main__':
     # Verificar configuración
     if not os.getenv('PLEX_URL') or not os.getenv('PLEX_TOKEN'):
@@ -408,5 +1009,5 @@ if __name__ == '__main__':
     port = int(os.getenv('PORT', 5000))
     debug = os.getenv('DEBUG', 'false').lower() == 'true'
     
-    logger.info(f"🚀 Iniciando Plex2Sign en puerto {port}")
+    logger.info("🚀 Iniciando Plex2Sign en puerto %s", port)
     app.run(host='0.0.0.0', port=port, debug=debug)
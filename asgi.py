@@ -0,0 +1,400 @@
+"""
+Plex2Sign - Punto de entrada ASGI
+
+Sirve los mismos endpoints de badge que app.py, pero con E/S asíncrona: las
+consultas a Plex y la descarga de carátulas no ocupan un hilo por petición, y el
+render (CPU) se delega al ejecutor de renders. Comparte caches y parámetros con
+la aplicación Flask.
+
+Uso:
+    uvicorn asgi:app --host 0.0.0.0 --port 5000
+"""
+import json
+import time
+import asyncio
+import logging
+from typing import Optional
+from urllib.parse import parse_qsl
+import httpx
+from api.async_plex_client import get_async_plex_client
+from api.artwork import fetch_artwork_async, sniff_mimetype, IMAGE_MIMETYPES
+from api.render_pool import RenderJob, RenderPoolError, get_render_executor
+from api.singleflight import AsyncSingleFlight
+from api.stream import StreamFull
+from api import metrics
+from api.tracing import traced
+from api.diagnostics import diagnostics_response, profiler
+from api.cache import session_fingerprint
+from api.cache_backends import aget_or_compute
+from api.swr import SWR_FRESH_SECONDS
+from api.session_json import session_payload, select_fields, json_body, artwork_path, plex_artwork_url
+from app import (
+    render_target, get_cached_render, put_cached_render, load_shared_render, store_shared_render, encode_body,
+    index_html, build_status,
+    error_image_png, error_svg, read_badge_params, badge_flight_key, badge_swr, PlexUnavailableError,
+    CACHE_STATUS_HEADERS, NO_CACHE_HEADERS, now_playing_hub, stream_session_fetcher, STREAM_HEADERS,
+    session_swr, conditional_body, ARTWORK_CACHE_CONTROL, badge_outcome, wants_trace, badge_trace,
+    log_badge, session_snapshot_key,
+)
+
+logger = logging.getLogger(__name__)
+
+# Cliente HTTP compartido (pool de conexiones keep-alive a Plex), creado en el arranque
+_http: Optional[httpx.AsyncClient] = None
+
+# Equivalente asyncio de badge_flights: las peticiones idénticas comparten consulta y render
+badge_async_flights = AsyncSingleFlight()
+
+
+class Headers(dict):
+    """Cabeceras de la petición, sin distinguir mayúsculas"""
+
+    def get(self, key, default=None):
+        return super().get(key.lower(), default)
+
+
+class Request:
+    """Lo necesario de un scope HTTP de ASGI"""
+
+    def __init__(self, scope: dict):
+        self.method = scope['method']
+        self.path = scope['path']
+        # Como request.args de Flask: si un parámetro se repite, gana el primero
+        self.args = {}
+        for name, value in parse_qsl(scope.get('query_string', b'').decode('latin-1'), keep_blank_values=True):
+            self.args.setdefault(name, value)
+        self.headers = Headers((name.decode('latin-1').lower(), value.decode('latin-1'))
+                               for name, value in scope.get('headers', []))
+        scheme = scope.get('scheme', 'http')
+        self.url_root = f"{scheme}://{self.headers.get('Host', 'localhost')}/"
+
+
+class Response:
+    """Respuesta HTTP mínima"""
+
+    def __init__(self, body, mimetype: str = 'text/plain', status: int = 200, headers: dict = None):
+        self.body = body.encode('utf-8') if isinstance(body, str) else body
+        self.mimetype = mimetype
+        self.status = status
+        self.headers = dict(headers or {})
+
+    def raw_headers(self, length: Optional[int]) -> list:
+        content_type = self.mimetype
+        if content_type.startswith('text/') or content_type in ('application/json', 'image/svg+xml'):
+            content_type += '; charset=utf-8'
+        headers = [(b'content-type', content_type.encode('latin-1'))]
+        if length is not None:
+            headers.append((b'content-length', str(length).encode('latin-1')))
+        return headers + [(name.lower().encode('latin-1'), str(value).encode('latin-1'))
+                          for name, value in self.headers.items()]
+
+    async def send(self, send, receive, head_only: bool = False) -> None:
+        await send({'type': 'http.response.start', 'status': self.status,
+                    'headers': self.raw_headers(len(self.body))})
+        await send({'type': 'http.response.body', 'body': b'' if head_only else self.body})
+
+
+class StreamingResponse(Response):
+    """Respuesta enviada por trozos desde un generador asíncrono de texto"""
+
+    def __init__(self, chunks, mimetype: str, headers: dict = None, on_close=None):
+        super().__init__(b'', mimetype=mimetype, headers=headers)
+        self.chunks = chunks
+        self.on_close = on_close
+
+    async def send(self, send, receive, head_only: bool = False) -> None:
+        await send({'type': 'http.response.start', 'status': self.status, 'headers': self.raw_headers(None)})
+        if head_only:
+            await self.chunks.aclose()
+            if self.on_close:
+                self.on_close()
+            await send({'type': 'http.response.body', 'body': b''})
+            return
+
+        async def stream():
+            async for chunk in self.chunks:
+                await send({'type': 'http.response.body', 'body': chunk.encode('utf-8'), 'more_body': True})
+
+        async def disconnected():
+            while (await receive())['type'] != 'http.disconnect':
+                pass
+
+        # Termina cuando el cliente se desconecta: al cancelar, el generador da de baja al suscriptor
+        tasks = {asyncio.ensure_future(stream()), asyncio.ensure_future(disconnected())}
+        try:
+            await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            await self.chunks.aclose()
+            if self.on_close:
+                self.on_close()
+
+
+def encoded_response(request: Request, body: bytes, mimetype: str, cache_key=None, headers: dict = None) -> Response:
+    """Como encoded_response de app.py, con el Accept-Encoding de la petición ASGI"""
+    body, headers = encode_body(body, request.headers.get('Accept-Encoding'), cache_key, headers)
+    return Response(body, mimetype=mimetype, headers=headers)
+
+
+async def resolve_session_data(plex_client, allowed_user: str = None):
+    """Sesión actual del usuario o, si no hay, una entrada reciente del historial (None si nada)"""
+    session_data = await plex_client.get_current_session(allowed_user)
+    if not session_data:
+        offset = int(time.time() // 30) % 5  # Alternar entre 0-4 cada 30 segundos
+        session_data = await plex_client.get_recent_playback_history(allowed_user, limit=10, offset=offset) or None
+    return session_data
+
+
+async def fetch_session(token: str = None, user: str = None, refresh: bool = False):
+    """Versión asíncrona de fetch_session de app.py (un solo worker o nodo consulta Plex por usuario)"""
+    async def query():
+        plex_client = await get_async_plex_client(_http, token)
+        if not plex_client:
+            raise PlexUnavailableError("Plex no configurado")
+        return await resolve_session_data(plex_client, user)
+    return await aget_or_compute('sessions', session_snapshot_key(token, user), query,
+                                 ttl=SWR_FRESH_SECONDS, refresh=refresh)
+
+
+async def build_badge(params: dict, refresh: bool = False) -> tuple:
+    """
+    Versión asíncrona de build_badge de app.py
+
+    Returns:
+        Tupla (cuerpo, render_target)
+    """
+    session_data = await fetch_session(params['token'], params['user'], refresh)
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug("Sesión obtenida: %s", session_fingerprint(session_data))
+
+    target = render_target(params['fmt'], session_data, params['theme'], params['width'], params['height'],
+                           effort=params['effort'], equalizer_mode=params['equalizer_mode'], scale=params['scale'])
+    # Backend de cache y disco hacen E/S bloqueante: fuera del bucle de eventos
+    body = get_cached_render(target, shared=False)
+    if body is None:
+        body = await asyncio.to_thread(load_shared_render, target)
+    if body is None:
+        artwork = None
+        if session_data and session_data.get('thumb'):
+            artwork = await fetch_artwork_async(session_data['thumb'], _http)
+        job = RenderJob(target['kind'], session_data, params['theme'], params['width'], params['height'],
+                        artwork=artwork, **target['options'])
+        body = await get_render_executor().run_async(job)
+        put_cached_render(target, body, shared=False)
+        await asyncio.to_thread(store_shared_render, target, body)
+    metrics.BADGE_RENDERS.inc(outcome=badge_outcome(session_data))
+    return body, target
+
+
+async def serve_badge(request: Request, svg: bool, on_error, headers: dict = None) -> Response:
+    """Pipeline común de los endpoints de badge (ver serve_badge en app.py)"""
+    try:
+        params = read_badge_params(svg, request.args, request.headers)
+        key = badge_flight_key(params)
+        force_refresh = request.args.get('refresh', 'false').lower() == 'true'
+
+        async def compute():
+            return (await badge_async_flights.do(key, lambda: build_badge(params, force_refresh)))[0]
+
+        (body, target), age, status = await badge_swr.aget(key, compute, refresh=force_refresh)
+        log_badge(params, status, age, body)
+        if wants_trace(request.args):
+            return Response(json.dumps(badge_trace(params, status, age, body)), mimetype='application/json')
+        headers = dict(headers or {}, Age=str(age))
+        headers['X-Cache'] = CACHE_STATUS_HEADERS[status]
+        if svg:
+            return encoded_response(request, body, target['mimetype'], cache_key=target['key'], headers=headers)
+        return Response(body, mimetype=target['mimetype'], headers=headers)
+
+    except PlexUnavailableError as e:
+        logger.error("No se pudo crear cliente de Plex")
+        metrics.BADGE_RENDERS.inc(outcome='error')
+        return await on_error(f"Error: {e}")
+    except RenderPoolError as e:
+        logger.warning("Render rechazado: %s", e)
+        metrics.BADGE_RENDERS.inc(outcome='error')
+        return Response("Render no disponible, reintenta en unos segundos", status=503, headers={'Retry-After': '1'})
+    except Exception as e:
+        logger.error("Error generando badge: %s", e)
+        metrics.BADGE_RENDERS.inc(outcome='error')
+        return await on_error(f"Error: {str(e)}")
+
+
+async def error_image_response(message: str) -> Response:
+    try:
+        return Response(await asyncio.to_thread(error_image_png), mimetype='image/png')
+    except Exception as e:
+        logger.error("Error generando imagen de error: %s", e)
+        return Response("Error", status=500)
+
+
+async def error_svg_response(message: str) -> Response:
+    return Response(error_svg(message), mimetype='image/svg+xml')
+
+
+async def error_text_response(message: str) -> Response:
+    return Response(message, status=500)
+
+
+async def index(request: Request) -> Response:
+    """Página principal con información del proyecto"""
+    return Response(index_html(request.url_root), mimetype='text/html')
+
+
+async def api_status(request: Request) -> Response:
+    """Endpoint para verificar el estado del sistema"""
+    plex_client = await get_async_plex_client(_http, request.args.get('token'))
+    if plex_client:
+        status = build_status(await plex_client.get_server_info(), await plex_client.get_current_session())
+    else:
+        status = build_status()
+    status['singleflight'] = badge_async_flights.stats()
+    return encoded_response(request, json.dumps(status).encode('utf-8'), 'application/json')
+
+
+async def api_now_playing(request: Request) -> Response:
+    """Endpoint principal que genera y devuelve la imagen de reproducción actual"""
+    return await serve_badge(request, svg=False, on_error=error_image_response, headers={'Vary': 'Accept'})
+
+
+async def api_now_playing_svg(request: Request) -> Response:
+    """Endpoint que genera y devuelve SVG animado de reproducción actual"""
+    return await serve_badge(request, svg=True, on_error=error_svg_response)
+
+
+async def api_now_playing_png(request: Request) -> Response:
+    """Endpoint que genera y devuelve PNG estático de reproducción actual"""
+    return await serve_badge(request, svg=False, on_error=error_text_response,
+                             headers=dict(NO_CACHE_HEADERS, Vary='Accept'))
+
+
+async def api_now_playing_stream(request: Request) -> Response:
+    """Server-Sent Events con un evento por cada cambio de lo que muestra el badge"""
+    token = request.args.get('token')
+    user = request.args.get('user')
+    try:
+        subscription = now_playing_hub.subscribe((token or '', user), stream_session_fetcher(token, user))
+    except StreamFull as e:
+        logger.warning("Stream rechazado: %s", e)
+        return Response("Demasiados suscriptores, reintenta más tarde", status=503, headers={'Retry-After': '30'})
+    last_id = request.headers.get('Last-Event-ID') or request.args.get('lastEventId')
+    return StreamingResponse(now_playing_hub.aevents(subscription, last_id), mimetype='text/event-stream',
+                             headers=STREAM_HEADERS, on_close=subscription.close)
+
+
+async def api_now_playing_json(request: Request) -> Response:
+    """Datos de la sesión en JSON (con carátula por proxy) para clientes que dibujan el badge"""
+    token = request.args.get('token')
+    user = request.args.get('user')
+    key = ('session', token or '', user)
+    force_refresh = request.args.get('refresh', 'false').lower() == 'true'
+
+    async def compute():
+        return (await badge_async_flights.do(key, lambda: fetch_session(token, user, force_refresh)))[0]
+
+    try:
+        session_data, age, status = await session_swr.aget(key, compute, refresh=force_refresh)
+    except Exception as e:
+        logger.error("Error obteniendo sesión: %s", e)
+        return Response(json.dumps({'error': str(e)}), mimetype='application/json', status=500)
+
+    payload = select_fields(session_payload(session_data, request.url_root, token), request.args.get('fields'))
+    code, body, headers = conditional_body(
+        json_body(payload), request.headers.get('If-None-Match'), request.headers.get('Accept-Encoding'),
+        {'Cache-Control': 'no-cache', 'Age': str(age), 'X-Cache': CACHE_STATUS_HEADERS[status]})
+    return Response(body, mimetype='application/json', status=code, headers=headers)
+
+
+async def api_artwork(request: Request) -> Response:
+    """Proxy de carátulas de Plex (sin exponer el token del servidor)"""
+    path = artwork_path(request.args.get('path'))
+    if path is None:
+        return Response("Ruta de carátula no válida", status=400)
+    plex_client = await get_async_plex_client(_http, request.args.get('token'))
+    if not plex_client:
+        return Response("Plex no configurado", status=500)
+    data = await fetch_artwork_async(plex_artwork_url(plex_client.base_url, plex_client.token, path), _http)
+    mimetype = sniff_mimetype(data) if data else None
+    if mimetype not in IMAGE_MIMETYPES:
+        return Response("Carátula no disponible", status=404)
+    code, body, headers = conditional_body(data, request.headers.get('If-None-Match'),
+                                           headers={'Cache-Control': ARTWORK_CACHE_CONTROL})
+    return Response(body, mimetype=mimetype, status=code, headers=headers)
+
+
+async def api_metrics(request: Request) -> Response:
+    """Métricas del proceso en formato de texto de Prometheus"""
+    return Response(metrics.REGISTRY.render(), mimetype=metrics.CONTENT_TYPE)
+
+
+async def api_debug(request: Request) -> Response:
+    """Perfil de CPU, diferencias de memoria y tamaño de las caches (requiere DIAGNOSTICS_TOKEN)"""
+    # El perfil bloquea durante la captura: fuera del bucle de eventos, que es lo que se mide
+    status, body, content_type, headers = await asyncio.to_thread(
+        diagnostics_response, request.path.rsplit('/', 1)[-1], request.args, request.headers)
+    return Response(body, mimetype=content_type, status=status, headers=headers)
+
+
+ROUTES = {
+    '/': index,
+    '/api/status': api_status,
+    '/api/now-playing': api_now_playing,
+    '/api/now-playing-svg': api_now_playing_svg,
+    '/api/now-playing-png': api_now_playing_png,
+    '/api/now-playing/stream': api_now_playing_stream,
+    '/api/now-playing.json': api_now_playing_json,
+    '/api/artwork': api_artwork,
+    '/metrics': api_metrics,
+    '/api/debug/profile': api_debug,
+    '/api/debug/memory': api_debug,
+    '/api/debug/caches': api_debug,
+}
+
+
+async def lifespan(receive, send) -> None:
+    """Arranque y parada: cliente HTTP compartido y pool de render"""
+    global _http
+    while True:
+        message = await receive()
+        if message['type'] == 'lifespan.startup':
+            _http = httpx.AsyncClient(limits=httpx.Limits(max_keepalive_connections=20))
+            logger.info("🚀 Plex2Sign (ASGI) iniciado")
+            await send({'type': 'lifespan.startup.complete'})
+        elif message['type'] == 'lifespan.shutdown':
+            if _http is not None:
+                await _http.aclose()
+                _http = None
+            get_render_executor().shutdown()
+            await send({'type': 'lifespan.shutdown.complete'})
+            return
+
+
+async def app(scope, receive, send) -> None:
+    """Aplicación ASGI"""
+    global _http
+    if scope['type'] == 'lifespan':
+        await lifespan(receive, send)
+        return
+    if scope['type'] != 'http':
+        return
+
+    request = Request(scope)
+    handler = ROUTES.get(request.path)
+    if handler is None:
+        response = Response("Not Found", status=404)
+    elif request.method not in ('GET', 'HEAD'):
+        response = Response("Method Not Allowed", status=405, headers={'Allow': 'GET, HEAD'})
+    else:
+        if _http is None:
+            # Servidor sin soporte de lifespan: se crea en la primera petición
+            _http = httpx.AsyncClient(limits=httpx.Limits(max_keepalive_connections=20))
+        with traced() as trace:
+            response = await handler(request)
+            # En un stream la respuesta sale antes de que ocurra nada que medir
+            if not isinstance(response, StreamingResponse):
+                response.headers['Server-Timing'] = trace.server_timing()
+    await response.send(send, receive, head_only=request.method == 'HEAD')
+    # Perfil por número de peticiones (/api/debug/profile?requests=N)
+    profiler.note_request()
@@ -0,0 +1,63 @@
+#!/usr/bin/env python3
+"""
+Benchmark de carátulas: bytes transferidos y tiempo de decodificación del original
+completo frente a la versión del transcodificador de Plex y al modo draft de JPEG
+"""
+import io
+import os
+import sys
+import time
+import argparse
+
+# Añadir el directorio raíz al path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from PIL import Image
+from api.artwork import ARTWORK_DECODE_SIZE, decode_artwork
+from benchmark_svg import synthetic_artwork
+
+
+def full_decode(data: bytes, size: int):
+    """Decodificación anterior: imagen completa y reducción con LANCZOS"""
+    image = Image.open(io.BytesIO(data))
+    image.thumbnail((size, size), Image.Resampling.LANCZOS)
+    return image
+
+
+def transcoded_equivalent(data: bytes, size: int) -> bytes:
+    """Simula la respuesta de /photo/:/transcode: la carátula ya reducida en JPEG"""
+    image = full_decode(data, size).convert('RGB')
+    buffer = io.BytesIO()
+    image.save(buffer, format='JPEG', quality=90)
+    return buffer.getvalue()
+
+
+def timed(function, data: bytes, size: int, iterations: int) -> float:
+    """Milisegundos medios por llamada"""
+    start = time.perf_counter()
+    for _ in range(iterations):
+        function(data, size)
+    return (time.perf_counter() - start) * 1000 / iterations
+
+
+def main():
+    """Función principal"""
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--iterations', type=int, default=10, help='Repeticiones por medida')
+    parser.add_argument('--size', type=int, default=ARTWORK_DECODE_SIZE, help='Lado pedido en píxeles')
+    args = parser.parse_args()
+
+    print(f"🧪 Plex2Sign - Benchmark de carátulas (lado pedido: {args.size}px)\n")
+    print(f"{'original':>9} {'bytes orig.':>12} {'bytes transc.':>14} {'ms completa':>12} {'ms draft':>9} {'ms transc.':>11}")
+    print("-" * 72)
+    for side in (1000, 2000, 3000):
+        original = synthetic_artwork(side)
+        transcoded = transcoded_equivalent(original, args.size)
+        full_ms = timed(full_decode, original, args.size, args.iterations)
+        draft_ms = timed(decode_artwork, original, args.size, args.iterations)
+        transcoded_ms = timed(decode_artwork, transcoded, args.size, args.iterations)
+        print(f"{side:>7}px {len(original):>12} {len(transcoded):>14} {full_ms:>12.1f} {draft_ms:>9.1f} {transcoded_ms:>11.1f}")
+
+
+if __name__ == '__main__':
+    main()
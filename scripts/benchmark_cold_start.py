@@ -0,0 +1,134 @@
+#!/usr/bin/env python3
+"""
+Arranque en frío: tiempo de importación y latencia de las primeras peticiones
+
+Cada ejecución es un proceso nuevo (como una función serverless recién creada)
+que importa la aplicación y atiende las primeras peticiones contra el Plex
+simulado con el cliente de pruebas de Flask. Se informa de la mediana de:
+importar app.py (y asgi.py) y la primera y segunda petición de cada endpoint.
+--warmup elige el modo de calentamiento (WARMUP) y --importtime lista los
+módulos que más tardan en importarse.
+
+Uso:
+    python scripts/benchmark_cold_start.py --runs 9
+    python scripts/benchmark_cold_start.py --warmup sync --importtime 15
+"""
+import os
+import sys
+import json
+import argparse
+import statistics
+import subprocess
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(ROOT)
+
+from fake_plex import FakePlexServer, FIXTURE_USER
+
+ENDPOINTS = {
+    'status': '/api/status',
+    'png': '/api/now-playing-png',
+    'svg': '/api/now-playing-svg',
+    'json': '/api/now-playing.json',
+}
+
+# Se ejecuta en el proceso nuevo: recibe la configuración en argv y devuelve los tiempos en JSON por stdout
+CHILD = """
+import sys, json, time
+options = json.loads(sys.argv[1])
+start = time.perf_counter()
+import app
+timings = {'import_app': time.perf_counter() - start}
+server_timing = {}
+if options['asgi']:
+    start = time.perf_counter()
+    import asgi
+    timings['import_asgi'] = time.perf_counter() - start
+client = app.app.test_client()
+for name, path in options['endpoints'].items():
+    for attempt in ('first', 'second'):
+        start = time.perf_counter()
+        response = client.get(path, query_string={'user': options['user']})
+        timings[name + '_' + attempt] = time.perf_counter() - start
+        if response.status_code != 200:
+            timings[name + '_status'] = response.status_code
+        if attempt == 'first':
+            server_timing[name] = response.headers.get('Server-Timing')
+print(json.dumps({'timings': timings, 'server_timing': server_timing}))
+"""
+
+
+def run_child(env: dict, asgi: bool) -> dict:
+    options = json.dumps({'asgi': asgi, 'endpoints': ENDPOINTS, 'user': FIXTURE_USER})
+    result = subprocess.run([sys.executable, '-c', CHILD, options], cwd=ROOT, env=env, capture_output=True,
+                            text=True, timeout=120)
+    if result.returncode != 0:
+        raise RuntimeError(result.stderr[-2000:])
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def import_profile(env: dict, top: int) -> list:
+    """Módulos con mayor tiempo de importación acumulado (python -X importtime)"""
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', 'import app'], cwd=ROOT, env=env,
+                            capture_output=True, text=True, timeout=120)
+    rows = []
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, module = line[len('import time:'):].split('|')
+        rows.append((int(cumulative) / 1000, module.rstrip()))
+    # Solo paquetes de primer nivel de la aplicación o de terceros (indentación <= 2)
+    rows = [(ms, module.strip()) for ms, module in rows if len(module) - len(module.lstrip()) <= 3]
+    return sorted(rows, reverse=True)[:top]
+
+
+def main():
+    """Función principal"""
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--runs', type=int, default=5, help='Procesos nuevos a medir')
+    parser.add_argument('--warmup', choices=('off', 'background', 'sync'), default='off',
+                        help="Modo de calentamiento de la aplicación (WARMUP); 'sync' cuenta dentro de la importación")
+    parser.add_argument('--asgi', action='store_true', help='Medir también la importación de asgi.py')
+    parser.add_argument('--workers', default='0',
+                        help='RENDER_WORKERS de la aplicación (por defecto 0: render en línea, como en serverless)')
+    parser.add_argument('--importtime', type=int, metavar='N', default=0, help='Listar los N imports más lentos')
+    parser.add_argument('--json', metavar='FICHERO', help='Guardar los resultados en JSON')
+    args = parser.parse_args()
+
+    pms = FakePlexServer(latency=0.005).start()
+    env = dict(os.environ, **pms.app_env(discovery=False), RENDER_WORKERS=args.workers, WARMUP=args.warmup)
+    print(f"🧊 Plex2Sign - Arranque en frío ({args.runs} procesos, calentamiento '{args.warmup}')\n")
+    try:
+        results = [run_child(env, args.asgi) for _ in range(args.runs)]
+        rows = import_profile(env, args.importtime) if args.importtime else []
+    finally:
+        pms.stop()
+
+    runs = [result['timings'] for result in results]
+    medians = {name: statistics.median(run[name] for run in runs) * 1000
+               for name in runs[0] if not name.endswith('_status')}
+    for name, ms in medians.items():
+        print(f"   {name:<16} {ms:>9.1f} ms")
+    errors = {name: run[name] for run in runs for name in run if name.endswith('_status')}
+    if errors:
+        print(f"\n   ⚠️  Respuestas con error: {errors}")
+    first = medians['import_app'] + medians['png_first']
+    print(f"\n   Importar + primer PNG: {first:.1f} ms")
+    # Dónde se va la primera petición (última ejecución): Plex, carátula, render...
+    print("\n⏱️  Server-Timing de la primera petición:")
+    for name, value in results[-1]['server_timing'].items():
+        print(f"   {name:<7} {value}")
+
+    if rows:
+        print("\n📦 Imports más lentos (acumulado):")
+        for ms, module in rows:
+            print(f"   {module:<32} {ms:>8.1f} ms")
+
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump({'warmup': args.warmup, 'runs': results, 'median_ms': medians, 'imports': rows}, f, indent=2)
+        print(f"\n💾 Resultados guardados en {args.json}")
+
+
+if __name__ == '__main__':
+    main()
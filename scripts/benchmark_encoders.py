@@ -0,0 +1,73 @@
+#!/usr/bin/env python3
+"""
+Benchmark de codificadores: tiempo de codificación frente a tamaño para cada formato y esfuerzo
+"""
+import os
+import sys
+import time
+import argparse
+
+# Añadir el directorio raíz al path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from PIL import Image
+from api.image_generator import ImageGenerator
+from api.image_encoder import encode_image
+
+# Datos de prueba (mismos que scripts/test_connection.py)
+TEST_DATA = {
+    'title': 'Canción de Prueba',
+    'type': 'track',
+    'state': 'playing',
+    'user': 'TestUser',
+    'progress': 120,
+    'duration': 240,
+    'track_title': 'Canción de Prueba',
+    'artist': 'Artista de Prueba',
+    'album': 'Álbum de Prueba',
+    'thumb': 'benchmark://artwork',
+}
+
+
+class BenchmarkImageGenerator(ImageGenerator):
+    """ImageGenerator con una carátula sintética para no depender de Plex"""
+
+    def _download_thumbnail(self, url: str, target_size: tuple = (120, 120)):
+        gradient = Image.linear_gradient('L').resize(target_size)
+        return Image.merge('RGB', (gradient, gradient.rotate(90), Image.new('L', target_size, 128))).convert('RGBA')
+
+
+def main():
+    """Función principal"""
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--iterations', type=int, default=20, help='Repeticiones por combinación')
+    parser.add_argument('--theme', default='normal', help='Tema a renderizar')
+    args = parser.parse_args()
+
+    generator = BenchmarkImageGenerator(theme=args.theme)
+    render = generator.render_now_playing_image(TEST_DATA)
+
+    print(f"🧪 Plex2Sign - Benchmark de codificadores ({render.size[0]}x{render.size[1]}, {args.iterations} iteraciones)\n")
+    print(f"{'formato':<8} {'esfuerzo':>8} {'ms/imagen':>10} {'bytes':>8}")
+    print("-" * 37)
+
+    for fmt in ('png', 'png8', 'webp'):
+        for effort in (0, 1, 3, 6, 9):
+            start = time.perf_counter()
+            for _ in range(args.iterations):
+                data = encode_image(render, fmt, effort)
+            elapsed_ms = (time.perf_counter() - start) * 1000 / args.iterations
+            print(f"{fmt:<8} {effort:>8} {elapsed_ms:>10.2f} {len(data):>8}")
+
+    # Referencia: la llamada original con optimize=True
+    import io
+    start = time.perf_counter()
+    for _ in range(args.iterations):
+        buffer = io.BytesIO()
+        render.save(buffer, format='PNG', optimize=True)
+    elapsed_ms = (time.perf_counter() - start) * 1000 / args.iterations
+    print(f"\nReferencia PNG optimize=True: {elapsed_ms:.2f} ms/imagen, {len(buffer.getvalue())} bytes")
+
+
+if __name__ == '__main__':
+    main()
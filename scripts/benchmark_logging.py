@@ -0,0 +1,147 @@
+#!/usr/bin/env python3
+"""
+Coste del logging en el camino de render
+
+Renderiza las sesiones de scripts/fixtures/sessions.json (PNG y SVG) y consulta
+sesiones e historial al Plex simulado con dos configuraciones de logging al mismo
+nivel: 'sync' (un StreamHandler que formatea y escribe en el hilo de la petición,
+como logging.basicConfig) y 'async' (api.logs.configure_logging: cola, límite por
+tipo de mensaje y escritura en otro hilo). Informa de la mediana por llamada y de
+los registros emitidos y escritos por llamada.
+
+Uso:
+    python scripts/benchmark_logging.py
+    python scripts/benchmark_logging.py --level DEBUG --repeat 30 --output /tmp/plex2sign.log
+"""
+import os
+import sys
+import time
+import logging
+import argparse
+import statistics
+
+# Añadir el directorio raíz al path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from api.logs import configure_logging, shutdown_logging, logging_stats, TEXT_FORMAT
+from api.image_generator import ImageGenerator
+from api.svg_generator import SVGGenerator
+from benchmark_stages import load_fixtures, artwork_corpus, artwork_url, prime_artwork
+from fake_plex import FakePlexServer, FIXTURE_USER
+
+MODES = ('sync', 'async')
+
+
+class CountingHandler(logging.Handler):
+    """Cuenta los registros que llegan al logger raíz (antes del límite de frecuencia)"""
+
+    def __init__(self):
+        super().__init__()
+        self.count = 0
+
+    def emit(self, record: logging.LogRecord) -> None:
+        self.count += 1
+
+
+def use_logging(mode: str, level: int, stream) -> None:
+    root = logging.getLogger()
+    if mode == 'async':
+        configure_logging(level, stream=stream)
+        return
+    shutdown_logging()
+    for handler in root.handlers[:]:
+        root.removeHandler(handler)
+    handler = logging.StreamHandler(stream)
+    handler.setFormatter(logging.Formatter(TEXT_FORMAT))
+    root.addHandler(handler)
+    root.setLevel(level)
+
+
+def build_cases(plex_client) -> list:
+    """Lista de (nombre, llamada, setup)"""
+    corpus = artwork_corpus()
+    image = ImageGenerator()
+    svg = SVGGenerator()
+    cases = []
+    for fixture in load_fixtures():
+        if fixture['name'] not in ('track', 'track_history', 'episode', 'idle'):
+            continue
+        session = fixture['session']
+        data = corpus.get(fixture['artwork']) if fixture['artwork'] else None
+        if session and data:
+            session = dict(session, thumb=artwork_url(fixture['artwork']))
+        setup = (lambda url=artwork_url(fixture['artwork']), data=data: prime_artwork(url, data)) if data else None
+        cases.append((f"png/{fixture['name']}", lambda session=session: image.generate_now_playing_image(session), setup))
+        cases.append((f"svg/{fixture['name']}", lambda session=session: svg.generate_now_playing_svg(session), setup))
+    if plex_client is not None:
+        cases.append(('plex/sessions', lambda: plex_client.get_current_session(FIXTURE_USER), None))
+        cases.append(('plex/history', lambda: plex_client.get_recent_playback_history(FIXTURE_USER), None))
+    return cases
+
+
+def run(cases: list, mode: str, level: int, stream, repeat: int) -> dict:
+    """Mediana (ms) y registros por llamada de cada caso con la configuración dada"""
+    use_logging(mode, level, stream)
+    counter = CountingHandler()
+    logging.getLogger().addHandler(counter)
+    results = {}
+    try:
+        for name, call, setup in cases:
+            if setup:
+                setup()
+            call()  # calentamiento
+            counter.count = 0
+            samples = []
+            for _ in range(repeat):
+                if setup:
+                    setup()
+                start = time.perf_counter()
+                call()
+                samples.append(time.perf_counter() - start)
+            results[name] = {'ms': statistics.median(samples) * 1000, 'records': counter.count / repeat}
+    finally:
+        logging.getLogger().removeHandler(counter)
+    if mode == 'async':
+        results['_dropped'] = logging_stats()
+    return results
+
+
+def main():
+    """Función principal"""
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--level', default='INFO', choices=('DEBUG', 'INFO', 'WARNING'), help='Nivel del logger raíz')
+    parser.add_argument('--repeat', type=int, default=15, help='Muestras por caso')
+    parser.add_argument('--output', default=os.devnull, help='Destino de los registros (por defecto, descartados)')
+    parser.add_argument('--no-plex', action='store_true', help='No consultar sesiones e historial al Plex simulado')
+    args = parser.parse_args()
+
+    level = getattr(logging, args.level)
+    pms = plex_client = None
+    if not args.no_plex:
+        pms = FakePlexServer(scenario='idle').start()
+        os.environ.update(pms.app_env(discovery=False))
+        from api.plex_client import create_plex_client
+        plex_client = create_plex_client()
+
+    print(f"📝 Plex2Sign - Coste del logging ({args.level}, {args.repeat} muestras)\n")
+    results = {}
+    with open(args.output, 'a', encoding='utf-8') as stream:
+        cases = build_cases(plex_client)
+        for mode in MODES:
+            results[mode] = run(cases, mode, level, stream, args.repeat)
+        shutdown_logging()
+    if pms is not None:
+        pms.stop()
+
+    print(f"{'caso':<22} {'sync ms':>9} {'async ms':>9} {'registros':>10}")
+    print("-" * 54)
+    for name, _, _ in cases:
+        sync, asynchronous = results['sync'][name], results['async'][name]
+        print(f"{name:<22} {sync['ms']:>9.2f} {asynchronous['ms']:>9.2f} {sync['records']:>10.1f}")
+    dropped = results['async']['_dropped']
+    print(f"\n   Descartados en modo async: {dropped['rate_limited']} por límite de frecuencia, "
+          f"{dropped['queue_full']} por cola llena")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,73 @@
+#!/usr/bin/env python3
+"""
+Benchmark del ejecutor de renders: ráfaga de renders sin cache servidos en línea
+frente al pool de procesos, con las métricas de cola y utilización
+"""
+import os
+import sys
+import time
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+
+# Añadir el directorio raíz al path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from api.render_pool import RenderExecutor, RenderJob, RenderPoolError
+from benchmark_svg import TEST_DATA, ARTWORK_URL, synthetic_artwork
+
+
+def run_burst(executor: RenderExecutor, jobs: list, clients: int) -> tuple:
+    """Lanza los trabajos desde varios hilos a la vez, como peticiones concurrentes"""
+    def request(job):
+        try:
+            executor.run(job)
+            return True
+        except RenderPoolError:
+            return False
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=clients) as threads:
+        results = list(threads.map(request, jobs))
+    return time.perf_counter() - start, results.count(False)
+
+
+def main():
+    """Función principal"""
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--jobs', type=int, default=48, help='Renders de la ráfaga')
+    parser.add_argument('--clients', type=int, default=16, help='Peticiones concurrentes')
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1, help='Procesos del pool')
+    parser.add_argument('--queue', type=int, default=64, help='Tamaño de la cola')
+    args = parser.parse_args()
+
+    artwork = synthetic_artwork()
+    track = dict(TEST_DATA, thumb=ARTWORK_URL)
+    print(f"🧪 Plex2Sign - Benchmark del pool de render ({args.jobs} renders, {args.clients} clientes)\n")
+    print(f"{'modo':<10} {'tipo':<6} {'s total':>8} {'renders/s':>10} {'rechazados':>11} {'espera media ms':>16} {'utilización':>12}")
+    print("-" * 80)
+
+    for workers in (0, args.workers):
+        executor = RenderExecutor(workers=workers, queue_size=args.queue, timeout=60)
+        label = f"{workers} proc" if workers else 'en línea'
+        for kind, options in (('image', {'fmt': 'png'}), ('svg', {})):
+            # Calentar los procesos antes de medir
+            run_burst(executor, [RenderJob(kind, None, 'normal', 400, 90, **options)] * max(1, workers), max(1, workers))
+            jobs = [RenderJob(kind, dict(track, title=f"Canción {i}"), 'normal', 400, 90, artwork=artwork, **options)
+                    for i in range(args.jobs)]
+            elapsed, rejected = run_burst(executor, jobs, args.clients)
+            stats = executor.stats()
+            print(f"{label:<10} {kind:<6} {elapsed:>8.2f} {args.jobs / elapsed:>10.1f} {rejected:>11} "
+                  f"{stats['wait_ms_avg']:>16.1f} {stats['utilization']:>12.2%}")
+        executor.shutdown()
+
+    # Cola acotada: con la cola llena, los trabajos sobrantes se rechazan al instante
+    executor = RenderExecutor(workers=1, queue_size=2, timeout=60)
+    jobs = [RenderJob('image', dict(track, title=f"Canción {i}"), 'normal', 400, 90, artwork=artwork, fmt='png')
+            for i in range(12)]
+    _, rejected = run_burst(executor, jobs, 12)
+    executor.shutdown()
+    print(f"\n📦 Cola acotada (1 proceso, cola 2, 12 peticiones simultáneas): {rejected} rechazadas")
+
+
+if __name__ == '__main__':
+    main()
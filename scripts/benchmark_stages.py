@@ -0,0 +1,300 @@
+#!/usr/bin/env python3
+"""
+Micro-benchmark por etapas del pipeline de render, con línea base y detección de regresiones
+
+Mide por separado la generación completa (SVG y PNG) de cada sesión de
+scripts/fixtures/sessions.json y las funciones internas más costosas sobre un
+corpus de carátulas: extracción de paleta, carátula embebida, barras estáticas y
+truncado de texto. Las caches de carátulas se preparan antes de cada muestra, de
+modo que cada caso mide solo su propio trabajo.
+
+Uso:
+    python scripts/benchmark_stages.py --save baseline.json      # en la rama base
+    python scripts/benchmark_stages.py --compare baseline.json   # falla si algo empeora
+"""
+import io
+import os
+import sys
+import json
+import time
+import random
+import platform
+import argparse
+import statistics
+from datetime import datetime, timezone
+
+# Añadir el directorio raíz al path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from PIL import Image, ImageDraw
+from api.svg_generator import SVGGenerator
+from api.image_generator import ImageGenerator, load_fonts
+from api.artwork import put_artwork, clear_artwork_caches, get_decoded_artwork
+from api.themes import get_theme
+
+FIXTURES_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures', 'sessions.json')
+
+BASELINE_VERSION = 1
+
+
+def _noise(size: tuple, seed: int) -> Image.Image:
+    """Ruido en escala de grises reproducible (Image.effect_noise no admite semilla)"""
+    return Image.frombytes('L', size, random.Random(seed).randbytes(size[0] * size[1]))
+
+
+def _encode(image: Image.Image, fmt: str, **options) -> bytes:
+    buffer = io.BytesIO()
+    image.save(buffer, format=fmt, **options)
+    return buffer.getvalue()
+
+
+def artwork_corpus() -> dict:
+    """
+    Carátulas representativas, generadas de forma determinista
+
+    - album_photo: portada fotográfica 1000x1000 en JPEG (lo habitual)
+    - album_alpha: PNG 600x600 con transparencia
+    - album_flat: PNG 500x500 de pocos colores planos (ilustraciones, portadas minimalistas)
+    - poster_large: póster 2000x3000 en JPEG (servidores sin transcodificador)
+    - poster_gray: póster 680x1000 en escala de grises
+    """
+    photo = Image.merge('RGB', (Image.linear_gradient('L').resize((1000, 1000)),
+                                Image.linear_gradient('L').rotate(90).resize((1000, 1000)),
+                                _noise((1000, 1000), 1)))
+    alpha = Image.merge('RGBA', (_noise((600, 600), 2), Image.new('L', (600, 600), 140),
+                                 Image.radial_gradient('L').resize((600, 600)),
+                                 Image.radial_gradient('L').resize((600, 600)).point(lambda v: 255 - v)))
+    flat = Image.new('RGB', (500, 500), (230, 57, 70))
+    draw = ImageDraw.Draw(flat)
+    draw.rectangle((0, 250, 500, 500), fill=(29, 53, 87))
+    draw.ellipse((150, 150, 350, 350), fill=(241, 250, 238))
+    poster = Image.merge('RGB', (_noise((2000, 3000), 3), Image.linear_gradient('L').resize((2000, 3000)),
+                                 _noise((2000, 3000), 4)))
+    gray = Image.linear_gradient('L').resize((680, 1000)).point(lambda v: v // 2 + 40)
+    return {
+        'album_photo': _encode(photo, 'JPEG', quality=90),
+        'album_alpha': _encode(alpha, 'PNG'),
+        'album_flat': _encode(flat, 'PNG'),
+        'poster_large': _encode(poster, 'JPEG', quality=85),
+        'poster_gray': _encode(gray, 'JPEG', quality=90),
+    }
+
+
+def load_fixtures(path: str = FIXTURES_PATH) -> list:
+    """Sesiones grabadas: lista de {'name', 'artwork', 'session'}"""
+    with open(path, encoding='utf-8') as f:
+        return json.load(f)['sessions']
+
+
+def load_artwork_dir(path: str) -> dict:
+    """Carátulas reales adicionales (JPEG/PNG/WebP de un directorio)"""
+    corpus = {}
+    for name in sorted(os.listdir(path)):
+        if name.lower().endswith(('.jpg', '.jpeg', '.png', '.webp')):
+            with open(os.path.join(path, name), 'rb') as f:
+                corpus[os.path.splitext(name)[0]] = f.read()
+    return corpus
+
+
+def artwork_url(name: str) -> str:
+    return f'benchmark://{name}'
+
+
+def prime_artwork(url: str, data: bytes, decoded: bool = False) -> None:
+    """Deja en cache solo los bytes descargados (y, si se pide, la decodificación)"""
+    clear_artwork_caches()
+    put_artwork(url, data)
+    if decoded:
+        get_decoded_artwork(url)
+
+
+def measure(call, setup=None, number: int = 1, repeat: int = 20) -> dict:
+    """
+    Mide la función: `repeat` muestras de `number` llamadas, con setup() fuera de la medición
+
+    Returns:
+        Diccionario con mediana, mínimo y desviación en milisegundos por llamada
+    """
+    samples = []
+    for _ in range(repeat):
+        if setup:
+            setup()
+        start = time.perf_counter()
+        for _ in range(number):
+            call()
+        samples.append((time.perf_counter() - start) * 1000 / number)
+    return {
+        'median_ms': round(statistics.median(samples), 4),
+        'min_ms': round(min(samples), 4),
+        'stdev_ms': round(statistics.stdev(samples), 4) if len(samples) > 1 else 0.0,
+        'repeat': repeat,
+        'number': number,
+    }
+
+
+def build_cases(fixtures: list, corpus: dict, theme: str) -> list:
+    """
+    Casos del benchmark: lista de (nombre, llamada, setup, llamadas por muestra)
+
+    Los casos por sesión renderizan desde los bytes de la carátula (como un trabajo
+    del pool); los de carátula miden la función con la decodificación ya en cache.
+    """
+    cases = []
+    svg = SVGGenerator(theme=theme)
+    image = ImageGenerator(theme=theme)
+
+    for fixture in fixtures:
+        session = fixture['session']
+        data = corpus.get(fixture['artwork']) if fixture['artwork'] else None
+        if session and data:
+            session = dict(session, thumb=artwork_url(fixture['artwork']))
+        if data:
+            def setup(url=artwork_url(fixture['artwork']), data=data):
+                prime_artwork(url, data)
+        else:
+            setup = clear_artwork_caches
+        cases.append((f"svg.generate_now_playing_svg/{fixture['name']}",
+                      lambda session=session: svg.generate_now_playing_svg(session), setup, 1))
+        cases.append((f"image.generate_now_playing_image/{fixture['name']}",
+                      lambda session=session: image.generate_now_playing_image(session), setup, 1))
+
+    theme_data = get_theme(theme)
+    for name, data in corpus.items():
+        url = artwork_url(name)
+
+        def setup(url=url, data=data):
+            prime_artwork(url, data, decoded=True)
+        cases.append((f"svg._extract_colors_from_image/{name}",
+                      lambda url=url: svg._extract_colors_from_image(url), setup, 1))
+        cases.append((f"svg._get_thumbnail_base64/{name}",
+                      lambda url=url: svg._get_thumbnail_base64(url), setup, 1))
+
+        state = {}
+
+        def bars_setup(url=url, data=data, state=state):
+            prime_artwork(url, data, decoded=True)
+            state['img'] = Image.new('RGBA', image.layout['canvas'], (255, 255, 255, 0))
+            state['draw'] = ImageDraw.Draw(state['img'])
+            state['thumbnail'] = image._download_thumbnail(url)
+
+        cases.append((f"image._generate_static_bars/{name}",
+                      lambda state=state: image._generate_static_bars(state['draw'], state['img'], theme_data,
+                                                                      state['thumbnail']),
+                      bars_setup, 1))
+
+    # Textos de las sesiones: se mide el lote completo por llamada
+    texts = []
+    for fixture in fixtures:
+        session = fixture['session'] or {}
+        texts.extend(str(session[key]) for key in ('title', 'artist', 'album', 'show_title') if session.get(key))
+    font_title, _ = load_fonts(image.layout['title_font'], image.layout['subtitle_font'])
+    draw = ImageDraw.Draw(Image.new('RGBA', image.layout['canvas']))
+    max_width = image.layout['text_max_width']
+    cases.append(('svg._truncate_text', lambda: [svg._truncate_text(text, 40) for text in texts], None, 200))
+    cases.append(('image._truncate_text',
+                  lambda: [image._truncate_text(draw, text, font_title, max_width) for text in texts], None, 20))
+    return cases
+
+
+def machine_info() -> dict:
+    return {
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'processor': platform.processor() or platform.machine(),
+        'cpus': os.cpu_count(),
+    }
+
+
+def compare(results: dict, baseline: dict, threshold: float, min_delta_ms: float) -> list:
+    """
+    Casos que empeoran más del umbral respecto a la línea base (según la mediana)
+
+    Returns:
+        Lista de (nombre, mediana base, mediana actual, cambio relativo)
+    """
+    regressions = []
+    for name, result in results.items():
+        base = baseline['cases'].get(name)
+        if base is None:
+            continue
+        before, after = base['median_ms'], result['median_ms']
+        change = (after - before) / before if before else 0.0
+        if change > threshold and after - before > min_delta_ms:
+            regressions.append((name, before, after, change))
+    return regressions
+
+
+def main():
+    """Función principal"""
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--repeat', type=int, default=20, help='Muestras por caso')
+    parser.add_argument('--theme', default='normal', help='Tema a renderizar')
+    parser.add_argument('--filter', help='Ejecutar solo los casos cuyo nombre contenga este texto')
+    parser.add_argument('--fixtures', default=FIXTURES_PATH, help='Fichero JSON de sesiones grabadas')
+    parser.add_argument('--artwork-dir', help='Directorio con carátulas reales para añadir al corpus')
+    parser.add_argument('--save', metavar='FICHERO', help='Guardar los resultados como línea base (JSON)')
+    parser.add_argument('--compare', metavar='FICHERO', help='Comparar con una línea base y fallar si hay regresiones')
+    parser.add_argument('--threshold', type=float, default=0.25,
+                        help='Empeoramiento relativo de la mediana que se considera regresión (0.25 = 25%%)')
+    parser.add_argument('--min-delta-ms', type=float, default=0.05,
+                        help='Diferencia absoluta mínima para contar como regresión (evita ruido en casos de µs)')
+    args = parser.parse_args()
+
+    corpus = artwork_corpus()
+    if args.artwork_dir:
+        corpus.update(load_artwork_dir(args.artwork_dir))
+    cases = build_cases(load_fixtures(args.fixtures), corpus, args.theme)
+    if args.filter:
+        cases = [case for case in cases if args.filter in case[0]]
+
+    baseline = None
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as f:
+            baseline = json.load(f)
+
+    print(f"🧪 Plex2Sign - Benchmark por etapas ({len(cases)} casos, {args.repeat} muestras)\n")
+    header = f"{'caso':<58} {'mediana ms':>11} {'mín ms':>9}"
+    if baseline:
+        header += f" {'base ms':>9} {'cambio':>8}"
+    print(header)
+    print("-" * len(header))
+
+    results = {}
+    for name, call, setup, number in cases:
+        # Una llamada de calentamiento (importaciones, fuentes, plantillas)
+        if setup:
+            setup()
+        call()
+        result = results[name] = measure(call, setup, number, args.repeat)
+        line = f"{name:<58} {result['median_ms']:>11.3f} {result['min_ms']:>9.3f}"
+        if baseline:
+            base = baseline['cases'].get(name)
+            if base:
+                change = (result['median_ms'] - base['median_ms']) / base['median_ms'] if base['median_ms'] else 0.0
+                line += f" {base['median_ms']:>9.3f} {change:>+8.1%}"
+            else:
+                line += f" {'-':>9} {'nuevo':>8}"
+        print(line)
+
+    if args.save:
+        with open(args.save, 'w', encoding='utf-8') as f:
+            json.dump({'version': BASELINE_VERSION, 'created': datetime.now(timezone.utc).isoformat(),
+                       'machine': machine_info(), 'theme': args.theme, 'cases': results},
+                      f, indent=2, sort_keys=True)
+            f.write('\n')
+        print(f"\n💾 Línea base guardada en {args.save}")
+
+    if baseline:
+        if baseline.get('machine') != machine_info():
+            print("\n⚠️  La línea base se grabó en otra máquina o versión de Python: compara con cautela")
+        regressions = compare(results, baseline, args.threshold, args.min_delta_ms)
+        if regressions:
+            print(f"\n❌ {len(regressions)} regresiones (umbral {args.threshold:.0%}):")
+            for name, before, after, change in regressions:
+                print(f"   {name}: {before:.3f} ms -> {after:.3f} ms ({change:+.1%})")
+            sys.exit(1)
+        print(f"\n✅ Sin regresiones por encima del {args.threshold:.0%}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,110 @@
+#!/usr/bin/env python3
+"""
+Benchmark del generador SVG: tiempo de generación y bytes por badge en cada modo
+de ecualizador, y tamaño de la carátula embebida en cada formato
+"""
+import io
+import os
+import sys
+import time
+import argparse
+
+# Añadir el directorio raíz al path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from PIL import Image
+from api import svg_generator
+from api.svg_generator import SVGGenerator
+from api.artwork import put_artwork, clear_artwork_caches
+
+# Datos de prueba (mismos que scripts/test_connection.py)
+TEST_DATA = {
+    'title': 'Canción de Prueba',
+    'type': 'track',
+    'state': 'playing',
+    'user': 'TestUser',
+    'progress': 120,
+    'duration': 240,
+    'track_title': 'Canción de Prueba',
+    'artist': 'Artista de Prueba',
+    'album': 'Álbum de Prueba',
+}
+
+EPISODE_DATA = {
+    'title': 'Episodio de Prueba',
+    'type': 'episode',
+    'state': 'playing',
+    'user': 'TestUser',
+    'progress': 600,
+    'duration': 2400,
+    'show_title': 'Serie de Prueba',
+    'season': 2,
+    'episode': 5,
+    'episode_title': 'Episodio de Prueba',
+}
+
+
+ARTWORK_URL = 'benchmark://artwork'
+
+
+def synthetic_artwork(size: int = 1000) -> bytes:
+    """Genera una carátula 'fotográfica' sintética (degradados + ruido) en JPEG"""
+    gradient = Image.linear_gradient('L').resize((size, size))
+    noise = Image.effect_noise((size, size), 40)
+    image = Image.merge('RGB', (gradient, gradient.rotate(90), noise))
+    buffer = io.BytesIO()
+    image.save(buffer, format='JPEG', quality=90)
+    return buffer.getvalue()
+
+
+def benchmark_artwork(data: bytes, theme: str) -> None:
+    """Compara el tamaño del badge según el formato y escala de la carátula embebida"""
+    print(f"\n🖼️  Carátula embebida (original: {len(data)} bytes)\n")
+    print(f"{'formato':<8} {'escala':>6} {'ms/badge':>9} {'bytes carátula':>15} {'bytes badge':>12}")
+    print("-" * 54)
+    track = dict(TEST_DATA, thumb=ARTWORK_URL)
+    for fmt, scale in (('png', 1.5), ('png', 1), ('jpeg', 1), ('jpeg', 2), ('webp', 1), ('webp', 2)):
+        # 'png' a escala 1.5 (120px) reproduce el comportamiento anterior
+        svg_generator.ARTWORK_FORMAT = fmt
+        svg_generator.ARTWORK_SCALE = scale
+        clear_artwork_caches()
+        put_artwork(ARTWORK_URL, data)
+        generator = SVGGenerator(theme=theme)
+        start = time.perf_counter()
+        svg = generator.render_now_playing_svg(track)
+        elapsed_ms = (time.perf_counter() - start) * 1000
+        artwork_bytes = len(generator._get_thumbnail_base64(ARTWORK_URL))
+        print(f"{fmt:<8} {scale:>6} {elapsed_ms:>9.2f} {artwork_bytes:>15} {len(svg):>12}")
+
+
+def main():
+    """Función principal"""
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--iterations', type=int, default=200, help='Repeticiones por combinación')
+    parser.add_argument('--theme', default='normal', help='Tema a renderizar')
+    parser.add_argument('--artwork', help='Carátula local a embeber (por defecto, una sintética)')
+    args = parser.parse_args()
+
+    print(f"🧪 Plex2Sign - Benchmark SVG ({args.iterations} iteraciones)\n")
+    print(f"{'tipo':<8} {'modo':<8} {'ms/badge':>9} {'bytes':>8}")
+    print("-" * 36)
+
+    for label, data in (('track', TEST_DATA), ('episode', EPISODE_DATA)):
+        for mode in ('smil', 'compact'):
+            generator = SVGGenerator(theme=args.theme, equalizer_mode=mode)
+            start = time.perf_counter()
+            for _ in range(args.iterations):
+                svg = generator.generate_now_playing_svg(data)
+            elapsed_ms = (time.perf_counter() - start) * 1000 / args.iterations
+            print(f"{label:<8} {mode:<8} {elapsed_ms:>9.3f} {len(svg.encode('utf-8')):>8}")
+
+    if args.artwork:
+        with open(args.artwork, 'rb') as f:
+            artwork = f.read()
+    else:
+        artwork = synthetic_artwork()
+    benchmark_artwork(artwork, args.theme)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,264 @@
+#!/usr/bin/env python3
+"""
+Servidor Plex simulado (Plex Media Server y plex.tv) para pruebas de carga sin cuenta real
+
+Sirve respuestas grabadas de scripts/fixtures/plex (/api/resources, /api/v2/user,
+/status/sessions, historial y metadatos) y carátulas sintéticas, con latencia,
+errores y timeouts inyectables. El mismo servidor hace de plex.tv (PLEX_TV_URL)
+y de PMS: /api/resources anuncia su propia dirección como conexión del servidor.
+
+Uso independiente:
+    python scripts/fake_plex.py --port 32400 --latency 50 --error-rate 0.05
+    PLEX_TV_URL=http://127.0.0.1:32400 PLEX_TOKEN=fixture python app.py
+"""
+import os
+import sys
+import time
+import random
+import argparse
+import threading
+from collections import Counter
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from typing import Dict, Optional, Sequence
+from urllib.parse import urlsplit, parse_qs
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from benchmark_svg import synthetic_artwork
+
+FIXTURES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures', 'plex')
+
+# Usuario de las respuestas grabadas (dueño del token y de la sesión de música)
+FIXTURE_USER = 'fixture'
+FIXTURE_TOKEN = 'fixture'
+
+SCENARIOS = ('playing', 'idle')
+
+
+def load_fixture(name: str) -> bytes:
+    with open(os.path.join(FIXTURES_DIR, name), 'rb') as f:
+        return f.read()
+
+
+class FakePlexServer:
+    """
+    PMS + plex.tv simulados en un hilo, con fallos inyectables
+
+    Los fallos se deciden por petición: con probabilidad error_rate se responde 500
+    y con timeout_rate la respuesta se retrasa timeout_seconds (más que los plazos
+    de los clientes). Si se indica fault_paths, solo fallan las rutas con esos prefijos.
+    """
+
+    def __init__(self, host: str = '127.0.0.1', port: int = 0, latency: float = 0.0, jitter: float = 0.0,
+                 error_rate: float = 0.0, timeout_rate: float = 0.0, timeout_seconds: float = 30.0,
+                 fault_paths: Sequence[str] = (), scenario: str = 'playing', artwork: Optional[bytes] = None,
+                 require_token: bool = True, seed: Optional[int] = None):
+        """
+        Args:
+            host: Dirección de escucha
+            port: Puerto (0 = uno libre)
+            latency: Latencia fija por petición en segundos
+            jitter: Variación aleatoria adicional (0..jitter segundos)
+            error_rate: Fracción de peticiones que responden 500
+            timeout_rate: Fracción de peticiones que tardan timeout_seconds
+            timeout_seconds: Retraso de las peticiones que simulan un timeout
+            fault_paths: Prefijos de ruta a los que se aplican los fallos (vacío = todos)
+            scenario: 'playing' (hay sesiones) o 'idle' (sin sesiones: se usa el historial)
+            artwork: Bytes de la carátula servida (por defecto, una sintética)
+            require_token: Responder 401 a las peticiones sin X-Plex-Token
+            seed: Semilla de los fallos y el jitter (reproducibles)
+        """
+        if scenario not in SCENARIOS:
+            raise ValueError(f"Escenario no soportado: {scenario}")
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.timeout_rate = timeout_rate
+        self.timeout_seconds = timeout_seconds
+        self.fault_paths = tuple(fault_paths)
+        self.scenario = scenario
+        self.artwork = artwork if artwork is not None else synthetic_artwork()
+        self.require_token = require_token
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self.requests: Counter = Counter()
+        self.faults: Counter = Counter()
+        self._httpd = ThreadingHTTPServer((host, port), self._handler())
+        self._httpd.daemon_threads = True
+        self._thread: Optional[threading.Thread] = None
+        self._responses = self._load_responses()
+
+    @property
+    def url(self) -> str:
+        host, port = self._httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def _load_responses(self) -> Dict[str, bytes]:
+        port = self._httpd.server_address[1]
+        resources = load_fixture('resources.xml').replace(b'{base_url}', self.url.encode()) \
+                                                 .replace(b'{port}', str(port).encode())
+        metadata_dir = os.path.join(FIXTURES_DIR, 'metadata')
+        responses = {
+            '/': load_fixture('identity.xml'),
+            '/identity': load_fixture('identity.xml'),
+            '/library': load_fixture('library.xml'),
+            '/api/resources': resources,
+            '/api/v2/user': load_fixture('user.xml'),
+            '/status/sessions': load_fixture('sessions.xml' if self.scenario == 'playing' else 'sessions_idle.xml'),
+            '/status/sessions/history/all': load_fixture('history.xml'),
+        }
+        for name in os.listdir(metadata_dir):
+            responses[f"/library/metadata/{os.path.splitext(name)[0]}"] = load_fixture(os.path.join('metadata', name))
+        return responses
+
+    def _fault(self, path: str) -> Optional[str]:
+        """Fallo a inyectar en la petición: 'error', 'timeout' o None"""
+        if self.fault_paths and not path.startswith(self.fault_paths):
+            return None
+        with self._lock:
+            roll = self._random.random()
+        if roll < self.error_rate:
+            return 'error'
+        if roll < self.error_rate + self.timeout_rate:
+            return 'timeout'
+        return None
+
+    def _delay(self) -> float:
+        if not self.jitter:
+            return self.latency
+        with self._lock:
+            return self.latency + self._random.uniform(0, self.jitter)
+
+    def _route(self, path: str):
+        """(cuerpo, tipo) de la ruta o None si no existe"""
+        body = self._responses.get(path.rstrip('/') or '/')
+        if body is not None:
+            return body, 'application/xml'
+        # Carátulas: /library/metadata/<id>/thumb/<fecha>, /library/.../art/... y el transcodificador
+        if path.startswith('/library/') or path.startswith('/photo/'):
+            return self.artwork, 'image/jpeg'
+        return None
+
+    def _handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def do_GET(self):
+                parts = urlsplit(self.path)
+                path = parts.path
+                route = server._route(path)
+                with server._lock:
+                    server.requests['artwork' if route and route[1] == 'image/jpeg' else path] += 1
+
+                time.sleep(server._delay())
+                fault = server._fault(path)
+                if fault is not None:
+                    with server._lock:
+                        server.faults[fault] += 1
+                if fault == 'timeout':
+                    time.sleep(server.timeout_seconds)
+                if fault == 'error':
+                    self._send(500, b'Internal Server Error', 'text/plain')
+                    return
+
+                token = self.headers.get('X-Plex-Token') or parse_qs(parts.query).get('X-Plex-Token', [None])[0]
+                if server.require_token and not token:
+                    self._send(401, b'<html><head><title>Unauthorized</title></head></html>', 'text/html')
+                    return
+                if route is None:
+                    self._send(404, b'Not Found', 'text/plain')
+                    return
+                self._send(200, *route)
+
+            def _send(self, status: int, body: bytes, content_type: str) -> None:
+                try:
+                    self.send_response(status)
+                    self.send_header('Content-Type', content_type)
+                    self.send_header('Content-Length', str(len(body)))
+                    self.end_headers()
+                    self.wfile.write(body)
+                except (BrokenPipeError, ConnectionResetError):
+                    # El cliente abandonó la petición (p. ej. por timeout)
+                    pass
+
+            def log_message(self, *args):
+                pass
+
+        return Handler
+
+    def start(self) -> 'FakePlexServer':
+        """Sirve en un hilo en segundo plano"""
+        self._thread = threading.Thread(target=self._httpd.serve_forever, name='fake-plex', daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._httpd.shutdown()
+        self._httpd.server_close()
+
+    def app_env(self, discovery: bool = True) -> Dict[str, str]:
+        """
+        Variables de entorno para que app.py / asgi.py usen este servidor
+
+        Args:
+            discovery: True para resolver el servidor a través de /api/resources (como
+                sin PLEX_URL); False para fijar PLEX_URL y saltarse plex.tv
+        """
+        env = {'PLEX_TV_URL': self.url, 'PLEX_TOKEN': FIXTURE_TOKEN}
+        if not discovery:
+            env['PLEX_URL'] = self.url
+        return env
+
+    def stats(self) -> Dict[str, Dict[str, int]]:
+        """Peticiones recibidas por ruta y fallos inyectados"""
+        with self._lock:
+            return {'requests': dict(self.requests), 'faults': dict(self.faults)}
+
+
+def add_fault_arguments(parser: argparse.ArgumentParser) -> None:
+    """Opciones de latencia y fallos, compartidas con los scripts de carga"""
+    parser.add_argument('--latency', type=float, default=50, help='Latencia simulada de Plex en ms')
+    parser.add_argument('--jitter', type=float, default=0, help='Variación aleatoria adicional de la latencia en ms')
+    parser.add_argument('--error-rate', type=float, default=0, help='Fracción de respuestas 500 (0-1)')
+    parser.add_argument('--timeout-rate', type=float, default=0, help='Fracción de peticiones que no responden a tiempo (0-1)')
+    parser.add_argument('--timeout-seconds', type=float, default=30, help='Retraso de las peticiones que simulan un timeout')
+    parser.add_argument('--fault-path', action='append', default=[],
+                        help='Aplicar los fallos solo a rutas con este prefijo (repetible, p. ej. /status/sessions)')
+    parser.add_argument('--scenario', choices=SCENARIOS, default='playing',
+                        help="'playing' con sesión activa, 'idle' sin sesiones (se usa el historial)")
+
+
+def server_from_args(args, port: int = 0, host: str = '127.0.0.1') -> FakePlexServer:
+    return FakePlexServer(host=host, port=port, latency=args.latency / 1000, jitter=args.jitter / 1000,
+                          error_rate=args.error_rate, timeout_rate=args.timeout_rate,
+                          timeout_seconds=args.timeout_seconds, fault_paths=args.fault_path,
+                          scenario=args.scenario)
+
+
+def main():
+    """Función principal"""
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--host', default='127.0.0.1', help='Dirección de escucha')
+    parser.add_argument('--port', type=int, default=32400, help='Puerto de escucha')
+    add_fault_arguments(parser)
+    args = parser.parse_args()
+
+    server = server_from_args(args, port=args.port, host=args.host).start()
+    print(f"🎭 Plex simulado en {server.url} (escenario '{args.scenario}', {args.latency:.0f} ms de latencia)")
+    print("\n   Variables para la aplicación:")
+    for name, value in server.app_env().items():
+        print(f"   {name}={value}")
+    print(f"\n   Usuario de la sesión: {FIXTURE_USER}. Ctrl+C para terminar.")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        stats = server.stats()
+        print(f"\n📊 Peticiones: {stats['requests']}  Fallos: {stats['faults']}")
+        server.stop()
+
+
+if __name__ == '__main__':
+    main()
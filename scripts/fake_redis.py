@@ -0,0 +1,248 @@
+#!/usr/bin/env python3
+"""
+Servidor Redis simulado (protocolo RESP2) para probar el backend de cache sin Redis
+
+Implementa en memoria, en un hilo, los comandos que usa api/cache_backends.py:
+PING, AUTH, SELECT, GET, SET (EX/PX/NX/XX), DEL, EXISTS, PTTL, SCAN, DBSIZE,
+FLUSHDB y EVAL (solo el script de liberación de cerrojos, RELEASE_SCRIPT).
+Varios clientes (varios "nodos") pueden conectarse a la vez; con latency se
+simula la ida y vuelta de red.
+
+Uso independiente:
+    python scripts/fake_redis.py --port 6379
+    REDIS_URL=redis://127.0.0.1:6379 python app.py
+"""
+import os
+import sys
+import time
+import socket
+import fnmatch
+import argparse
+import threading
+import socketserver
+from collections import Counter
+from typing import Dict, Optional, Tuple
+
+# Añadir el directorio raíz al path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from api.cache_backends import RELEASE_SCRIPT
+
+
+class RespCommandError(Exception):
+    """Error que se devuelve al cliente como respuesta '-ERR ...'"""
+
+
+class FakeRedisServer:
+    """Redis en memoria con los comandos del backend de cache"""
+
+    def __init__(self, host: str = '127.0.0.1', port: int = 0, password: Optional[str] = None,
+                 latency: float = 0.0):
+        """
+        Args:
+            host: Dirección de escucha
+            port: Puerto (0 = uno libre)
+            password: Contraseña exigida con AUTH (None = sin contraseña)
+            latency: Retraso por comando en segundos
+        """
+        self.password = password
+        self.latency = latency
+        self.commands: Counter = Counter()
+        self._data: Dict[bytes, Tuple[bytes, Optional[float]]] = {}
+        self._lock = threading.Lock()
+        self._connections = set()
+        server = self
+
+        class Handler(socketserver.StreamRequestHandler):
+            def setup(self):
+                super().setup()
+                with server._lock:
+                    server._connections.add(self.connection)
+
+            def finish(self):
+                with server._lock:
+                    server._connections.discard(self.connection)
+                super().finish()
+
+            def handle(self):
+                authenticated = server.password is None
+                while True:
+                    try:
+                        args = server._read_command(self.rfile)
+                    except (ConnectionError, ValueError):
+                        return
+                    if args is None:
+                        return
+                    name = args[0].upper().decode('ascii', 'replace')
+                    if server.latency:
+                        time.sleep(server.latency)
+                    try:
+                        if name == 'AUTH':
+                            if args[-1].decode('utf-8') != server.password:
+                                raise RespCommandError('WRONGPASS invalid password')
+                            authenticated = True
+                            reply = 'OK'
+                        elif not authenticated:
+                            raise RespCommandError('NOAUTH Authentication required.')
+                        else:
+                            reply = server.execute(name, args[1:])
+                    except RespCommandError as e:
+                        reply = e
+                    try:
+                        self.wfile.write(server._encode(reply))
+                    except OSError:
+                        return
+
+        class Server(socketserver.ThreadingTCPServer):
+            daemon_threads = True
+            allow_reuse_address = True
+            # Como Redis: muchos clientes pueden conectar a la vez
+            request_queue_size = 128
+
+        self._server = Server((host, port), Handler)
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def url(self) -> str:
+        host, port = self._server.server_address[:2]
+        auth = f":{self.password}@" if self.password else ''
+        return f"redis://{auth}{host}:{port}/0"
+
+    def start(self) -> 'FakeRedisServer':
+        self._thread = threading.Thread(target=self._server.serve_forever, name='fake-redis', daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        """Deja de aceptar conexiones y cierra las abiertas (como un Redis que se cae)"""
+        self._server.shutdown()
+        self._server.server_close()
+        with self._lock:
+            connections = list(self._connections)
+        for connection in connections:
+            try:
+                connection.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+
+    @staticmethod
+    def _read_command(reader) -> Optional[list]:
+        line = reader.readline()
+        if not line:
+            return None
+        if not line.startswith(b'*'):
+            # Comando en línea (redis-cli, telnet)
+            return line.split()
+        args = []
+        for _ in range(int(line[1:])):
+            header = reader.readline()
+            length = int(header[1:])
+            args.append(reader.read(length + 2)[:-2])
+        return args
+
+    @classmethod
+    def _encode(cls, reply) -> bytes:
+        if reply is None:
+            return b'$-1\r\n'
+        if isinstance(reply, RespCommandError):
+            message = str(reply)
+            return f"-{message if message.split()[0].isupper() else 'ERR ' + message}\r\n".encode('utf-8')
+        if isinstance(reply, str):
+            return f"+{reply}\r\n".encode('utf-8')
+        if isinstance(reply, int):
+            return b':%d\r\n' % reply
+        if isinstance(reply, bytes):
+            return b'$%d\r\n%s\r\n' % (len(reply), reply)
+        return b'*%d\r\n' % len(reply) + b''.join(cls._encode(item) for item in reply)
+
+    def _live(self, key: bytes) -> Optional[bytes]:
+        """Valor de la clave si no ha caducado (requiere el lock)"""
+        entry = self._data.get(key)
+        if entry is None:
+            return None
+        value, expires = entry
+        if expires is not None and expires <= time.monotonic():
+            del self._data[key]
+            return None
+        return value
+
+    def execute(self, name: str, args: list):
+        """Ejecuta un comando y devuelve la respuesta a codificar"""
+        self.commands[name] += 1
+        with self._lock:
+            if name == 'PING':
+                return 'PONG'
+            if name == 'SELECT':
+                return 'OK'
+            if name == 'GET':
+                return self._live(args[0])
+            if name == 'SET':
+                return self._set(args)
+            if name == 'DEL':
+                return sum(1 for key in args if self._live(key) is not None and self._data.pop(key, None))
+            if name == 'EXISTS':
+                return sum(1 for key in args if self._live(key) is not None)
+            if name == 'PTTL':
+                if self._live(args[0]) is None:
+                    return -2
+                expires = self._data[args[0]][1]
+                return -1 if expires is None else int((expires - time.monotonic()) * 1000)
+            if name == 'SCAN':
+                pattern = b'*'
+                options = [arg.upper() for arg in args[1::2]]
+                if b'MATCH' in options:
+                    pattern = args[2 + 2 * options.index(b'MATCH')]
+                keys = [key for key in list(self._data) if self._live(key) is not None
+                        and fnmatch.fnmatchcase(key.decode('utf-8', 'replace'), pattern.decode('utf-8'))]
+                return [b'0', keys]
+            if name == 'DBSIZE':
+                return sum(1 for key in list(self._data) if self._live(key) is not None)
+            if name == 'FLUSHDB':
+                self._data.clear()
+                return 'OK'
+            if name == 'EVAL':
+                if args[0].decode('utf-8') != RELEASE_SCRIPT:
+                    raise RespCommandError('solo se admite el script de liberación de cerrojos')
+                key, token = args[2], args[3]
+                if self._live(key) == token:
+                    del self._data[key]
+                    return 1
+                return 0
+        raise RespCommandError(f"unknown command '{name}'")
+
+    def _set(self, args: list):
+        """SET clave valor [EX s | PX ms] [NX | XX] (requiere el lock)"""
+        key, value, options = args[0], args[1], [arg.upper() for arg in args[2:]]
+        expires = None
+        for unit, scale in ((b'EX', 1.0), (b'PX', 0.001)):
+            if unit in options:
+                expires = time.monotonic() + int(args[3 + options.index(unit)]) * scale
+        exists = self._live(key) is not None
+        if (b'NX' in options and exists) or (b'XX' in options and not exists):
+            return None
+        self._data[key] = (value, expires)
+        return 'OK'
+
+
+def main():
+    """Función principal"""
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--host', default='127.0.0.1', help='Dirección de escucha')
+    parser.add_argument('--port', type=int, default=6379, help='Puerto')
+    parser.add_argument('--password', help='Contraseña exigida con AUTH')
+    parser.add_argument('--latency', type=float, default=0, help='Latencia por comando en ms')
+    args = parser.parse_args()
+
+    server = FakeRedisServer(args.host, args.port, args.password, args.latency / 1000).start()
+    print(f"🧰 Redis simulado en {server.url}")
+    try:
+        while True:
+            time.sleep(5)
+    except KeyboardInterrupt:
+        print("\n👋 Deteniendo")
+    finally:
+        server.stop()
+
+
+if __name__ == '__main__':
+    main()
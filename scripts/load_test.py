@@ -0,0 +1,210 @@
+#!/usr/bin/env python3
+"""
+Prueba de carga de extremo a extremo de los endpoints de badge y estado
+
+Arranca el servidor Plex simulado (scripts/fake_plex.py, que también hace de
+plex.tv) y la aplicación en un subproceso apuntando a él, y mantiene N clientes
+concurrentes pidiendo los endpoints elegidos durante un tiempo fijo. Informa por
+endpoint de peticiones/s y latencias p50/p95/p99, además de las llamadas que
+recibió Plex. Con --url se ataca una aplicación ya arrancada (configurada aparte).
+
+Ejemplos:
+    python scripts/load_test.py --concurrency 32 --duration 20
+    python scripts/load_test.py --app asgi --cold --latency 100 --error-rate 0.05
+"""
+import os
+import sys
+import json
+import math
+import time
+import asyncio
+import argparse
+from collections import defaultdict
+
+import httpx
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(ROOT)
+
+from fake_plex import FIXTURE_USER, add_fault_arguments, server_from_args
+from load_test_asgi import free_port, start_app, wait_ready
+
+ENDPOINTS = {
+    'svg': '/api/now-playing-svg',
+    'png': '/api/now-playing-png',
+    'image': '/api/now-playing',
+    'json': '/api/now-playing.json',
+    'status': '/api/status',
+}
+
+# Endpoints cuyo render depende del ancho: con --cold cada petición pide uno distinto
+SIZED_ENDPOINTS = ('svg', 'png', 'image')
+
+
+def percentile(sorted_values: list, fraction: float) -> float:
+    """Percentil por rango más cercano de una lista ya ordenada"""
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, math.ceil(fraction * len(sorted_values)) - 1))
+    return sorted_values[index]
+
+
+def summarize(samples: list, elapsed: float) -> dict:
+    """Peticiones, errores, peticiones/s y percentiles (ms) de una lista de (latencia, estado)"""
+    latencies = sorted(latency * 1000 for latency, _ in samples)
+    statuses = defaultdict(int)
+    for _, status in samples:
+        statuses[status] += 1
+    errors = sum(count for status, count in statuses.items() if not isinstance(status, int) or status >= 400)
+    return {
+        'requests': len(samples),
+        'errors': errors,
+        'rps': len(samples) / elapsed if elapsed else 0.0,
+        'p50': percentile(latencies, 0.50),
+        'p95': percentile(latencies, 0.95),
+        'p99': percentile(latencies, 0.99),
+        'max': latencies[-1] if latencies else 0.0,
+        'statuses': {str(status): count for status, count in sorted(statuses.items(), key=lambda item: str(item[0]))},
+    }
+
+
+async def run_load(base_url: str, endpoints: list, concurrency: int, duration: float, cold: bool,
+                   timeout: float, user: str = None) -> tuple:
+    """
+    Bucle cerrado: cada cliente pide un endpoint tras otro (en rotación) hasta agotar el tiempo
+
+    Returns:
+        Tupla (muestras por endpoint, segundos medidos)
+    """
+    samples = defaultdict(list)
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=timeout) as http:
+        def params_for(name: str, sequence: int) -> dict:
+            params = {'user': user} if user else {}
+            if cold and name in SIZED_ENDPOINTS:
+                # Ancho distinto en cada petición: ni la cache de render ni single-flight lo absorben
+                params['width'] = 300 + sequence % 400
+            return params
+
+        # Calentamiento: conexión a Plex, fuentes y procesos de render fuera de la medición
+        for name in endpoints:
+            try:
+                await http.get(ENDPOINTS[name], params=params_for(name, 0))
+            except httpx.HTTPError:
+                pass
+
+        deadline = time.perf_counter() + duration
+        counter = {'next': 1}
+
+        async def client(index: int):
+            turn = index
+            while time.perf_counter() < deadline:
+                name = endpoints[turn % len(endpoints)]
+                turn += 1
+                sequence = counter['next']
+                counter['next'] += 1
+                start = time.perf_counter()
+                try:
+                    response = await http.get(ENDPOINTS[name], params=params_for(name, sequence))
+                    status = response.status_code
+                except httpx.TimeoutException:
+                    status = 'timeout'
+                except httpx.HTTPError:
+                    status = 'error'
+                samples[name].append((time.perf_counter() - start, status))
+
+        start = time.perf_counter()
+        await asyncio.gather(*(client(i) for i in range(concurrency)))
+        elapsed = time.perf_counter() - start
+    return samples, elapsed
+
+
+def main():
+    """Función principal"""
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--app', choices=('flask', 'asgi'), default='flask', help='Aplicación a arrancar')
+    parser.add_argument('--url', help='Atacar una aplicación ya arrancada en esta URL (no se arranca Plex simulado)')
+    parser.add_argument('--endpoints', default='svg,png,status',
+                        help=f"Endpoints separados por comas ({', '.join(ENDPOINTS)})")
+    parser.add_argument('--concurrency', type=int, default=16, help='Clientes concurrentes')
+    parser.add_argument('--duration', type=float, default=15, help='Segundos de carga medida')
+    parser.add_argument('--timeout', type=float, default=30, help='Plazo de cada petición en segundos')
+    parser.add_argument('--cold', action='store_true',
+                        help='Sin stale-while-revalidate y con un ancho distinto por petición (todo va a Plex y al render)')
+    parser.add_argument('--workers', type=int, help='RENDER_WORKERS de la aplicación')
+    parser.add_argument('--no-discovery', action='store_true',
+                        help='Fijar PLEX_URL en lugar de resolver el servidor a través de plex.tv simulado')
+    parser.add_argument('--json', metavar='FICHERO', help='Guardar los resultados en JSON')
+    add_fault_arguments(parser)
+    args = parser.parse_args()
+
+    endpoints = [name.strip() for name in args.endpoints.split(',') if name.strip()]
+    unknown = [name for name in endpoints if name not in ENDPOINTS]
+    if unknown:
+        parser.error(f"Endpoints desconocidos: {', '.join(unknown)}")
+
+    pms = process = None
+    if args.url:
+        base_url = args.url.rstrip('/')
+        target = base_url
+    else:
+        pms = server_from_args(args).start()
+        env = dict(os.environ, **pms.app_env(discovery=not args.no_discovery))
+        if args.cold:
+            env.update(SWR_FRESH_SECONDS='0', SWR_MAX_STALE_SECONDS='0')
+        if args.workers is not None:
+            env['RENDER_WORKERS'] = str(args.workers)
+        port = free_port()
+        process = start_app(args.app, port, env)
+        base_url = f"http://127.0.0.1:{port}"
+        target = f"{args.app} (Plex simulado con {args.latency:.0f} ms, errores {args.error_rate:.0%}, "\
+                 f"timeouts {args.timeout_rate:.0%}, escenario '{args.scenario}')"
+
+    print(f"🧪 Plex2Sign - Prueba de carga: {target}")
+    print(f"   {args.concurrency} clientes durante {args.duration:.0f} s{' (en frío)' if args.cold else ''}\n")
+
+    try:
+        asyncio.run(wait_ready(base_url + '/'))
+        samples, elapsed = asyncio.run(run_load(base_url, endpoints, args.concurrency, args.duration, args.cold,
+                                                args.timeout, user=None if args.url else FIXTURE_USER))
+    finally:
+        if process is not None:
+            process.terminate()
+            process.wait()
+
+    results = {name: summarize(samples[name], elapsed) for name in endpoints}
+    results['total'] = summarize([sample for name in endpoints for sample in samples[name]], elapsed)
+
+    print(f"{'endpoint':<10} {'peticiones':>10} {'errores':>8} {'pet/s':>8} {'p50 ms':>9} {'p95 ms':>9} "
+          f"{'p99 ms':>9} {'máx ms':>9}")
+    print("-" * 80)
+    for name, result in results.items():
+        print(f"{name:<10} {result['requests']:>10} {result['errors']:>8} {result['rps']:>8.1f} {result['p50']:>9.1f} "
+              f"{result['p95']:>9.1f} {result['p99']:>9.1f} {result['max']:>9.1f}")
+
+    for name in endpoints:
+        codes = results[name]['statuses']
+        if set(codes) != {'200'}:
+            print(f"   {name}: respuestas {codes}")
+
+    plex = None
+    if pms is not None:
+        plex = pms.stats()
+        pms.stop()
+        total = sum(plex['requests'].values())
+        per_request = total / results['total']['requests'] if results['total']['requests'] else 0.0
+        print(f"\n📡 Llamadas a Plex: {total} ({per_request:.2f} por petición, calentamiento incluido)")
+        for path, count in sorted(plex['requests'].items(), key=lambda item: -item[1]):
+            print(f"   {path:<32} {count:>8}")
+        if plex['faults']:
+            print(f"   Fallos inyectados: {plex['faults']}")
+
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump({'target': target, 'concurrency': args.concurrency, 'duration': elapsed, 'cold': args.cold,
+                       'endpoints': results, 'plex': plex}, f, indent=2)
+        print(f"\n💾 Resultados guardados en {args.json}")
+
+
+if __name__ == '__main__':
+    main()
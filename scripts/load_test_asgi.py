@@ -0,0 +1,125 @@
+#!/usr/bin/env python3
+"""
+Prueba de carga: aplicación Flask (app.py) frente al punto de entrada ASGI (asgi.py)
+
+Levanta el servidor Plex simulado de scripts/fake_plex.py con latencia
+configurable, arranca cada aplicación en un subproceso apuntando a él y lanza
+peticiones concurrentes con httpx. Stale-while-revalidate se desactiva y cada cliente pide un ancho distinto,
+así cada petición consulta a Plex y mide la E/S concurrente, no la cache.
+"""
+import os
+import sys
+import time
+import socket
+import asyncio
+import argparse
+import subprocess
+
+import httpx
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(ROOT)
+
+from fake_plex import FakePlexServer, FIXTURE_USER
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def start_app(kind: str, port: int, env: dict) -> subprocess.Popen:
+    """Arranca app.py (servidor multihilo de Werkzeug) o asgi.py (uvicorn) en un subproceso"""
+    if kind == 'flask':
+        command = [sys.executable, '-c',
+                   f"from app import app; app.run(host='127.0.0.1', port={port}, threaded=True)"]
+    else:
+        command = [sys.executable, '-m', 'uvicorn', 'asgi:app', '--host', '127.0.0.1',
+                   '--port', str(port), '--log-level', 'warning']
+    return subprocess.Popen(command, cwd=ROOT, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+
+async def wait_ready(url: str, timeout: float = 20) -> None:
+    deadline = time.time() + timeout
+    async with httpx.AsyncClient() as client:
+        while time.time() < deadline:
+            try:
+                await client.get(url, timeout=1)
+                return
+            except httpx.HTTPError:
+                await asyncio.sleep(0.2)
+    raise RuntimeError(f"La aplicación no respondió en {url}")
+
+
+async def run_load(base_url: str, endpoint: str, clients: int, requests_per_client: int) -> dict:
+    """Cada cliente hace sus peticiones en serie; los clientes van en paralelo"""
+    latencies, errors = [], 0
+    limits = httpx.Limits(max_connections=clients, max_keepalive_connections=clients)
+    async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=60) as http:
+        async def client(index: int):
+            nonlocal errors
+            params = {'user': FIXTURE_USER, 'width': 400 + index}
+            for _ in range(requests_per_client):
+                start = time.perf_counter()
+                try:
+                    response = await http.get(endpoint, params=params)
+                    if response.status_code != 200:
+                        errors += 1
+                except httpx.HTTPError:
+                    errors += 1
+                latencies.append(time.perf_counter() - start)
+
+        # Calentamiento: primer render de cada ancho fuera de la medición
+        await asyncio.gather(*(http.get(endpoint, params={'user': FIXTURE_USER, 'width': 400 + i})
+                               for i in range(clients)))
+        start = time.perf_counter()
+        await asyncio.gather(*(client(i) for i in range(clients)))
+        elapsed = time.perf_counter() - start
+
+    latencies.sort()
+    return {
+        'rps': len(latencies) / elapsed,
+        'p50': latencies[len(latencies) // 2] * 1000,
+        'p95': latencies[int(len(latencies) * 0.95)] * 1000,
+        'errors': errors,
+    }
+
+
+def main():
+    """Función principal"""
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--clients', type=int, default=32, help='Clientes concurrentes')
+    parser.add_argument('--requests', type=int, default=10, help='Peticiones por cliente')
+    parser.add_argument('--latency', type=float, default=50, help='Latencia simulada de Plex en ms')
+    parser.add_argument('--endpoint', default='/api/now-playing-svg', help='Endpoint a medir')
+    parser.add_argument('--workers', type=int, default=0, help='RENDER_WORKERS de las aplicaciones')
+    args = parser.parse_args()
+
+    pms = FakePlexServer(latency=args.latency / 1000).start()
+    env = dict(os.environ, **pms.app_env(discovery=False),
+               SWR_FRESH_SECONDS='0', SWR_MAX_STALE_SECONDS='0', RENDER_WORKERS=str(args.workers))
+
+    print(f"🧪 Plex2Sign - Flask vs ASGI ({args.clients} clientes x {args.requests} peticiones, "
+          f"Plex con {args.latency:.0f} ms de latencia)\n")
+    print(f"{'aplicación':<10} {'peticiones/s':>13} {'p50 ms':>9} {'p95 ms':>9} {'errores':>8}")
+    print("-" * 54)
+
+    for kind in ('flask', 'asgi'):
+        port = free_port()
+        process = start_app(kind, port, env)
+        try:
+            base_url = f"http://127.0.0.1:{port}"
+            asyncio.run(wait_ready(base_url + '/'))
+            result = asyncio.run(run_load(base_url, args.endpoint, args.clients, args.requests))
+            print(f"{kind:<10} {result['rps']:>13.1f} {result['p50']:>9.1f} {result['p95']:>9.1f} {result['errors']:>8}")
+        finally:
+            process.terminate()
+            process.wait()
+
+    pms.stop()
+    print("\n💡 Flask abre una conexión PlexAPI por petición; ASGI reutiliza el cliente y el pool de conexiones")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,259 @@
+#!/usr/bin/env python3
+"""
+Pruebas de los backends de cache (memoria, SQLite y Redis) y de su cerrojo distribuido
+
+Cada backend se prueba con el mismo conjunto de casos: ida y vuelta de valores,
+caducidad, espacios independientes, valores no serializables, cerrojos
+(exclusión, liberación solo por su dueño, caducidad) y get_or_compute con
+varios hilos a la vez (un solo cálculo). Para Redis se arranca el servidor
+simulado de scripts/fake_redis.py (o se usa --redis-url) y se comprueba además
+el cerrojo entre dos "nodos" con clientes separados y que un Redis caído se
+comporta como una cache vacía. Sale con código 1 si falla algún caso.
+
+Uso:
+    python scripts/test_cache_backends.py
+    python scripts/test_cache_backends.py --backends redis --redis-url redis://127.0.0.1:6379/15
+"""
+import os
+import sys
+import time
+import tempfile
+import argparse
+import threading
+
+# Añadir el directorio raíz al path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from api.cache_backends import MemoryBackend, RedisBackend, RespClient, get_or_compute
+from api.shared_cache import SharedCache
+from fake_redis import FakeRedisServer
+
+BACKENDS = ('memory', 'sqlite', 'redis')
+
+SESSION = {'type': 'track', 'state': 'playing', 'title': 'Plex2Sign', 'progress': 30, 'duration': 180,
+           'thumb': None, 'year': 2024, 'tags': ['a', 'b'], 'ratio': 0.5}
+
+
+class Results:
+    """Acumula y muestra el resultado de cada comprobación"""
+
+    def __init__(self):
+        self.failed = []
+
+    def check(self, name: str, condition: bool, detail: str = '') -> None:
+        if condition:
+            print(f"   ✅ {name}")
+        else:
+            print(f"   ❌ {name}{': ' + detail if detail else ''}")
+            self.failed.append(name)
+
+
+def _swallow(call) -> None:
+    try:
+        call()
+    except Exception:
+        pass
+
+
+def concurrent_compute(backend, namespace: str, key, threads: int = 8, delay: float = 0.2) -> tuple:
+    """Lanza get_or_compute desde varios hilos a la vez; devuelve (cálculos, valores)"""
+    calls = []
+    values = []
+    barrier = threading.Barrier(threads)
+
+    def compute():
+        calls.append(1)
+        time.sleep(delay)
+        return {'computed_at': time.time()}
+
+    def worker():
+        barrier.wait()
+        values.append(get_or_compute(namespace, key, compute, ttl=10, backend=backend))
+
+    workers = [threading.Thread(target=worker) for _ in range(threads)]
+    for thread in workers:
+        thread.start()
+    for thread in workers:
+        thread.join()
+    return len(calls), values
+
+
+def test_backend(name: str, backend, results: Results) -> None:
+    """Casos comunes a todos los backends"""
+    print(f"\n🧪 Backend {name}")
+    backend.clear()
+
+    backend.set('sessions', ('token', 'user'), SESSION, ttl=10)
+    entry = backend.get('sessions', ('token', 'user'))
+    results.check("ida y vuelta de una sesión", entry is not None and entry[1] == SESSION, repr(entry))
+    results.check("instante de cálculo", entry is not None and abs(entry[0] - time.time()) < 5)
+
+    body = os.urandom(4096)
+    backend.set('renders', 'png', body, ttl=10)
+    entry = backend.get('renders', 'png')
+    results.check("cuerpo binario", entry is not None and entry[1] == body)
+
+    backend.set('sessions', 'idle', None, ttl=10)
+    entry = backend.get('sessions', 'idle')
+    results.check("None se distingue de un fallo", entry is not None and entry[1] is None)
+
+    results.check("espacios independientes", backend.get('renders', ('token', 'user')) is None)
+
+    backend.set('sessions', 'short', 'x', ttl=0.2)
+    time.sleep(0.3)
+    results.check("caducidad", backend.get('sessions', 'short') is None)
+
+    backend.set('sessions', 'object', object(), ttl=10)
+    results.check("valor no serializable se ignora", backend.get('sessions', 'object') is None)
+
+    backend.delete('renders', 'png')
+    results.check("borrado", backend.get('renders', 'png') is None)
+
+    token = backend.acquire('user-1', ttl=5)
+    results.check("cerrojo libre se toma", token is not None)
+    results.check("cerrojo tomado se rechaza", backend.acquire('user-1', ttl=5) is None)
+    backend.release('user-1', 'otro-identificador')
+    results.check("solo su dueño lo libera", backend.acquire('user-1', ttl=5) is None)
+    backend.release('user-1', token)
+    second = backend.acquire('user-1', ttl=0.2)
+    results.check("liberado se vuelve a tomar", second is not None)
+    time.sleep(0.3)
+    results.check("cerrojo caducado se toma", backend.acquire('user-1', ttl=5) is not None)
+
+    calls, values = concurrent_compute(backend, 'sessions', 'concurrent')
+    results.check("un solo cálculo con 8 hilos", calls == 1, f"{calls} cálculos")
+    results.check("todos reciben el mismo valor", len({repr(value) for value in values}) == 1)
+
+    refreshed = get_or_compute('sessions', 'concurrent', lambda: 'nuevo', ttl=10, refresh=True, backend=backend)
+    results.check("refresh recalcula", refreshed == 'nuevo')
+    cached = get_or_compute('sessions', 'concurrent', lambda: 'otro', ttl=10, backend=backend)
+    results.check("se reutiliza el valor guardado", cached == 'nuevo')
+
+    try:
+        get_or_compute('sessions', 'failing', lambda: 1 / 0, ttl=10, backend=backend)
+        raised = False
+    except ZeroDivisionError:
+        raised = True
+    results.check("las excepciones de compute se propagan", raised)
+    lock = 'sessions:' + backend.digest('failing')
+    results.check("el cerrojo se libera tras un error", backend.acquire(lock) is not None)
+
+    def failing_owner():
+        time.sleep(0.2)
+        raise RuntimeError("Plex no disponible")
+
+    owner = threading.Thread(target=lambda: _swallow(lambda: get_or_compute(
+        'sessions', 'orphan', failing_owner, ttl=10, backend=backend)))
+    owner.start()
+    time.sleep(0.05)
+    start = time.perf_counter()
+    value = get_or_compute('sessions', 'orphan', lambda: 'relevo', ttl=10, backend=backend)
+    elapsed = time.perf_counter() - start
+    owner.join()
+    results.check("si el dueño falla, el que espera calcula", value == 'relevo' and elapsed < 1, f"{elapsed:.2f} s")
+
+    calls = []
+    for _ in range(2):
+        get_or_compute('sessions', 'uncached', lambda: calls.append(1), ttl=0, backend=backend)
+    results.check("ttl 0 no comparte", len(calls) == 2)
+
+    backend.clear()
+    results.check("clear vacía el backend", backend.get('sessions', ('token', 'user')) is None)
+    stats = backend.stats()
+    results.check("estadísticas", stats.get('hits', 0) > 0 and stats.get('errors') == 0, repr(stats))
+
+
+def test_redis_nodes(url: str, results: Results) -> None:
+    """Dos nodos con clientes separados comparten valores y cerrojo"""
+    print("\n🧪 Redis: dos nodos")
+    node_a = RedisBackend(url, prefix='plex2sign-test')
+    node_b = RedisBackend(url, prefix='plex2sign-test')
+    node_a.clear()
+
+    calls = []
+
+    def slow_query(node: str):
+        def compute():
+            calls.append(node)
+            time.sleep(0.3)
+            return {'node': node}
+        return compute
+
+    values = {}
+    threads = [threading.Thread(target=lambda node=node, backend=backend: values.__setitem__(
+        node, get_or_compute('sessions', ('token', 'user'), slow_query(node), ttl=10, backend=backend)))
+        for node, backend in (('a', node_a), ('b', node_b))]
+    for thread in threads:
+        thread.start()
+        time.sleep(0.05)
+    for thread in threads:
+        thread.join()
+    results.check("solo un nodo consulta Plex", calls == ['a'], repr(calls))
+    results.check("el otro nodo recibe su resultado", values.get('b') == {'node': 'a'}, repr(values))
+    results.check("el nodo en espera lo contabiliza", node_b.stats()['lock_waits'] == 1)
+    node_a.clear()
+
+
+def test_redis_down(results: Results) -> None:
+    """Un Redis caído se comporta como una cache vacía y no retiene las peticiones"""
+    print("\n🧪 Redis caído")
+    server = FakeRedisServer().start()
+    backend = RedisBackend(server.url, client=RespClient(server.url, timeout=0.2, retry_seconds=60))
+    backend.set('sessions', 'key', 'value', ttl=10)
+    server.stop()
+
+    start = time.perf_counter()
+    entry = backend.get('sessions', 'key')
+    value = get_or_compute('sessions', 'key', lambda: 'calculado', ttl=10, backend=backend)
+    elapsed = time.perf_counter() - start
+    results.check("lectura fallida = fallo de cache", entry is None)
+    results.check("get_or_compute calcula igualmente", value == 'calculado')
+    results.check("sin esperar al cerrojo", elapsed < 1, f"{elapsed:.2f} s")
+    results.check("errores contabilizados", backend.stats()['errors'] > 0)
+
+    server = FakeRedisServer(password='secreto').start()
+    backend = RedisBackend(server.url)
+    backend.set('sessions', 'key', 'value', ttl=10)
+    entry = backend.get('sessions', 'key')
+    results.check("AUTH con contraseña de la URL", entry is not None and entry[1] == 'value')
+    server.stop()
+
+
+def main():
+    """Función principal"""
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--backends', default=','.join(BACKENDS), help='Backends a probar, separados por comas')
+    parser.add_argument('--redis-url', help='Redis real a usar en lugar del simulado (se borran sus claves de prueba)')
+    args = parser.parse_args()
+    selected = [name.strip() for name in args.backends.split(',') if name.strip()]
+
+    print("🗄️  Plex2Sign - Pruebas de los backends de cache")
+    results = Results()
+    server = None
+    with tempfile.TemporaryDirectory() as directory:
+        for name in selected:
+            if name == 'memory':
+                test_backend(name, MemoryBackend(), results)
+            elif name == 'sqlite':
+                test_backend(name, SharedCache(os.path.join(directory, 'shared.db')), results)
+            elif name == 'redis':
+                url = args.redis_url
+                if not url:
+                    server = FakeRedisServer().start()
+                    url = server.url
+                test_backend(name, RedisBackend(url, prefix='plex2sign-test'), results)
+                test_redis_nodes(url, results)
+                if server is not None:
+                    server.stop()
+                    test_redis_down(results)
+            else:
+                parser.error(f"Backend desconocido: {name}")
+
+    if results.failed:
+        print(f"\n❌ {len(results.failed)} comprobaciones fallidas")
+        sys.exit(1)
+    print("\n🎉 Todas las comprobaciones pasaron")
+
+
+if __name__ == '__main__':
+    main()